@@ -0,0 +1 @@
+"""Benchmarks for drawbridge_backend."""
@@ -0,0 +1,404 @@
+"""
+End-to-end load on the API, in process.
+
+Runs the app from get_app (middleware, dependency injection, validation and
+response encoding included) with its lifespan and drives it through the httpx
+ASGI transport with --clients concurrent clients for --duration seconds.
+Clients are spread round-robin over the --scenario list:
+
+    grid_scroll    pages through a table with fetchRows
+    bulk_edit      fetches a random page and updates --edit-batch of its rows
+    table_listing  lists tables and opens one of them
+
+Every request is timed as a whole and split into stages:
+
+    db         time spent executing SQL
+    endpoint   the endpoint function, minus db
+    framework  routing, middleware, dependencies (waiting for a pooled
+               connection included), validation and encoding
+    client     httpx and the ASGI transport
+
+Output has throughput, latency percentiles and a latency histogram per
+request kind, plus the mean of every stage. Edit conflicts between clients
+are counted as errors. With --baseline, p50 of every
+request kind is compared to a previous output and the exit code is 1 if any
+got slower than --tolerance allows.
+
+    python -m benchmarks.api_load --clients 50 > api_load.json
+"""
+
+import argparse
+import asyncio
+import bisect
+import contextvars
+import dataclasses
+import itertools
+import json
+import random
+import sys
+import time
+from typing import Any, Awaitable, Callable
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from benchmarks.utils import Timings, find_regressions, git_commit, throwaway_databases
+from drawbridge_backend.log import configure_logging
+from drawbridge_backend.web.application import get_app
+
+# DATETIME is left out, its values can't be sent as JSON yet.
+FIELD_TYPES = ("int", "string", "float", "bool", "choice")
+LOAD_CHUNK_SIZE = 1000
+# Upper bounds in ms, the last bucket counts everything slower.
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+# Requests from a browser carry it, so the CORS middleware does its work.
+ORIGIN = "http://localhost:5173"
+STAGES = ("db", "endpoint", "framework", "client")
+
+
+@dataclasses.dataclass
+class RequestStages:
+    """Seconds spent by one request in the app, its endpoint and the database."""
+
+    app: float = 0
+    endpoint: float = 0
+    db: float = 0
+
+
+# Set by the client around each request. The ASGI transport runs the app in
+# the client's task, so the app and SQLAlchemy events see the same object.
+_current_stages: contextvars.ContextVar[RequestStages | None] = contextvars.ContextVar(
+    "current_stages",
+    default=None,
+)
+
+
+class StageTimer:
+    """ASGI wrapper adding the time spent in the app to the current request."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stages = _current_stages.get()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if stages is not None:
+                stages.app += time.perf_counter() - start
+
+
+def _time_endpoints(app: Any) -> None:
+    """Add time spent in endpoint functions to the current request."""
+
+    def timed(call: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            stages = _current_stages.get()
+            start = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                if stages is not None:
+                    stages.endpoint += time.perf_counter() - start
+
+        return wrapper
+
+    for route in app.routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is not None and asyncio.iscoroutinefunction(dependant.call):
+            dependant.call = timed(dependant.call)
+
+
+def _before_cursor_execute(conn: Any, *args: Any) -> None:
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn: Any, *args: Any) -> None:
+    start = conn.info["query_start"].pop()
+    stages = _current_stages.get()
+    if stages is not None:
+        stages.db += time.perf_counter() - start
+
+
+@dataclasses.dataclass
+class RequestStats:
+    """Timings of one kind of request across all clients."""
+
+    timings: Timings
+    errors: int = 0
+    stage_totals: dict[str, float] = dataclasses.field(
+        default_factory=lambda: dict.fromkeys(STAGES, 0.0),
+    )
+    histogram: list[int] = dataclasses.field(
+        default_factory=lambda: [0] * (len(HISTOGRAM_BOUNDS_MS) + 1),
+    )
+
+    def add(self, total: float, stages: RequestStages, ok: bool) -> None:
+        self.timings.durations.append(total)
+        self.errors += not ok
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, total * 1000)] += 1
+        self.stage_totals["db"] += stages.db
+        self.stage_totals["endpoint"] += stages.endpoint - stages.db
+        self.stage_totals["framework"] += stages.app - stages.endpoint
+        self.stage_totals["client"] += total - stages.app
+
+    def summary(self, duration: float) -> dict[str, Any]:
+        runs = len(self.timings.durations)
+        labels = [f"<={b}ms" for b in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"]
+        return {
+            **self.timings.summary(),
+            "requests_per_s": runs / duration,
+            "errors": self.errors,
+            "stages_mean_ms": {
+                stage: total / runs * 1000 for stage, total in self.stage_totals.items()
+            },
+            "histogram": dict(zip(labels, self.histogram)),
+        }
+
+
+class LoadClient:
+    """Sends requests and records their timings by request kind."""
+
+    def __init__(self, client: httpx.AsyncClient, stats: dict[str, RequestStats]) -> None:
+        self.client = client
+        self.stats = stats
+
+    async def request(self, name: str, method: str, url: str, **kwargs: Any) -> Any:
+        stages = RequestStages()
+        token = _current_stages.set(stages)
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        finally:
+            _current_stages.reset(token)
+        total = time.perf_counter() - start
+        body = response.json()
+        # insertRows and updateRows report failures in the body.
+        ok = response.is_success and not (isinstance(body, dict) and body.get("success") is False)
+
+        stats = self.stats.setdefault(name, RequestStats(Timings(name=name)))
+        stats.add(total, stages, ok)
+        return body
+
+
+def _random_value(rng: random.Random, field: dict[str, Any]) -> Any:
+    match field["data_type"]:
+        case "int":
+            return rng.randrange(1_000_000)
+        case "float":
+            return rng.random()
+        case "string":
+            return " ".join(f"w{rng.randrange(5000)}" for _ in range(3))
+        case "bool":
+            return rng.random() < 0.5
+        case "choice":
+            return rng.choice(field["choices"])["choice_id"]
+    raise ValueError(f"Unknown data type {field['data_type']}")
+
+
+def _random_values(rng: random.Random, table: dict[str, Any]) -> list[dict[str, Any]]:
+    return [
+        {"field_id": f["field_id"], "value": {"value": _random_value(rng, f)}}
+        for f in table["fields"]
+    ]
+
+
+async def _create_table(
+    client: httpx.AsyncClient,
+    rng: random.Random,
+    name: str,
+    width: int,
+    rows: int,
+) -> dict[str, Any]:
+    fields = [
+        {
+            "name": f"f{i}",
+            "verbose_name": f"Field {i}",
+            "data_type": data_type,
+            "is_nullable": True,
+            "choices": [{"value": f"choice {c}"} for c in range(10)]
+            if data_type == "choice"
+            else [],
+        }
+        for i, data_type in zip(range(width), itertools.cycle(FIELD_TYPES))
+    ]
+    response = await client.post("/api/tables", json={"name": name, "fields": fields})
+    response.raise_for_status()
+    table = response.json()
+    for start in range(0, rows, LOAD_CHUNK_SIZE):
+        chunk = min(LOAD_CHUNK_SIZE, rows - start)
+        response = await client.post(
+            "/api/tables/insertRows",
+            json={
+                "table_id": table["table_id"],
+                "rows": [{"values": _random_values(rng, table)} for _ in range(chunk)],
+            },
+        )
+        response.raise_for_status()
+        if not response.json()["success"]:
+            raise RuntimeError(f"Loading rows failed: {response.json()['errors']}")
+    return table
+
+
+async def grid_scroll(
+    client: LoadClient,
+    rng: random.Random,
+    tables: list[dict[str, Any]],
+    args: argparse.Namespace,
+) -> None:
+    table = rng.choice(tables)
+    for offset in range(0, args.rows, args.page_size):
+        await client.request(
+            "grid_scroll.fetchRows",
+            "POST",
+            "/api/tables/fetchRows",
+            json={"table_id": table["table_id"], "limit": args.page_size, "offset": offset},
+        )
+
+
+async def bulk_edit(
+    client: LoadClient,
+    rng: random.Random,
+    tables: list[dict[str, Any]],
+    args: argparse.Namespace,
+) -> None:
+    table = rng.choice(tables)
+    page = await client.request(
+        "bulk_edit.fetchRows",
+        "POST",
+        "/api/tables/fetchRows",
+        json={
+            "table_id": table["table_id"],
+            "limit": args.page_size,
+            "offset": rng.randrange(max(args.rows - args.page_size, 1)),
+        },
+    )
+    rows = rng.sample(page["rows"], min(args.edit_batch, len(page["rows"])))
+    await client.request(
+        "bulk_edit.updateRows",
+        "POST",
+        "/api/tables/updateRows",
+        json={
+            "table_id": table["table_id"],
+            "updated_rows": [
+                {
+                    "row_id": row["row_id"],
+                    "new_values": _random_values(rng, table),
+                    "expected_version": row["version"],
+                }
+                for row in rows
+            ],
+        },
+    )
+
+
+async def table_listing(
+    client: LoadClient,
+    rng: random.Random,
+    tables: list[dict[str, Any]],
+    args: argparse.Namespace,
+) -> None:
+    listed = await client.request("table_listing.list", "GET", "/api/tables")
+    table = rng.choice(listed)
+    await client.request("table_listing.retrieve", "GET", f"/api/tables/{table['table_id']}")
+
+
+SCENARIOS = {s.__name__: s for s in (grid_scroll, bulk_edit, table_listing)}
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    rng = random.Random(args.seed)
+    stats: dict[str, RequestStats] = {}
+    app = get_app()
+    # Results go to stdout.
+    configure_logging(sys.stderr)
+    _time_endpoints(app)
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    async with throwaway_databases(), app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=StageTimer(app))  # type: ignore[arg-type]
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://bench",
+            headers={"Origin": ORIGIN},
+            timeout=None,
+        ) as client:
+            tables = [
+                await _create_table(client, rng, f"load_{i}", args.width, args.rows)
+                for i in range(args.tables)
+            ]
+            deadline = time.perf_counter() + args.duration
+
+            async def run_client(number: int) -> None:
+                load_client = LoadClient(client, stats)
+                scenario = SCENARIOS[args.scenario[number % len(args.scenario)]]
+                client_rng = random.Random(args.seed + number)
+                while time.perf_counter() < deadline:
+                    await scenario(load_client, client_rng, tables, args)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(run_client(i) for i in range(args.clients)))
+            duration = time.perf_counter() - started
+
+    event.remove(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.remove(Engine, "after_cursor_execute", _after_cursor_execute)
+    requests = sum(len(s.timings.durations) for s in stats.values())
+    return {
+        "meta": {
+            **git_commit(),
+            **{k: v for k, v in vars(args).items() if k not in {"baseline", "tolerance"}},
+        },
+        "duration_s": duration,
+        "requests": requests,
+        "requests_per_s": requests / duration,
+        "timings": [s.summary(duration) for s in stats.values()],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="can be repeated, all scenarios by default",
+    )
+    parser.add_argument("--tables", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--width", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--edit-batch", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=argparse.FileType())
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    args.scenario = args.scenario or list(SCENARIOS)
+
+    results = asyncio.run(run(args))
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    if args.baseline:
+        with args.baseline as baseline_file:
+            regressions = find_regressions(
+                results["timings"],
+                json.load(baseline_file),
+                args.tolerance,
+            )
+        for regression in regressions:
+            sys.stderr.write(f"regression: {regression}\n")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Full-text search over a large table.
+
+Loads a table with two STRING fields of random words and compares
+fetchRows/count with `search` (tsvector + GIN) against an ILIKE scan.
+
+    python -m benchmarks.full_text_search --rows 1000000
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from benchmarks.utils import measure, throwaway_service
+from sqlalchemy import text
+
+from drawbridge_backend.domain.enums import DataTypeEnum
+from drawbridge_backend.domain.impl.tables import SqlAlchemyTablesService
+from drawbridge_backend.domain.tables.entities import Table, UnSavedField, UnSavedTable
+
+VOCABULARY_SIZE = 5000
+LOAD_CHUNK_SIZE = 100_000
+
+
+async def _load_rows(service: SqlAlchemyTablesService, table: Table, rows: int) -> None:
+    session = service._storage_db_session  # noqa: SLF001
+    # Correlated subqueries (g > 0) make postgres generate text per row.
+    stmt = text(
+        f"""
+        INSERT INTO "{table.name}" (title, body)
+        SELECT
+            (SELECT string_agg('w' || floor(random() * :words)::int, ' ')
+             FROM generate_series(1, 3) WHERE g > 0),
+            (SELECT string_agg('w' || floor(random() * :words)::int, ' ')
+             FROM generate_series(1, 20) WHERE g > 0)
+        FROM generate_series(1, :rows) AS g
+        """,  # noqa: S608
+    )
+    for start in range(0, rows, LOAD_CHUNK_SIZE):
+        chunk = min(LOAD_CHUNK_SIZE, rows - start)
+        await session.execute(stmt, {"words": VOCABULARY_SIZE, "rows": chunk})
+        await session.commit()
+    await session.execute(text(f'ANALYZE "{table.name}"'))
+    await session.commit()
+
+
+async def run(rows: int, repeat: int) -> list[dict[str, object]]:
+    async with throwaway_service() as service:
+        table = await service.create_table(
+            UnSavedTable(
+                name="fts_benchmark",
+                fields=[
+                    UnSavedField("title", "Title", DataTypeEnum.STRING, True),
+                    UnSavedField("body", "Body", DataTypeEnum.STRING, True),
+                ],
+            ),
+        )
+        start = time.perf_counter()
+        await _load_rows(service, table, rows)
+        results: list[dict[str, object]] = [
+            {"name": "load", "rows": rows, "seconds": time.perf_counter() - start},
+        ]
+
+        session = service._storage_db_session  # noqa: SLF001
+        ilike_stmt = text(
+            f"""
+            SELECT count(*) FROM "{table.name}"
+            WHERE concat_ws(' ', title, body) ILIKE :pattern
+            """,  # noqa: S608
+        )
+        for query in ("w17", "w17 w42", '"w1 w2" OR w3'):
+            cases = {
+                "search_fetch": lambda q=query: service.fetch_rows(table, search=q),
+                "search_count": lambda q=query: service.count_rows(table, search=q),
+            }
+            for name, func in cases.items():
+                timings = await measure(f"{name}[{query}]", func, repeat)
+                results.append(timings.summary())
+
+        timings = await measure(
+            "ilike_scan_count[w17]",
+            lambda: session.execute(ilike_stmt, {"pattern": "%w17 %"}),
+            repeat,
+        )
+        results.append(timings.summary())
+        return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.rows, args.repeat))
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Time logging adds to a request on the event loop.
+
+Every simulated request logs what a real one typically does: a uvicorn
+access log and an application INFO record, both through the stdlib
+logging interception, with a request id set. Records go to a temporary
+file. Only time spent by the logging thread is measured, that is what
+requests wait for; the queue writer formats and writes on its own thread.
+A file never blocks, so this understates what the queue saves when stdout
+is a pipe whose reader falls behind.
+
+Cases: "legacy" is the interception as it was before the log pipeline
+(stack walk and loguru formatting per record), then every combination of
+text/JSON and synchronous/queued output, and queued JSON with --sample of
+successful access logs kept. With --baseline, p50 of every case is
+compared to a previous output and the exit code is 1 if any got slower
+than --tolerance allows.
+
+    python -m benchmarks.log_overhead > log_overhead.json
+    python -m benchmarks.log_overhead --baseline log_overhead.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import tempfile
+from typing import Any, Callable, TextIO
+
+from benchmarks.utils import find_regressions, git_commit, measure
+from loguru import logger
+
+from drawbridge_backend.log import shutdown_logging, configure_logging, request_id
+from drawbridge_backend.settings import LogFormat, settings
+
+ACCESS_LOG_FORMAT = '%s - "%s %s HTTP/%s" %d'
+app_logger = logging.getLogger("drawbridge_backend.web.api.tables.views")
+access_logger = logging.getLogger("uvicorn.access")
+
+
+class LegacyInterceptHandler(logging.Handler):
+    """Interception as it was, finding the caller by walking the stack."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            level: str | int = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+
+        frame, depth = logging.currentframe(), 2
+        while frame.f_code.co_filename == logging.__file__:
+            frame = frame.f_back  # type: ignore[assignment]
+            depth += 1
+
+        logger.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+
+
+def configure_legacy(stream: TextIO) -> None:
+    handler = LegacyInterceptHandler()
+    logging.root.handlers = [handler]
+    access_logger.handlers = [handler]
+    access_logger.filters = []
+    logger.remove()
+    logger.add(stream, level="INFO")
+
+
+def configure(
+    log_format: LogFormat,
+    queue_size: int,
+    sample_rate: float,
+) -> Callable[[TextIO], None]:
+    def apply(stream: TextIO) -> None:
+        settings.log_format = log_format
+        settings.log_queue_size = queue_size
+        settings.access_log_sample_rate = sample_rate
+        configure_logging(stream)
+        # Drop the legacy handler left on the root logger.
+        logging.root.handlers = access_logger.handlers
+
+    return apply
+
+
+def log_requests(requests: int) -> None:
+    for i in range(requests):
+        token = request_id.set(f"{i:032x}")
+        try:
+            app_logger.info("Fetched %d rows of table %d", 100, 1)
+            access_logger.info(
+                ACCESS_LOG_FORMAT,
+                "127.0.0.1:50000",
+                "POST",
+                "/api/tables/fetchRows",
+                "1.1",
+                200,
+            )
+        finally:
+            request_id.reset(token)
+
+
+async def run(requests: int, repeat: int, queue_size: int, sample: float) -> dict[str, Any]:
+    # As uvicorn configures it.
+    access_logger.propagate = False
+    logging.root.setLevel(logging.INFO)
+    cases: dict[str, Callable[[TextIO], None]] = {
+        "legacy": configure_legacy,
+        "text": configure(LogFormat.TEXT, 0, 1.0),
+        "json": configure(LogFormat.JSON, 0, 1.0),
+        "text_queued": configure(LogFormat.TEXT, queue_size, 1.0),
+        "json_queued": configure(LogFormat.JSON, queue_size, 1.0),
+        f"json_queued_sampled[{sample:g}]": configure(LogFormat.JSON, queue_size, sample),
+    }
+    results = []
+    for name, apply in cases.items():
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as stream:
+            apply(stream)
+
+            async def run_requests() -> None:
+                log_requests(requests)
+
+            timings = await measure(name, run_requests, repeat, rows=requests)
+            # Write out the backlog of the queue writer before counting lines.
+            logger.remove()
+            shutdown_logging()
+            stream.seek(0)
+            lines = sum(1 for _ in stream)
+        summary = timings.summary()
+        summary["us_per_request"] = summary["mean_ms"] * 1000 / requests
+        summary["lines_per_request"] = lines / (requests * (repeat + 1))
+        results.append(summary)
+
+    return {
+        "meta": {
+            **git_commit(),
+            "python": platform.python_version(),
+            "requests": requests,
+            "repeat": repeat,
+            "queue_size": queue_size,
+            "sample": sample,
+        },
+        "timings": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--queue-size", type=int, default=100_000)
+    parser.add_argument("--sample", type=float, default=0.1)
+    parser.add_argument("--baseline", type=argparse.FileType())
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.requests, args.repeat, args.queue_size, args.sample))
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    if args.baseline:
+        with args.baseline as baseline_file:
+            regressions = find_regressions(
+                results["timings"],
+                json.load(baseline_file),
+                args.tolerance,
+            )
+        for regression in regressions:
+            sys.stderr.write(f"regression: {regression}\n")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
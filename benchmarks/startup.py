@@ -0,0 +1,146 @@
+"""
+Worker cold start: import time, app construction, lifespan and first requests.
+
+Every run is a fresh interpreter, the way uvicorn starts a worker. With
+--baseline, p50 of every metric is compared to a previous output of this
+benchmark and the exit code is 1 if any got slower than --tolerance allows.
+
+    python -m benchmarks.startup > startup.json
+    python -m benchmarks.startup --baseline startup.json
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+from typing import Any
+
+from benchmarks.utils import Timings, find_regressions, throwaway_databases
+
+REQUEST_PATHS = ("/api/health", "/api/openapi.json")
+
+# Runs in a fresh interpreter and prints durations in seconds as JSON.
+CHILD = """
+import time
+start = time.perf_counter()
+from drawbridge_backend.web.application import get_app
+imported = time.perf_counter()
+app = get_app()
+built = time.perf_counter()
+
+import asyncio, contextlib, json, sys
+import httpx
+from drawbridge_backend.log import configure_logging
+# Durations go to stdout.
+configure_logging(sys.stderr)
+
+async def serve():
+    result = {"import": imported - start, "get_app": built - imported}
+    lifespan = (
+        app.router.lifespan_context(app)
+        if sys.argv[1] == "1"
+        else contextlib.nullcontext()
+    )
+    started = time.perf_counter()
+    async with lifespan:
+        result["lifespan"] = time.perf_counter() - started
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+            for path in sys.argv[2:]:
+                for attempt in ("first", "second"):
+                    sent = time.perf_counter()
+                    (await c.get(path)).raise_for_status()
+                    result[f"{attempt}_request[{path}]"] = time.perf_counter() - sent
+    return result
+
+print(json.dumps(asyncio.run(serve())))
+"""
+
+
+def run_child(lifespan: bool) -> dict[str, float]:
+    output = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", CHILD, "1" if lifespan else "0", *REQUEST_PATHS],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(output.stdout)
+
+
+def slowest_imports(top: int) -> list[dict[str, Any]]:
+    """
+    Modules with the largest own import time, from `python -X importtime`.
+    """
+    output = subprocess.run(  # noqa: S603
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import drawbridge_backend.web.application",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    imports = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        imports.append(
+            {
+                "module": module.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            },
+        )
+    return sorted(imports, key=lambda i: i["self_ms"], reverse=True)[:top]
+
+
+async def run(repeat: int, lifespan: bool, top: int) -> dict[str, Any]:
+    timings: dict[str, Timings] = {}
+    async with throwaway_databases():
+        for _ in range(repeat):
+            for name, seconds in run_child(lifespan).items():
+                timings.setdefault(name, Timings(name=name)).durations.append(seconds)
+    return {
+        "timings": [t.summary() for t in timings.values()],
+        "slowest_imports": slowest_imports(top),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--no-lifespan",
+        dest="lifespan",
+        action="store_false",
+        help="skip startup of database connections and background tasks",
+    )
+    parser.add_argument("--top-imports", type=int, default=20)
+    parser.add_argument("--baseline", help="output of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.repeat, args.lifespan, args.top_imports))
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(
+                results["timings"],
+                json.load(baseline_file),
+                args.tolerance,
+            )
+        for regression in regressions:
+            sys.stderr.write(f"regression: {regression}\n")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
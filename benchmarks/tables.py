@@ -0,0 +1,262 @@
+"""
+Throughput of SqlAlchemyTablesService operations.
+
+Loads a table of --width fields (types cycle through all data types) and
+--rows random rows, then times create_table, fetch_rows (offset, filtered,
+ordered), count_rows and batches of --batch inserts, updates and deletes.
+Data is generated from --seed, so runs of different commits see the same
+tables. Output carries the commit it was produced on; with --baseline, p50
+of every operation is compared to a previous output and the exit code is 1
+if any got slower than --tolerance allows.
+
+    python -m benchmarks.tables > tables.json
+    python -m benchmarks.tables --baseline tables.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import platform
+import random
+import sys
+from typing import Any
+
+from benchmarks.utils import find_regressions, git_commit, measure, throwaway_service
+from sqlalchemy import text
+
+from drawbridge_backend.domain.enums import DataTypeEnum, OperatorEnum
+from drawbridge_backend.domain.impl.tables import SqlAlchemyTablesService
+from drawbridge_backend.domain.tables.entities import (
+    BaseValue,
+    BoolValue,
+    ChoiceValue,
+    DateTimeValue,
+    FilteringParam,
+    FloatValue,
+    InsertRow,
+    IntValue,
+    OrderingParam,
+    RowData,
+    StringValue,
+    Table,
+    UnSavedChoice,
+    UnSavedField,
+    UnSavedTable,
+    UpdateRow,
+)
+
+# INT goes first, fetch_filtered filters on it.
+FIELD_TYPES = (
+    DataTypeEnum.INT,
+    DataTypeEnum.STRING,
+    DataTypeEnum.FLOAT,
+    DataTypeEnum.BOOL,
+    DataTypeEnum.DATETIME,
+    DataTypeEnum.CHOICE,
+)
+INT_RANGE = 1_000_000
+CHOICES_COUNT = 10
+LOAD_CHUNK_SIZE = 1000
+PAGE_SIZE = 100
+
+
+def _table_definition(name: str, width: int) -> UnSavedTable:
+    fields = []
+    for i, data_type in zip(range(width), itertools.cycle(FIELD_TYPES)):
+        choices = (
+            [UnSavedChoice(f"choice {c}") for c in range(CHOICES_COUNT)]
+            if data_type == DataTypeEnum.CHOICE
+            else []
+        )
+        fields.append(
+            UnSavedField(f"f{i}", f"Field {i}", data_type, True, choices=choices),
+        )
+    return UnSavedTable(name=name, fields=fields)
+
+
+def _random_value(rng: random.Random, field_type: DataTypeEnum, choices: list[int]) -> BaseValue:
+    match field_type:
+        case DataTypeEnum.INT:
+            return IntValue(rng.randrange(INT_RANGE))
+        case DataTypeEnum.FLOAT:
+            return FloatValue(rng.random())
+        case DataTypeEnum.STRING:
+            return StringValue(" ".join(f"w{rng.randrange(5000)}" for _ in range(3)))
+        case DataTypeEnum.BOOL:
+            return BoolValue(rng.random() < 0.5)
+        case DataTypeEnum.DATETIME:
+            return DateTimeValue(
+                datetime.datetime(2020, 1, 1) + datetime.timedelta(seconds=rng.randrange(10**8)),
+            )
+        case DataTypeEnum.CHOICE:
+            return ChoiceValue(rng.choice(choices))
+    raise ValueError(f"Unknown data type {field_type}")
+
+
+def _random_values(rng: random.Random, table: Table) -> list[RowData[BaseValue]]:
+    return [
+        RowData(
+            f.field_id,
+            _random_value(rng, f.data_type, [c.choice_id for c in f.choices]),
+        )
+        for f in table.fields
+    ]
+
+
+async def _load_rows(
+    service: SqlAlchemyTablesService,
+    table: Table,
+    rng: random.Random,
+    rows: int,
+) -> list[int]:
+    row_ids = []
+    for start in range(0, rows, LOAD_CHUNK_SIZE):
+        chunk = min(LOAD_CHUNK_SIZE, rows - start)
+        inserted = await service.insert_rows(
+            [InsertRow(table, _random_values(rng, table)) for _ in range(chunk)],
+        )
+        row_ids.extend(r.row_id for r in inserted)
+    session = service._storage_db_session  # noqa: SLF001
+    await session.execute(text(f'ANALYZE "{table.name}"'))
+    await session.commit()
+    return row_ids
+
+
+async def run(rows: int, width: int, repeat: int, batch: int, seed: int) -> dict[str, Any]:
+    rng = random.Random(seed)
+    results = []
+    async with throwaway_service() as service:
+        created = itertools.count()
+        timings = await measure(
+            f"create_table[width={width}]",
+            lambda: service.create_table(
+                _table_definition(f"bench_create_{next(created)}", width),
+            ),
+            repeat,
+        )
+        results.append(timings.summary())
+
+        table = await service.create_table(_table_definition("bench_rows", width))
+        load = await measure(
+            f"load[{LOAD_CHUNK_SIZE}]",
+            lambda: _load_rows(service, table, rng, rows),
+            repeat=1,
+            rows=rows,
+            warmup=0,
+        )
+        results.append(load.summary())
+        storage_session = service._storage_db_session  # noqa: SLF001
+        server_version = (await storage_session.execute(text("SHOW server_version"))).scalar()
+        row_ids = (
+            await storage_session.execute(
+                text(f'SELECT id FROM "{table.name}" ORDER BY id'),  # noqa: S608
+            )
+        ).scalars().all()
+
+        int_field, string_field = table.fields[0], table.fields[min(1, width - 1)]
+        # About 1% of rows match.
+        selective_filter = FilteringParam(
+            int_field.field_id,
+            str(INT_RANGE // 100),
+            OperatorEnum.LT,
+        )
+        deep_offset = max(rows - PAGE_SIZE, 0)
+        cases = {
+            "fetch_first_page": lambda: service.fetch_rows(table, limit=PAGE_SIZE),
+            "fetch_deep_offset": lambda: service.fetch_rows(
+                table,
+                limit=PAGE_SIZE,
+                offset=deep_offset,
+            ),
+            "fetch_filtered": lambda: service.fetch_rows(
+                table,
+                limit=PAGE_SIZE,
+                filtering_params=[selective_filter],
+            ),
+            "fetch_ordered": lambda: service.fetch_rows(
+                table,
+                limit=PAGE_SIZE,
+                ordering_params=[OrderingParam(string_field.field_id)],
+            ),
+            "count": lambda: service.count_rows(table),
+            "count_filtered": lambda: service.count_rows(
+                table,
+                filtering_params=[selective_filter],
+            ),
+        }
+        for name, func in cases.items():
+            timings = await measure(name, func, repeat, rows=PAGE_SIZE if "fetch" in name else 0)
+            results.append(timings.summary())
+
+        # Every run touches rows no other run did.
+        shuffled_ids = rng.sample(list(row_ids), len(row_ids))
+        update_batches = (shuffled_ids[i : i + batch] for i in itertools.count(0, batch))
+        delete_batches = (shuffled_ids[-i - batch : -i or None] for i in itertools.count(0, batch))
+        cases = {
+            "insert": lambda: service.insert_rows(
+                [InsertRow(table, _random_values(rng, table)) for _ in range(batch)],
+            ),
+            "update": lambda: service.update_rows(
+                [
+                    UpdateRow(table, row_id, _random_values(rng, table))
+                    for row_id in next(update_batches)
+                ],
+            ),
+            "delete": lambda: service.delete_rows(table, next(delete_batches)),
+        }
+        for name, func in cases.items():
+            timings = await measure(f"{name}[{batch}]", func, repeat, rows=batch)
+            results.append(timings.summary())
+
+    return {
+        "meta": {
+            **git_commit(),
+            "python": platform.python_version(),
+            "postgres": server_version,
+            "rows": rows,
+            "width": width,
+            "repeat": repeat,
+            "batch": batch,
+            "seed": seed,
+        },
+        "timings": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--width", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=argparse.FileType())
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    if args.rows < 2 * (args.repeat + 1) * args.batch:
+        parser.error("--rows is too small to update and delete distinct rows every run")
+
+    results = asyncio.run(run(args.rows, args.width, args.repeat, args.batch, args.seed))
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    if args.baseline:
+        with args.baseline as baseline_file:
+            regressions = find_regressions(
+                results["timings"],
+                json.load(baseline_file),
+                args.tolerance,
+            )
+        for regression in regressions:
+            sys.stderr.write(f"regression: {regression}\n")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
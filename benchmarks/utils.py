@@ -0,0 +1,176 @@
+"""Helpers shared by benchmarks."""
+
+import contextlib
+import dataclasses
+import os
+import statistics
+import subprocess
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+# Benchmarks create and drop their own databases, so configured ones
+# are never used. Must happen before settings are imported.
+os.environ["DRAWBRIDGE_BACKEND_DB_BASE"] = os.getenv(
+    "BENCHMARK_DB_BASE",
+    "drawbridge_backend_bench",
+)
+os.environ["DRAWBRIDGE_BACKEND_STORAGE_DB_BASE"] = os.getenv(
+    "BENCHMARK_STORAGE_DB_BASE",
+    "drawbridge_backend_storage_bench",
+)
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from drawbridge_backend.db.meta import meta  # noqa: E402
+from drawbridge_backend.db.models import load_all_models  # noqa: E402
+from drawbridge_backend.db.utils import (  # noqa: E402
+    create_database,
+    create_storage_database,
+    drop_database,
+    drop_storage_database,
+)
+from drawbridge_backend.domain.impl.tables import SqlAlchemyTablesService  # noqa: E402
+from drawbridge_backend.settings import settings  # noqa: E402
+
+
+@contextlib.asynccontextmanager
+async def throwaway_databases() -> AsyncIterator[None]:
+    """
+    Freshly created metadata and storage databases with the schema applied.
+
+    Databases are dropped on exit, the same way tests/conftest.py does.
+    """
+    load_all_models()
+    await create_database()
+    await create_storage_database()
+    try:
+        engine = create_async_engine(str(settings.db_url))
+        async with engine.begin() as conn:
+            await conn.run_sync(meta.create_all)
+        await engine.dispose()
+        yield
+    finally:
+        await drop_database()
+        await drop_storage_database()
+
+
+@contextlib.asynccontextmanager
+async def throwaway_service() -> AsyncIterator[SqlAlchemyTablesService]:
+    """
+    Tables service backed by databases of `throwaway_databases`.
+
+    :yield: tables service.
+    """
+    async with throwaway_databases():
+        engine = create_async_engine(str(settings.db_url))
+        storage_engine = create_async_engine(str(settings.storage_db_url))
+        try:
+            async with (
+                async_sessionmaker(engine, expire_on_commit=False)() as db_session,
+                async_sessionmaker(
+                    storage_engine,
+                    expire_on_commit=False,
+                )() as storage_db_session,
+            ):
+                yield SqlAlchemyTablesService(
+                    db_session,
+                    storage_db_session,
+                    storage_engine,
+                )
+        finally:
+            await engine.dispose()
+            await storage_engine.dispose()
+
+
+@dataclasses.dataclass
+class Timings:
+    """Durations of repeated runs of one operation."""
+
+    name: str
+    durations: list[float] = dataclasses.field(default_factory=list)
+    # rows processed by a single run, used for throughput
+    rows: int = 0
+
+    def summary(self) -> dict[str, Any]:
+        durations = sorted(self.durations)
+        quantiles = (
+            statistics.quantiles(durations, n=100, method="inclusive")
+            if len(durations) > 1
+            else durations * 99
+        )
+        total = sum(durations)
+        return {
+            "name": self.name,
+            "runs": len(durations),
+            "mean_ms": statistics.fmean(durations) * 1000,
+            "p50_ms": quantiles[49] * 1000,
+            "p95_ms": quantiles[94] * 1000,
+            "p99_ms": quantiles[98] * 1000,
+            "max_ms": durations[-1] * 1000,
+            "rows_per_s": self.rows * len(durations) / total if total else 0,
+        }
+
+
+async def measure(
+    name: str,
+    func: Callable[[], Awaitable[Any]],
+    repeat: int,
+    rows: int = 0,
+    warmup: int = 1,
+) -> Timings:
+    """
+    Run `func` `repeat` times after `warmup` untimed runs.
+
+    :return: timings of the runs.
+    """
+    for _ in range(warmup):
+        await func()
+
+    timings = Timings(name=name, rows=rows)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        timings.durations.append(time.perf_counter() - start)
+    return timings
+
+
+def find_regressions(
+    timings: list[dict[str, Any]],
+    baseline: dict[str, Any],
+    tolerance: float,
+) -> list[str]:
+    """
+    Compare p50 of `timings` with a previous benchmark output.
+
+    :return: descriptions of timings slower than `tolerance` allows.
+    """
+    previous = {t["name"]: t for t in baseline["timings"]}
+    regressions = []
+    for timing in timings:
+        before = previous.get(timing["name"])
+        if before and timing["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{timing['name']}: {before['p50_ms']:.1f}ms -> {timing['p50_ms']:.1f}ms",
+            )
+    return regressions
+
+
+def git_commit() -> dict[str, Any]:
+    """
+    Commit the benchmark runs on, to tell outputs of different commits apart.
+
+    :return: commit hash and whether there are uncommitted changes.
+    """
+
+    def git(*args: str) -> str:
+        return subprocess.run(  # noqa: S603
+            ["git", *args],  # noqa: S607
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+
+    try:
+        return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
@@ -0,0 +1,32 @@
+import asyncio
+import logging
+from typing import Any, Coroutine
+
+logger = logging.getLogger(__name__)
+
+# Keeps references to running tasks, otherwise they may be garbage collected.
+_tasks: set["asyncio.Task[Any]"] = set()
+
+
+def _on_task_done(task: "asyncio.Task[Any]") -> None:
+    _tasks.discard(task)
+    if not task.cancelled() and (exc := task.exception()) is not None:
+        logger.error(
+            "Background task %s failed",
+            task.get_name(),
+            exc_info=exc,
+        )
+
+
+def run_in_background(coro: Coroutine[Any, Any, Any], name: str) -> "asyncio.Task[Any]":
+    """
+    Run a coroutine without waiting for it, logging its failure.
+
+    :param coro: coroutine to run.
+    :param name: task name used in logs.
+    :return: started task.
+    """
+    task = asyncio.create_task(coro, name=name)
+    _tasks.add(task)
+    task.add_done_callback(_on_task_done)
+    return task
@@ -4,6 +4,8 @@ from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from starlette.requests import Request
 
+from drawbridge_backend.db.shards import ShardSessions, StorageShards
+
 
 async def get_db_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
     """
@@ -39,6 +41,28 @@ async def get_storage_db_session(
         await session.close()
 
 
+async def get_shard_sessions(
+    request: Request,
+    storage_db_session: Annotated[AsyncSession, Depends(get_storage_db_session)],
+) -> AsyncGenerator[ShardSessions | None, None]:
+    """
+    Get sessions of storage shards, opened as tables on them are used.
+
+    :param request: current request.
+    :param storage_db_session: session of the default shard.
+    :yield: shard sessions, None if storage isn't sharded.
+    """
+    shards: StorageShards | None = getattr(request.app.state, "storage_shards", None)
+    if shards is None:
+        yield None
+        return
+    shard_sessions = ShardSessions(shards, storage_db_session)
+    try:
+        yield shard_sessions
+    finally:
+        await shard_sessions.close()
+
+
 async def get_storage_db_engine(
     request: Request,
 ) -> AsyncGenerator[AsyncEngine, None]:
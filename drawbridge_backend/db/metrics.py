@@ -0,0 +1,101 @@
+import functools
+import time
+from typing import Any, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import QueuePool
+
+from drawbridge_backend.db.profiling import get_statement_shape, record_query
+from drawbridge_backend.metrics import Gauge, registry
+from drawbridge_backend.tracing import to_unix_ns, tracer
+
+query_duration = registry.histogram(
+    "drawbridge_db_query_duration_seconds",
+    "Time spent executing SQL statements.",
+    ["database", "operation"],
+)
+
+_DDL_KEYWORDS = frozenset(("CREATE", "ALTER", "DROP", "TRUNCATE", "COMMENT"))
+_engines: dict[str, AsyncEngine] = {}
+
+
+@functools.lru_cache(maxsize=1024)
+def get_operation(statement: str) -> str:
+    """
+    Kind of a SQL statement: fetch, count, insert, update, delete, ddl or other.
+
+    Compiled statements are cached by SQLAlchemy, so the same strings come
+    back over and over and are classified once.
+    """
+    words = statement.split(None, 2)
+    keyword = words[0].upper() if words else ""
+    if keyword == "SELECT":
+        return "count" if len(words) > 1 and words[1].lower().startswith("count(") else "fetch"
+    if keyword in {"INSERT", "UPDATE", "DELETE"}:
+        return keyword.lower()
+    if keyword in _DDL_KEYWORDS:
+        return "ddl"
+    return "other"
+
+
+def instrument_engine(engine: AsyncEngine, database: str) -> None:
+    """
+    Report query latencies and pool usage of `engine` as `database`.
+
+    Queries are also added to the profile and trace of the current request
+    and logged when slow. Replaces an engine previously instrumented as `database`.
+    """
+    latencies = {
+        operation: query_duration.labels(database, operation)
+        for operation in ("fetch", "count", "insert", "update", "delete", "ddl", "other")
+    }
+
+    def before_cursor_execute(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        conn.info["query_started_at"] = time.perf_counter()
+
+    def after_cursor_execute(
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        *args: Any,
+    ) -> None:
+        started_at = conn.info.pop("query_started_at", None)
+        if started_at is not None:
+            finished_at = time.perf_counter()
+            operation = get_operation(statement)
+            latencies[operation].observe(finished_at - started_at)
+            record_query(database, statement, parameters, finished_at - started_at)
+            if tracer.is_recording:
+                tracer.record_span(
+                    f"db {operation}",
+                    to_unix_ns(started_at),
+                    to_unix_ns(finished_at),
+                    **{"db.name": database, "db.statement": get_statement_shape(statement)},
+                )
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    _engines[database] = engine
+
+
+def _collect_pools() -> Iterable[Gauge]:
+    size = Gauge("drawbridge_db_pool_size", "Connections the pool keeps open.", ["database"])
+    connections = Gauge(
+        "drawbridge_db_pool_connections",
+        "Connections of the pool by state, overflow is above the pool size.",
+        ["database", "state"],
+    )
+    for database, engine in _engines.items():
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        size.labels(database).set(pool.size())
+        connections.labels(database, "checked_in").set(pool.checkedin())
+        connections.labels(database, "checked_out").set(pool.checkedout())
+        connections.labels(database, "overflow").set(max(pool.overflow(), 0))
+    return (size, connections)
+
+
+registry.set_collector("pools", _collect_pools)
@@ -1,8 +1,9 @@
-from sqlalchemy import Enum, ForeignKey, String
+from sqlalchemy import BigInteger, Enum, ForeignKey, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from drawbridge_backend.db.base import Base
-from drawbridge_backend.domain.enums import DataTypeEnum
+from drawbridge_backend.domain.enums import DataTypeEnum, DateTruncEnum
+from drawbridge_backend.settings import DEFAULT_SHARD
 
 
 class NameSpaceModel(Base):
@@ -33,12 +34,31 @@ class TableModel(Base):
         nullable=True,
     )
 
+    # Fields are updated in place, so they're ordered rather than left in
+    # whatever order rows come back in.
     fields: Mapped[list["FieldModel"]] = relationship(
         back_populates="table",
         cascade="all, delete-orphan",
+        order_by="FieldModel.id",
     )
     namespace: Mapped["NameSpaceModel"] = relationship(back_populates="tables")
     is_delete: Mapped[bool] = mapped_column(nullable=False, server_default="false")
+    # Partitioning of the storage table, NULL if it isn't partitioned and 0
+    # if it is partitioned by the row id. See domain Partitioning.
+    partition_field_id: Mapped[int | None] = mapped_column(nullable=True)
+    partition_id_range: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    partition_period: Mapped[DateTruncEnum | None] = mapped_column(
+        Enum(DateTruncEnum, native_enum=False),
+        nullable=True,
+    )
+    partition_retention: Mapped[int | None] = mapped_column(nullable=True)
+    # Storage shard the table's rows live in.
+    shard: Mapped[str] = mapped_column(
+        String(64),
+        nullable=False,
+        default=DEFAULT_SHARD,
+        server_default=DEFAULT_SHARD,
+    )
 
 
 class FieldModel(Base):
@@ -57,11 +77,17 @@ class FieldModel(Base):
 
     is_nullable: Mapped[bool] = mapped_column(nullable=False, default=True)
     default_value: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    has_trigram_index: Mapped[bool] = mapped_column(
+        nullable=False,
+        default=False,
+        server_default="false",
+    )
     table: Mapped["TableModel"] = relationship(back_populates="fields")
 
     choices: Mapped[list["FieldChoiceModel"]] = relationship(
         back_populates="field",
         cascade="all, delete-orphan",
+        order_by="FieldChoiceModel.id",
     )
 
 
@@ -1,18 +1,29 @@
 # type: ignore
+import time
 import uuid
+from typing import Any, Optional
 
-from fastapi import Depends
-from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, schemas
+import jwt
+from fastapi import Depends, Request
+from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, exceptions, schemas
 from fastapi_users.authentication import (
     AuthenticationBackend,
     BearerTransport,
     JWTStrategy,
 )
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID, SQLAlchemyUserDatabase
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi_users.jwt import decode_jwt
+from fastapi_users.password import PasswordHelper
+from sqlalchemy import func, inspect, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
+from drawbridge_backend.cache import TTLCache
 from drawbridge_backend.db.base import Base
 from drawbridge_backend.db.dependencies import get_db_session
+from drawbridge_backend.metrics import registry, watch_cache
+from drawbridge_backend.services.password_hashing import PasswordHasher
 from drawbridge_backend.settings import settings
 
 
@@ -32,12 +43,183 @@ class UserUpdate(schemas.BaseUserUpdate):
     """Represents an update command for a user."""
 
 
+USER_CHANGES_CHANNEL = "drawbridge_user_changes"
+
+
+class UserCache:
+    """
+    Recently authenticated users, so that requests don't load them.
+
+    Users are kept as column values and every hit gets its own detached
+    copy, so nothing a request does to the user leaks into other requests.
+
+    A user loaded before an update committed could be cached after the
+    update invalidated it, so loads are only cached if no user was
+    invalidated while they ran: pass `version` read before the load to `set`.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        # token -> (user id, expiration timestamp or None)
+        self._tokens: TTLCache[str, tuple[str, Optional[float]]] = TTLCache(maxsize, ttl)
+        self._users: TTLCache[uuid.UUID, dict[str, Any]] = TTLCache(maxsize, ttl)
+        # bumped by every invalidation
+        self.version = 0
+
+    def get_token(self, token: str) -> Optional[str]:
+        entry = self._tokens.get(token)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            self._tokens.pop(token)
+            return None
+        return user_id
+
+    def set_token(self, token: str, user_id: str, expires_at: Optional[float]) -> None:
+        self._tokens.set(token, (user_id, expires_at))
+
+    def get(self, user_id: uuid.UUID) -> Optional[User]:
+        values = self._users.get(user_id)
+        if values is None:
+            return None
+        user = User(**values)
+        make_transient_to_detached(user)
+        return user
+
+    def set(self, user: User, version: int) -> None:
+        if version != self.version:
+            return
+        self._users.set(
+            user.id,
+            {a.key: getattr(user, a.key) for a in inspect(User).column_attrs},
+        )
+
+    def invalidate(self, user_id: uuid.UUID) -> None:
+        self.version += 1
+        self._users.pop(user_id)
+
+    def on_notification(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        try:
+            self.invalidate(uuid.UUID(payload))
+        except ValueError:
+            pass
+
+
+user_cache = UserCache(
+    maxsize=settings.users_cache_size,
+    ttl=settings.users_cache_ttl_s,
+)
+watch_cache("user_tokens", user_cache._tokens)
+watch_cache("users", user_cache._users)
+
+
+password_hasher = PasswordHasher(PasswordHelper(), workers=settings.password_hashing_workers)
+registry.set_collector("password_hashing", password_hasher.collect_metrics)
+
+
 class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
-    """Manages a user session and its tokens."""
+    """
+    Manages a user session and its tokens.
+
+    Passwords are hashed and verified on `password_hasher`, so hashing
+    doesn't block the event loop: calls to the password helper are
+    prepared before the base implementation makes them.
+    """
 
     reset_password_token_secret = settings.users_secret
     verification_token_secret = settings.users_secret
 
+    def __init__(
+        self,
+        user_db: SQLAlchemyUserDatabase,
+        hasher: PasswordHasher = password_hasher,
+    ) -> None:
+        super().__init__(user_db, hasher.prepared_helper())
+
+    async def create(
+        self,
+        user_create: schemas.UC,
+        safe: bool = False,
+        request: Optional[Request] = None,
+    ) -> User:
+        await self.password_helper.prepare_hash(user_create.password)
+        return await super().create(user_create, safe, request)
+
+    async def authenticate(self, credentials: OAuth2PasswordRequestForm) -> Optional[User]:
+        user = await self.user_db.get_by_email(credentials.username)
+        if user is None:
+            # The password is hashed anyway to mitigate timing attacks.
+            await self.password_helper.prepare_hash(credentials.password)
+        else:
+            await self.password_helper.prepare_verify_and_update(
+                credentials.password,
+                user.hashed_password,
+            )
+        return await super().authenticate(credentials)
+
+    async def forgot_password(self, user: User, request: Optional[Request] = None) -> None:
+        await self.password_helper.prepare_hash(user.hashed_password)
+        await super().forgot_password(user, request)
+
+    async def reset_password(
+        self,
+        token: str,
+        password: str,
+        request: Optional[Request] = None,
+    ) -> User:
+        try:
+            data = decode_jwt(
+                token,
+                self.reset_password_token_secret,
+                [self.reset_password_token_audience],
+            )
+            user = await self.user_db.get(self.parse_id(data["sub"]))
+            fingerprint = data["password_fgpt"]
+        except (jwt.PyJWTError, KeyError, exceptions.InvalidID):
+            user = None
+        # Invalid tokens are rejected by the base implementation.
+        if user is not None:
+            await self.password_helper.prepare_verify_and_update(
+                user.hashed_password,
+                fingerprint,
+            )
+        return await super().reset_password(token, password, request)
+
+    async def _update(self, user: User, update_dict: dict[str, Any]) -> User:
+        password = update_dict.get("password")
+        if password is not None:
+            await self.password_helper.prepare_hash(password)
+        return await super()._update(user, update_dict)
+
+    async def _invalidate_cached_user(self, user: User) -> None:
+        # Other workers drop the user once this is committed.
+        session = self.user_db.session
+        await session.execute(select(func.pg_notify(USER_CHANGES_CHANNEL, str(user.id))))
+        await session.commit()
+        # Dropped after the commit, so the previous values can't be cached again.
+        user_cache.invalidate(user.id)
+
+    async def on_after_update(
+        self,
+        user: User,
+        update_dict: dict[str, Any],
+        request: Optional[Request] = None,
+    ) -> None:
+        await self._invalidate_cached_user(user)
+
+    async def on_after_verify(self, user: User, request: Optional[Request] = None) -> None:
+        await self._invalidate_cached_user(user)
+
+    async def on_after_reset_password(
+        self,
+        user: User,
+        request: Optional[Request] = None,
+    ) -> None:
+        await self._invalidate_cached_user(user)
+
+    async def on_after_delete(self, user: User, request: Optional[Request] = None) -> None:
+        await self._invalidate_cached_user(user)
+
 
 async def get_user_db(
     session: AsyncSession = Depends(get_db_session),
@@ -63,13 +245,55 @@ async def get_user_manager(
     yield UserManager(user_db)
 
 
+class CachedJWTStrategy(JWTStrategy):
+    """JWTStrategy that resolves tokens and users through `user_cache`."""
+
+    async def read_token(
+        self,
+        token: Optional[str],
+        user_manager: BaseUserManager[User, uuid.UUID],
+    ) -> Optional[User]:
+        if token is None:
+            return None
+
+        user_id = user_cache.get_token(token)
+        if user_id is None:
+            try:
+                data = decode_jwt(
+                    token,
+                    self.decode_key,
+                    self.token_audience,
+                    algorithms=[self.algorithm],
+                )
+            except jwt.PyJWTError:
+                return None
+            user_id = data.get("sub")
+            if user_id is None:
+                return None
+            user_cache.set_token(token, user_id, data.get("exp"))
+
+        try:
+            parsed_id = user_manager.parse_id(user_id)
+        except exceptions.InvalidID:
+            return None
+        user = user_cache.get(parsed_id)
+        if user is None:
+            version = user_cache.version
+            try:
+                user = await user_manager.get(parsed_id)
+            except exceptions.UserNotExists:
+                return None
+            user_cache.set(user, version)
+        return user
+
+
 def get_jwt_strategy() -> JWTStrategy:
     """
     Return a JWTStrategy in order to instantiate it dynamically.
 
     :returns: instance of JWTStrategy with provided settings.
     """
-    return JWTStrategy(secret=settings.users_secret, lifetime_seconds=None)
+    return CachedJWTStrategy(secret=settings.users_secret, lifetime_seconds=None)
 
 
 bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
@@ -86,3 +310,19 @@ backends = [
 api_users = FastAPIUsers[User, uuid.UUID](get_user_manager, backends)
 
 current_active_user = api_users.current_user(active=True)
+current_superuser = api_users.current_user(active=True, superuser=True)
+
+
+async def get_superuser_by_token(session: AsyncSession, token: str) -> Optional[User]:
+    """
+    Active superuser a bearer token belongs to, for code outside of routes.
+
+    :param session: asynchronous SQLAlchemy session.
+    :param token: JWT without the "Bearer" prefix.
+    :returns: the user, None if the token is invalid or not a superuser's.
+    """
+    user_manager = UserManager(SQLAlchemyUserDatabase(session, User))
+    user = await get_jwt_strategy().read_token(token, user_manager)
+    if user is None or not user.is_active or not user.is_superuser:
+        return None
+    return user
@@ -0,0 +1,83 @@
+import collections
+import contextvars
+import dataclasses
+import functools
+import logging
+import re
+from typing import Any
+
+from drawbridge_backend.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r"\$\d+")
+# runs of the same placeholder, e.g. "?::INTEGER, ?::INTEGER"
+_PLACEHOLDER_RUN = re.compile(r"(\?(?:::\w+)?)(?![:\w])(?:\s*,\s*\1(?![:\w]))+")
+
+
+@dataclasses.dataclass
+class QueryProfile:
+    """Queries run while handling one request."""
+
+    queries: int = 0
+    db_seconds: float = 0.0
+    # statement shape -> times it was run
+    shapes: collections.Counter[str] = dataclasses.field(default_factory=collections.Counter)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """Statement shapes run more than `threshold` times, most repeated first."""
+        return [(s, n) for s, n in self.shapes.most_common() if n > threshold]
+
+
+current_profile: contextvars.ContextVar[QueryProfile | None] = contextvars.ContextVar(
+    "current_profile",
+    default=None,
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def get_statement_shape(statement: str) -> str:
+    """
+    Statement with placeholders numbers dropped and lists collapsed.
+
+    e.g. IN ($1::INTEGER, $2::INTEGER) -> IN (?::INTEGER). Expanded IN
+    lists make a new statement for every list length, they are still the
+    same query for telling repeated ones apart.
+    """
+    statement = _PLACEHOLDER_RUN.sub(r"\1", _PLACEHOLDER.sub("?", statement))
+    return " ".join(statement.split())
+
+
+def redact_parameters(parameters: Any) -> str:
+    """
+    Types of query parameters, so logs never carry user data.
+
+    A list of parameter sets (executemany) is reported by its length and
+    the first set.
+    """
+    if isinstance(parameters, list):
+        first = redact_parameters(parameters[0]) if parameters else "()"
+        return f"{len(parameters)} x {first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, tuple):
+        return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+    return type(parameters).__name__
+
+
+def record_query(database: str, statement: str, parameters: Any, seconds: float) -> None:
+    """Add a query to the profile of the current request and log it if slow."""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.queries += 1
+        profile.db_seconds += seconds
+        profile.shapes[get_statement_shape(statement)] += 1
+
+    if seconds * 1000 >= settings.slow_query_threshold_ms:
+        logger.warning(
+            "Slow query on %s database took %.1fms: %s; parameters: %s",
+            database,
+            seconds * 1000,
+            get_statement_shape(statement),
+            redact_parameters(parameters),
+        )
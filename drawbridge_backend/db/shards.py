@@ -0,0 +1,96 @@
+import asyncio
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from drawbridge_backend.settings import DEFAULT_SHARD
+
+
+class StorageShards:
+    """
+    Storage databases user tables are spread over, by shard name.
+
+    Every shard has its own engine, so its own connection pool: a busy
+    shard can't take connections of the others.
+    """
+
+    def __init__(self, engines: dict[str, AsyncEngine]) -> None:
+        self._engines = engines
+        self._session_factories = {
+            name: async_sessionmaker(engine, expire_on_commit=False)
+            for name, engine in engines.items()
+        }
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._engines)
+
+    def engine(self, shard: str) -> AsyncEngine:
+        try:
+            return self._engines[shard]
+        except KeyError:
+            raise ValueError(f"Unknown storage shard '{shard}'") from None
+
+    def session(self, shard: str) -> AsyncSession:
+        self.engine(shard)
+        return self._session_factories[shard]()
+
+    async def get_sizes(self) -> dict[str, int]:
+        """Size of every shard's database in bytes."""
+
+        async def get_size(engine: AsyncEngine) -> int:
+            async with engine.connect() as conn:
+                result = await conn.execute(
+                    select(func.pg_database_size(func.current_database())),
+                )
+                return int(result.scalar_one())
+
+        sizes = await asyncio.gather(*(get_size(e) for e in self._engines.values()))
+        return dict(zip(self._engines, sizes))
+
+    async def get_least_loaded(self) -> str:
+        """
+        Shard to place a new table on.
+
+        Load is measured by database size: it grows with rows written and
+        kept, and unlike request rates it's the same for every worker.
+        """
+        sizes = await self.get_sizes()
+        return min(sizes, key=lambda shard: sizes[shard])
+
+    async def dispose(self) -> None:
+        await asyncio.gather(*(e.dispose() for e in self._engines.values()))
+
+
+class ShardSessions:
+    """
+    Storage sessions of a unit of work, opened on first use of a shard.
+
+    The session of the default shard is given, sessions opened here are
+    committed and closed by `close`.
+    """
+
+    def __init__(
+        self,
+        shards: StorageShards,
+        default_session: AsyncSession,
+    ) -> None:
+        self.shards = shards
+        self._sessions = {DEFAULT_SHARD: default_session}
+        self._opened: list[AsyncSession] = []
+
+    def get(self, shard: str) -> AsyncSession:
+        session = self._sessions.get(shard)
+        if session is None:
+            session = self.shards.session(shard)
+            self._sessions[shard] = session
+            self._opened.append(session)
+        return session
+
+    async def close(self) -> None:
+        for session in self._opened:
+            try:
+                await session.commit()
+            finally:
+                await session.close()
+        self._opened.clear()
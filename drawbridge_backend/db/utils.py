@@ -1,6 +1,6 @@
 from sqlalchemy import text
 from sqlalchemy.engine import make_url
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 from drawbridge_backend.settings import settings
 
@@ -85,3 +85,17 @@ async def drop_storage_database() -> None:
             ),
         )
         await conn.execute(text(f'DROP DATABASE "{settings.storage_db_base}"'))
+
+
+def invalidate_prepared_statements(engine: AsyncEngine) -> None:
+    """
+    Make connections of an engine prepare their statements again.
+
+    asyncpg can't retry statements prepared before a column type changed
+    inside a transaction, each connection would fail one of them.
+
+    Relies on the private `_invalidate_schema_cache` of SQLAlchemy's asyncpg
+    dialect, the one it calls itself on InvalidCachedStatementError; a test
+    pins it so that an upgrade removing it fails loudly.
+    """
+    engine.dialect._invalidate_schema_cache()  # type: ignore[attr-defined]
@@ -16,3 +16,30 @@ class OperatorEnum(StrEnum):
     LE = "<="
     GT = ">"
     GE = ">="
+    # STRING only, case-insensitive, served by trigram indexes
+    CONTAINS = "contains"
+    STARTS_WITH = "startswith"
+    SIMILAR = "similar"
+
+
+class ChangeTypeEnum(StrEnum):
+    INSERT = auto()
+    UPDATE = auto()
+    DELETE = auto()
+
+
+class AggregateFunctionEnum(StrEnum):
+    COUNT = auto()
+    SUM = auto()
+    AVG = auto()
+    MIN = auto()
+    MAX = auto()
+
+
+class DateTruncEnum(StrEnum):
+    HOUR = auto()
+    DAY = auto()
+    WEEK = auto()
+    MONTH = auto()
+    QUARTER = auto()
+    YEAR = auto()
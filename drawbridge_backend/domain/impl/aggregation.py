@@ -0,0 +1,202 @@
+from typing import Any, Final
+
+from sqlalchemy import (
+    Float,
+    Integer,
+    Select,
+    String,
+    Table as SATable,
+    column,
+    func,
+    select,
+    tuple_,
+    values,
+)
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import FromClause
+
+from drawbridge_backend.domain.enums import AggregateFunctionEnum, DataTypeEnum
+from drawbridge_backend.domain.tables.entities import (
+    AggregateParam,
+    Facet,
+    FacetValue,
+    Field,
+    GroupingParam,
+    Table,
+)
+
+AGGREGATABLE_TYPES: Final[dict[AggregateFunctionEnum, frozenset[DataTypeEnum]]] = {
+    AggregateFunctionEnum.COUNT: frozenset(DataTypeEnum),
+    AggregateFunctionEnum.SUM: frozenset({DataTypeEnum.INT, DataTypeEnum.FLOAT}),
+    AggregateFunctionEnum.AVG: frozenset({DataTypeEnum.INT, DataTypeEnum.FLOAT}),
+    AggregateFunctionEnum.MIN: frozenset(
+        {DataTypeEnum.INT, DataTypeEnum.FLOAT, DataTypeEnum.STRING, DataTypeEnum.DATETIME},
+    ),
+    AggregateFunctionEnum.MAX: frozenset(
+        {DataTypeEnum.INT, DataTypeEnum.FLOAT, DataTypeEnum.STRING, DataTypeEnum.DATETIME},
+    ),
+}
+
+
+def _get_field(table: Table, field_id: int) -> Field:
+    field = table.get_field_by_id(field_id)
+    if not field:
+        raise ValueError(f"Field with id={field_id} not found in table '{table.name}'")
+    return field
+
+
+def get_choice_labels(field: Field, name: str) -> FromClause | None:
+    """
+    Choice ids and labels of a CHOICE field as an inline VALUES list.
+
+    Labels live in the metadata database, so they are sent along with the
+    query to be joined in the storage database.
+    """
+    if not field.choices:
+        return None
+    return values(
+        column("_choice_id", Integer),
+        column("_label", String),
+        name=name,
+    ).data([(c.choice_id, c.value) for c in field.choices])
+
+
+def _get_aggregate(
+    sa_table: SATable,
+    table: Table,
+    param: AggregateParam,
+) -> ColumnElement[Any]:
+    if param.field_id is None:
+        if param.function is not AggregateFunctionEnum.COUNT:
+            raise ValueError(f"Aggregate '{param.function}' requires a field")
+        return func.count().label("count")
+
+    field = _get_field(table, param.field_id)
+    if field.data_type not in AGGREGATABLE_TYPES[param.function]:
+        raise ValueError(
+            f"Aggregate '{param.function}' is not supported for "
+            f"field '{field.name}' of type '{field.data_type}'",
+        )
+
+    col = sa_table.c[field.name]
+    label = f"{param.function}_{field.name}"
+    if param.function is AggregateFunctionEnum.AVG:
+        # avg() of integers is numeric, which isn't JSON friendly.
+        return func.avg(col).cast(Float).label(label)
+    return getattr(func, param.function.value)(col).label(label)
+
+
+def build_aggregation_stmt(
+    sa_table: SATable,
+    table: Table,
+    aggregates: list[AggregateParam],
+    grouping_params: list[GroupingParam],
+) -> Select[Any]:
+    """
+    Compile group-by fields and aggregates into a single query.
+
+    DATETIME groups may be bucketed with date_trunc, CHOICE groups are
+    grouped by choice label.
+
+    :param sa_table: storage table.
+    :param table: table metadata.
+    :param aggregates: aggregates to compute per group.
+    :param grouping_params: fields to group by, none for a single total.
+    :return: query returning group values followed by aggregates.
+    """
+    source: FromClause = sa_table
+    group_columns: list[ColumnElement[Any]] = []
+    for i, param in enumerate(grouping_params):
+        field = _get_field(table, param.field_id)
+        col: ColumnElement[Any] = sa_table.c[field.name]
+        name = field.name
+        if param.bucket is not None:
+            if field.data_type is not DataTypeEnum.DATETIME:
+                raise ValueError(f"Field '{field.name}' can't be bucketed")
+            col = func.date_trunc(param.bucket.value, col)
+            name = f"{field.name}__{param.bucket}"
+        elif field.data_type is DataTypeEnum.CHOICE:
+            labels = get_choice_labels(field, f"_choices_{i}")
+            if labels is not None:
+                source = source.outerjoin(labels, col == labels.c._choice_id)
+                col = labels.c._label
+        group_columns.append(col.label(name))
+
+    stmt = select(
+        *group_columns,
+        *(_get_aggregate(sa_table, table, a) for a in aggregates),
+    ).select_from(source)
+    if group_columns:
+        stmt = stmt.group_by(*group_columns).order_by(*group_columns)
+    return stmt
+
+
+def build_facets_stmt(
+    source: FromClause,
+    fields: list[Field],
+    limit: int,
+) -> Select[Any]:
+    """
+    Top `limit` values of every field with their row counts, in one scan.
+
+    Fields are grouped with GROUPING SETS, so each result row carries the
+    value of exactly one field, the one whose `_facet` bit is not set.
+
+    :param source: storage table or its sample.
+    :param fields: fields to count values of.
+    :param limit: number of values per field.
+    :return: query returning `_facet`, field values and `_count`.
+    """
+    cols = [source.c[f.name] for f in fields]
+    counts = (
+        select(
+            func.grouping(*cols).label("_facet"),
+            *cols,
+            func.count().label("_count"),
+        )
+        .select_from(source)
+        .group_by(func.grouping_sets(*(tuple_(c) for c in cols)))
+        .subquery("counts")
+    )
+    ranked = select(
+        counts,
+        func.row_number()
+        .over(
+            partition_by=counts.c._facet,
+            order_by=[counts.c._count.desc(), *(counts.c[f.name] for f in fields)],
+        )
+        .label("_rank"),
+    ).subquery("ranked")
+    return (
+        select(ranked.c._facet, *(ranked.c[f.name] for f in fields), ranked.c._count)
+        .where(ranked.c._rank <= limit)
+        .order_by(ranked.c._facet, ranked.c._rank)
+    )
+
+
+def map_facets(
+    fields: list[Field],
+    rows: list[Any],
+    scale: float = 1.0,
+) -> list[Facet]:
+    """
+    Maps the result of `build_facets_stmt`, resolving choice labels.
+
+    :param scale: multiplier of counts, for facets computed on a sample.
+    """
+    facets = [Facet(field_id=f.field_id, values=[], is_approximate=scale != 1.0) for f in fields]
+    # grouping() sets the bit of every field the row is not grouped by,
+    # the first field being the most significant one.
+    by_mask = {
+        ((1 << len(fields)) - 1) ^ (1 << (len(fields) - 1 - i)): i
+        for i in range(len(fields))
+    }
+    for row in rows:
+        i = by_mask[row._facet]
+        field = fields[i]
+        value = row._mapping[field.name]
+        label = None
+        if field.data_type is DataTypeEnum.CHOICE:
+            label = next((c.value for c in field.choices if c.choice_id == value), None)
+        facets[i].values.append(FacetValue(value, round(row._count * scale), label))
+    return facets
@@ -0,0 +1,145 @@
+import datetime
+from typing import Any, Final
+
+from sqlalchemy.dialects.postgresql import dialect as pg_dialect
+
+from drawbridge_backend.domain.enums import DataTypeEnum, DateTruncEnum
+from drawbridge_backend.domain.tables.entities import Partitioning, Table, UnSavedTable
+
+# Lower bound of a partition, partitions are named after it.
+PartitionStart = int | datetime.datetime
+
+_FIXED_PERIODS: Final = {
+    DateTruncEnum.HOUR: datetime.timedelta(hours=1),
+    DateTruncEnum.DAY: datetime.timedelta(days=1),
+    DateTruncEnum.WEEK: datetime.timedelta(weeks=1),
+}
+_MONTHS_PER_PERIOD: Final = {
+    DateTruncEnum.MONTH: 1,
+    DateTruncEnum.QUARTER: 3,
+    DateTruncEnum.YEAR: 12,
+}
+# Parses partition names only, `%Y` isn't zero-padded below year 1000 when
+# formatting, so names are formatted with a fixed width year instead.
+_NAME_TIME_FORMAT: Final = "%Y%m%d%H"
+_quote = pg_dialect().identifier_preparer.quote
+
+
+def validate_partitioning(table: UnSavedTable) -> None:
+    """Raise ValueError if the table can't be partitioned as requested."""
+    partitioning = table.partitioning
+    if partitioning is None:
+        return
+    if partitioning.retention is not None and partitioning.retention < 1:
+        raise ValueError("Partition retention must be at least 1")
+    if partitioning.field_name is None:
+        if partitioning.id_range < 1:
+            raise ValueError("Partition id range must be positive")
+        return
+
+    field = next((f for f in table.fields if f.name == partitioning.field_name), None)
+    if field is None:
+        raise ValueError(f"Field '{partitioning.field_name}' not found in table '{table.name}'")
+    if field.data_type is not DataTypeEnum.DATETIME:
+        raise ValueError("Tables can only be partitioned by the row id or a DATETIME field")
+    # Rows with NULL keys would have no partition to go to.
+    if field.is_nullable:
+        raise ValueError(f"Partitioning field '{field.name}' must not be nullable")
+
+
+def _get_partitioning(table: Table) -> Partitioning:
+    if table.partitioning is None:
+        raise ValueError(f"Table '{table.name}' is not partitioned")
+    return table.partitioning
+
+
+def get_partition_key(table: Table) -> str:
+    """Name of the column a partitioned table is split by."""
+    partitioning = _get_partitioning(table)
+    if partitioning.field_id == 0:
+        return "id"
+    field = table.get_field_by_id(partitioning.field_id)
+    if field is None:
+        raise ValueError(f"Partitioning field of table '{table.name}' not found")
+    return field.name
+
+
+def truncate(value: datetime.datetime, period: DateTruncEnum) -> datetime.datetime:
+    """Start of the period `value` falls in, as date_trunc() computes it."""
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if period is DateTruncEnum.HOUR:
+        return value
+    value = value.replace(hour=0)
+    if period is DateTruncEnum.DAY:
+        return value
+    if period is DateTruncEnum.WEEK:
+        # Weeks start on Monday.
+        return value - datetime.timedelta(days=value.weekday())
+    months = _MONTHS_PER_PERIOD[period]
+    return value.replace(month=(value.month - 1) // months * months + 1, day=1)
+
+
+def add_periods(
+    start: datetime.datetime,
+    period: DateTruncEnum,
+    count: int,
+) -> datetime.datetime:
+    """Start of the period `count` periods after the one starting at `start`."""
+    if period in _FIXED_PERIODS:
+        return start + _FIXED_PERIODS[period] * count
+    month_index = start.year * 12 + start.month - 1 + _MONTHS_PER_PERIOD[period] * count
+    return start.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+
+def get_partition_start(partitioning: Partitioning, value: Any) -> PartitionStart:
+    """Lower bound of the partition a partition key value belongs to."""
+    if partitioning.field_id == 0:
+        return int(value) // partitioning.id_range * partitioning.id_range
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    # Values are stored without a time zone, aware ones are stored in UTC.
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return truncate(value, partitioning.period)
+
+
+def get_next_start(
+    partitioning: Partitioning,
+    start: PartitionStart,
+    count: int = 1,
+) -> PartitionStart:
+    """Lower bound of the partition `count` partitions after the one at `start`."""
+    if isinstance(start, int):
+        return start + partitioning.id_range * count
+    return add_periods(start, partitioning.period, count)
+
+
+def get_partition_name(table: Table, start: PartitionStart) -> str:
+    # Table names may be longer than identifiers, so partitions are named by id.
+    if isinstance(start, int):
+        return f"storage_{table.table_id}_p{start}"
+    return f"storage_{table.table_id}_p{start.year:04d}{start:%m%d%H}"
+
+
+def parse_partition_name(partitioning: Partitioning, name: str) -> PartitionStart:
+    """Lower bound of a partition named by `get_partition_name`."""
+    suffix = name.rsplit("_p", 1)[1]
+    if partitioning.field_id == 0:
+        return int(suffix)
+    return datetime.datetime.strptime(suffix, _NAME_TIME_FORMAT)
+
+
+def _literal(value: PartitionStart) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return f"'{value.isoformat(sep=' ')}'"
+
+
+def get_partition_ddl(table: Table, start: PartitionStart) -> str:
+    """CREATE TABLE of the partition starting at `start`, if it doesn't exist."""
+    end = get_next_start(_get_partitioning(table), start)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {_quote(get_partition_name(table, start))} "
+        f"PARTITION OF {_quote(table.name)} "
+        f"FOR VALUES FROM ({_literal(start)}) TO ({_literal(end)})"
+    )
@@ -0,0 +1,96 @@
+from drawbridge_backend.domain.enums import DataTypeEnum
+from drawbridge_backend.domain.tables.entities import Field, Table, UnSavedField
+
+# Changed fields as their current and requested versions.
+FieldChanges = list[tuple[Field, Field]]
+
+
+def get_shadow_column(field_id: int) -> str:
+    """Column a field's values are converted into before they replace its own."""
+    return f"_new_{field_id}"
+
+
+def parse_shadow_column(name: str) -> int | None:
+    """Id of the field a column is the shadow of, None if it isn't one."""
+    prefix, _, field_id = name.rpartition("_")
+    return int(field_id) if prefix == "_new" and field_id.isdigit() else None
+
+
+def get_not_null_constraint(table: Table, field_id: int) -> str:
+    # Table names may be longer than identifiers, so constraints are named by id.
+    return f"storage_{table.table_id}_{field_id}_not_null"
+
+
+def diff_fields(
+    table: Table,
+    fields: list[Field | UnSavedField],
+) -> tuple[list[UnSavedField], FieldChanges, list[Field]]:
+    """
+    Fields to add, change and drop for a table to have `fields`.
+
+    :return: added fields, changed fields and dropped fields.
+    """
+    current = {f.field_id: f for f in table.fields}
+    kept = {f.field_id: f for f in fields if isinstance(f, Field)}
+    for field_id in kept.keys() - current.keys():
+        raise ValueError(f"Field with ID '{field_id}' not found in table '{table.name}'")
+    added = [f for f in fields if isinstance(f, UnSavedField)]
+    changed = [(current[i], f) for i, f in kept.items() if f != current[i]]
+    dropped = [f for f in table.fields if f.field_id not in kept]
+    return added, changed, dropped
+
+
+def validate_field_changes(
+    table: Table,
+    fields: list[Field | UnSavedField],
+    converting: set[int],
+) -> None:
+    """
+    Raise ValueError if the table can't have `fields` instead of its own.
+
+    :param converting: ids of fields whose values are still being converted
+        to another type, they can't be changed until that's done.
+    """
+    added, changed, dropped = diff_fields(table, fields)
+    names = [f.name for f in fields]
+    if len(set(names)) != len(names):
+        raise ValueError("Field names must be unique")
+    # Storage columns of a row besides fields are named "id" or start with "_".
+    named: list[Field | UnSavedField] = [
+        *added,
+        *(new for old, new in changed if new.name != old.name),
+    ]
+    for field in named:
+        if field.name == "id" or field.name.startswith("_"):
+            raise ValueError(f"Field name '{field.name}' is reserved")
+    for field in added:
+        # Existing rows get the default, a required field can't be left empty.
+        if not field.is_nullable and field.default_value is None:
+            raise ValueError(f"Required field '{field.name}' needs a default value")
+
+    partition_field_id = table.partitioning.field_id if table.partitioning else None
+    for field in dropped:
+        if field.field_id in converting:
+            raise ValueError(f"Field '{field.name}' is being converted to another type")
+        if field.field_id == partition_field_id:
+            raise ValueError(f"Partitioning field '{field.name}' can't be dropped")
+    for old, new in changed:
+        if old.field_id in converting:
+            raise ValueError(f"Field '{old.name}' is being converted to another type")
+        if old.has_trigram_index != new.has_trigram_index:
+            raise ValueError("Trigram indexes can only be added with a new field")
+        if {c.value for c in old.choices} - {c.value for c in new.choices}:
+            raise ValueError(f"Choices of field '{old.name}' can't be removed")
+        if old.field_id == partition_field_id and (
+            new.is_nullable or new.data_type is not old.data_type
+        ):
+            raise ValueError(f"Partitioning field '{old.name}' must stay a required DATETIME")
+        if new.data_type is old.data_type:
+            continue
+        if DataTypeEnum.CHOICE in (old.data_type, new.data_type):
+            raise ValueError("CHOICE fields can't be converted to or from other types")
+        # The trigger filling shadow columns is replaced as a whole.
+        if converting:
+            raise ValueError(
+                f"Fields of table '{table.name}' are being converted to another type",
+            )
@@ -0,0 +1,184 @@
+from typing import Any, Final, Sequence
+
+from sqlalchemy import (
+    Float,
+    Row,
+    Select,
+    Table as SATable,
+    Text,
+    cast as sa_cast,
+    column,
+    distinct,
+    func,
+    select,
+    table as table_clause,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, array
+
+from drawbridge_backend.domain.enums import DataTypeEnum
+from drawbridge_backend.domain.tables.entities import FieldStatistics, Table
+
+# Types with a meaningful order, so min/max and histograms make sense.
+ORDERED_TYPES: Final = {
+    DataTypeEnum.INT,
+    DataTypeEnum.FLOAT,
+    DataTypeEnum.STRING,
+    DataTypeEnum.DATETIME,
+}
+
+pg_stats: Final = table_clause(
+    "pg_stats",
+    column("schemaname", Text),
+    column("tablename", Text),
+    column("attname", Text),
+    column("null_frac", Float),
+    column("n_distinct", Float),
+    column("most_common_vals"),
+    column("histogram_bounds"),
+    schema="pg_catalog",
+)
+
+
+def build_exact_statistics_stmt(
+    sa_table: SATable,
+    table: Table,
+    histogram_buckets: int,
+) -> Select[Any]:
+    """
+    Statistics of every field computed with a single scan.
+
+    Histogram bounds are percentiles, so they are collected in the same
+    pass as the rest of the aggregates.
+
+    :param sa_table: storage table.
+    :param table: table metadata.
+    :param histogram_buckets: number of histogram buckets.
+    :return: query returning a single row, see `map_exact_statistics`.
+    """
+    fractions = sa_cast(
+        array([i / histogram_buckets for i in range(histogram_buckets + 1)]),
+        ARRAY(Float),
+    )
+    columns: list[Any] = [func.count().label("row_count")]
+    for field in table.fields:
+        col = sa_table.c[field.name]
+        prefix = f"f{field.field_id}"
+        columns += [
+            func.count(col).label(f"{prefix}_non_null"),
+            func.count(distinct(col)).label(f"{prefix}_distinct"),
+        ]
+        if field.data_type in ORDERED_TYPES:
+            columns += [
+                func.min(col).label(f"{prefix}_min"),
+                func.max(col).label(f"{prefix}_max"),
+                func.percentile_disc(fractions)
+                .within_group(col)
+                .label(f"{prefix}_histogram"),
+            ]
+    return select(*columns).select_from(sa_table)
+
+
+def map_exact_statistics(table: Table, row: Any) -> tuple[int, list[FieldStatistics]]:
+    """
+    Maps the result of `build_exact_statistics_stmt`.
+
+    :return: row count and statistics per field.
+    """
+    data = row._mapping
+    row_count = data["row_count"]
+    fields = []
+    for field in table.fields:
+        prefix = f"f{field.field_id}"
+        stats = FieldStatistics(
+            field_id=field.field_id,
+            null_ratio=1 - data[f"{prefix}_non_null"] / row_count if row_count else 0.0,
+            distinct_estimate=data[f"{prefix}_distinct"],
+        )
+        if field.data_type in ORDERED_TYPES:
+            stats.min_value = data[f"{prefix}_min"]
+            stats.max_value = data[f"{prefix}_max"]
+            stats.histogram = list(data[f"{prefix}_histogram"] or [])
+        fields.append(stats)
+    return row_count, fields
+
+
+def _filter_pg_stats(sa_table: SATable) -> Any:
+    return (pg_stats.c.schemaname == func.current_schema()) & (
+        pg_stats.c.tablename == sa_table.name
+    )
+
+
+def build_sampled_statistics_stmts(
+    sa_table: SATable,
+    table: Table,
+) -> tuple[Select[Any], Select[Any] | None]:
+    """
+    Statistics of every field read from `pg_stats` after ANALYZE.
+
+    :param sa_table: storage table.
+    :param table: table metadata.
+    :return: query returning null fraction and distinct estimate per column,
+        and query returning a single row of typed histogram bounds, if any
+        field has an order.
+    """
+    estimates = select(
+        pg_stats.c.attname,
+        pg_stats.c.null_frac,
+        pg_stats.c.n_distinct,
+    ).where(_filter_pg_stats(sa_table))
+
+    # Value arrays are anyarray, they can only be read back through text.
+    bounds = [
+        select(
+            sa_cast(
+                sa_cast(pg_stats.c[name], Text),
+                ARRAY(sa_table.c[field.name].type),
+            ),
+        )
+        .where(_filter_pg_stats(sa_table), pg_stats.c.attname == field.name)
+        .scalar_subquery()
+        .label(f"f{field.field_id}_{name}")
+        for field in table.fields
+        if field.data_type in ORDERED_TYPES
+        for name in ("histogram_bounds", "most_common_vals")
+    ]
+    return estimates, select(*bounds) if bounds else None
+
+
+def map_sampled_statistics(
+    table: Table,
+    row_count: int,
+    estimates: Sequence[Row[Any]],
+    bounds: Any,
+) -> list[FieldStatistics]:
+    """
+    Maps the results of `build_sampled_statistics_stmts`.
+
+    Min/max are taken from sampled values, so they are estimates as well.
+    Histograms don't include the most common values.
+
+    :return: statistics per field.
+    """
+    by_name = {r.attname: r for r in estimates}
+    fields = []
+    for field in table.fields:
+        estimate = by_name.get(field.name)
+        stats = FieldStatistics(field_id=field.field_id, null_ratio=0.0, distinct_estimate=0)
+        if estimate is not None:
+            stats.null_ratio = estimate.null_frac
+            # Negative n_distinct is a fraction of the row count.
+            stats.distinct_estimate = round(
+                estimate.n_distinct
+                if estimate.n_distinct >= 0
+                else -estimate.n_distinct * row_count,
+            )
+        if field.data_type in ORDERED_TYPES and bounds is not None:
+            prefix = f"f{field.field_id}"
+            stats.histogram = list(bounds._mapping[f"{prefix}_histogram_bounds"] or [])
+            sampled = stats.histogram + list(
+                bounds._mapping[f"{prefix}_most_common_vals"] or [],
+            )
+            if sampled:
+                stats.min_value, stats.max_value = min(sampled), max(sampled)
+        fields.append(stats)
+    return fields
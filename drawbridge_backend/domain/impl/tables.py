@@ -1,25 +1,91 @@
+import copy
+import dataclasses
+import datetime
+import json
+import math
 from typing import Any, Final, Type, cast
 
 from sqlalchemy import (
+    BigInteger,
+    ColumnElement,
     Column,
+    DateTime,
+    Index,
     Integer,
     MetaData,
+    PrimaryKeyConstraint,
     Select,
+    Sequence,
+    cast as sa_cast,
+    column,
     delete,
     func,
+    insert,
+    literal,
+    literal_column,
+    or_,
     select,
+    text,
+    tuple_,
     update,
+    values,
     Table as SATable,
 )
-from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.dialects.postgresql import TSVECTOR, dialect as pg_dialect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
 from sqlalchemy.orm import selectinload
 from sqlalchemy.sql import sqltypes as sqlalchemy_types
+from sqlalchemy.sql.selectable import FromClause
 from typing_extensions import TypeVar
 
+from drawbridge_backend.background import run_in_background
+from drawbridge_backend.cache import TTLCache
+from drawbridge_backend.db.models.edit_session import EditSessionModel
 from drawbridge_backend.db.models.tables import FieldModel, TableModel, FieldChoiceModel
-from drawbridge_backend.domain.enums import DataTypeEnum
+from drawbridge_backend.db.shards import ShardSessions
+from drawbridge_backend.db.utils import invalidate_prepared_statements
+from drawbridge_backend.domain.enums import ChangeTypeEnum, DataTypeEnum, OperatorEnum
+from drawbridge_backend.domain.impl.aggregation import (
+    build_aggregation_stmt,
+    build_facets_stmt,
+    map_facets,
+)
+from drawbridge_backend.domain.impl.partitioning import (
+    PartitionStart,
+    get_next_start,
+    get_partition_ddl,
+    get_partition_key,
+    get_partition_name,
+    get_partition_start,
+    parse_partition_name,
+    validate_partitioning,
+)
+from drawbridge_backend.domain.impl.schema_changes import (
+    diff_fields,
+    get_not_null_constraint,
+    get_shadow_column,
+    parse_shadow_column,
+    validate_field_changes,
+)
+from drawbridge_backend.domain.impl.statistics import (
+    build_exact_statistics_stmt,
+    build_sampled_statistics_stmts,
+    map_exact_statistics,
+    map_sampled_statistics,
+)
 from drawbridge_backend.domain.tables.entities import (
+    AggregateParam,
+    AggregationResult,
     BaseValue,
+    BatchOperation,
+    BatchOperationResult,
+    ChangeCursor,
+    DeleteRowsOperation,
+    Facet,
+    InsertRowsOperation,
+    UpdateRowsOperation,
     BoolValue,
     DateTimeValue,
     Field,
@@ -28,6 +94,7 @@ from drawbridge_backend.domain.tables.entities import (
     InsertRow,
     IntValue,
     OrderingParam,
+    Partitioning,
     Row,
     RowData,
     StringValue,
@@ -36,8 +103,19 @@ from drawbridge_backend.domain.tables.entities import (
     UpdateRow,
     ChoiceValue,
     FieldChoice,
+    GroupingParam,
+    RowChange,
+    RowConflict,
+    RowsDelta,
+    SchemaChange,
+    TableStatistics,
+    UnSavedField,
 )
 from drawbridge_backend.domain.tables.table_service import AbstractTableService
+from drawbridge_backend.metrics import registry, watch_cache
+from drawbridge_backend.services.memory_profiling import note_table
+from drawbridge_backend.settings import DEFAULT_SHARD, settings
+from drawbridge_backend.tracing import traced, tracer
 
 SQLALCHEMY_TYPES_MAP: Final[
     dict[DataTypeEnum, Type[sqlalchemy_types.TypeEngine[Any]]]
@@ -50,9 +128,99 @@ SQLALCHEMY_TYPES_MAP: Final[
     DataTypeEnum.CHOICE: sqlalchemy_types.Integer,
 }
 
+ROW_CHANGES_CHANNEL: Final = "drawbridge_row_changes"
+# Ids of tables whose metadata changed, so workers drop them from their caches.
+TABLE_CHANGES_CHANNEL: Final = "drawbridge_table_changes"
+# Suffix of TABLE_CHANGES_CHANNEL payloads of tables whose column types changed.
+COLUMN_TYPES_CHANGED: Final = ":types"
+# Advisory lock class of tables being moved between shards, the table id
+# is the other half of the key.
+TABLE_MOVE_LOCK: Final = 0x6D6F7665
+# Advisory lock class of partitions being created by writes, the table id is
+# the other half of the key.
+PARTITION_CREATE_LOCK: Final = 0x70617274
+# Advisory lock of storage upgrades, so workers starting together take turns.
+STORAGE_UPGRADE_LOCK: Final = 0x75706772
+# NOTIFY payloads are limited to 8000 bytes, so row ids are sent in chunks.
+ROW_CHANGES_CHUNK_SIZE: Final = 500
+
+rows_read: Final = registry.counter(
+    "drawbridge_table_rows_read_total",
+    "Rows returned by row fetches.",
+    ["table_id"],
+)
+rows_written: Final = registry.counter(
+    "drawbridge_table_rows_written_total",
+    "Rows inserted, updated or deleted, rolled back writes included.",
+    ["table_id", "operation"],
+)
+
+# Transaction ids as bigint, xid8 has no SQLAlchemy type. Changes are read up
+# to the oldest transaction still running, see ChangeCursor.
+CURRENT_XID_SQL: Final = "CAST(CAST(pg_current_xact_id() AS text) AS bigint)"
+SNAPSHOT_XMIN_SQL: Final = (
+    "CAST(CAST(pg_snapshot_xmin(pg_current_snapshot()) AS text) AS bigint)"
+)
+
+# Storage tables shared by all user tables. Every write to a user table takes
+# the next value of ROW_CHANGE_SEQ and records its transaction id, deletes
+# leave a tombstone carrying both.
+STORAGE_META: Final = MetaData()
+ROW_CHANGE_SEQ: Final = Sequence("row_change_seq", metadata=STORAGE_META)
+row_tombstones: Final = SATable(
+    "row_tombstones",
+    STORAGE_META,
+    Column("table_id", Integer, nullable=False),
+    Column("row_id", Integer, nullable=False),
+    Column("seq", BigInteger, ROW_CHANGE_SEQ, nullable=False),
+    Column("xid", BigInteger, nullable=False, server_default=text(CURRENT_XID_SQL)),
+    Column(
+        "deleted_at",
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+    ),
+    PrimaryKeyConstraint("table_id", "row_id"),
+    Index("ix_row_tombstones_table_id_xid_seq", "table_id", "xid", "seq"),
+)
+# Per table, the change number of its last resync, which is the generation
+# of cursors, and the highest transaction id of tombstones removed by compaction.
+row_tombstone_watermarks: Final = SATable(
+    "row_tombstone_watermarks",
+    STORAGE_META,
+    Column("table_id", Integer, primary_key=True, autoincrement=False),
+    Column("seq", BigInteger, nullable=False, server_default="0"),
+    Column("xid", BigInteger, nullable=False, server_default="0"),
+)
+
+
+T = TypeVar("T", bound=Any)
+# Position of a change: transaction id, then change number.
+ChangePosition = tuple[int, int]
+
+# server_version_num of PostgreSQL 16, the first with pg_input_is_valid.
+CONVERSION_SERVER_VERSION: Final = 160000
+
+# Full-text search vector over all STRING fields, maintained by a trigger.
+SEARCH_COLUMN: Final = "_search"
+_quote = pg_dialect().identifier_preparer.quote
+
 
 def get_sa_table(table: Table, metadata: MetaData) -> SATable:
-    columns = [Column("id", Integer, primary_key=True, autoincrement=True)]
+    # The primary key of a partitioned table has to include the partition key.
+    partition_key = get_partition_key(table) if table.partitioning else None
+    columns: list[Column[Any]] = [
+        Column("id", Integer, primary_key=True, autoincrement=True),
+        Column(
+            "_seq",
+            BigInteger,
+            nullable=False,
+            server_default=text(f"nextval('{ROW_CHANGE_SEQ.name}')"),
+        ),
+        Column("_xid", BigInteger, nullable=False, server_default=text(CURRENT_XID_SQL)),
+        Column("_version", Integer, nullable=False, server_default="1"),
+        Column(SEARCH_COLUMN, TSVECTOR, nullable=True),
+    ]
     for field in table.fields:
         col_type = SQLALCHEMY_TYPES_MAP[field.data_type]
         columns.append(
@@ -60,7 +228,13 @@ def get_sa_table(table: Table, metadata: MetaData) -> SATable:
                 field.name,
                 col_type,
                 nullable=field.is_nullable,
-                default=field.default_value,
+                # Defaults are kept as strings like filter values.
+                default=(
+                    parse_value(field.data_type, field.default_value)
+                    if field.default_value is not None
+                    else None
+                ),
+                primary_key=field.name == partition_key,
             ),
         )
 
@@ -69,7 +243,275 @@ def get_sa_table(table: Table, metadata: MetaData) -> SATable:
         metadata,
         *columns,
         extend_existing=True,
+        postgresql_partition_by=f"RANGE ({_quote(partition_key)})" if partition_key else None,
+    )
+
+
+_shared_sa_tables: TTLCache[tuple[Any, ...], SATable] = TTLCache(
+    maxsize=settings.sa_tables_cache_size,
+    ttl=math.inf,
+)
+watch_cache("sa_tables", _shared_sa_tables)
+
+# Lower bounds of committed partitions of partitioned tables, refreshed by
+# `maintain_partitions`. Another worker may drop expired partitions, the TTL
+# bounds how long that goes unnoticed.
+_known_partitions: TTLCache[int, set[PartitionStart]] = TTLCache(
+    maxsize=settings.table_cache_size,
+    ttl=settings.table_cache_ttl_s,
+)
+# Ids of tables whose partitions are being maintained in the background.
+_partitions_in_maintenance: set[int] = set()
+
+
+def get_shared_sa_table(table: Table) -> SATable:
+    """
+    SATable of a table, shared by all services of the worker.
+
+    SQLAlchemy caches compiled statements by their structure, which refers
+    to tables by identity: a new SATable per request would compile every
+    statement again and flood the cache. Tables are keyed by everything
+    `get_sa_table` uses, so a schema change gets a new SATable.
+    """
+    key = (
+        table.table_id,
+        table.name,
+        tuple((f.name, f.data_type, f.is_nullable, f.default_value) for f in table.fields),
+        table.partitioning.field_id if table.partitioning else None,
+    )
+    sa_table = _shared_sa_tables.get(key)
+    if sa_table is None:
+        sa_table = get_sa_table(table, MetaData())
+        _shared_sa_tables.set(key, sa_table)
+    return sa_table
+
+
+def get_row_columns(sa_table: SATable) -> list[Column[Any]]:
+    """Columns making up a row, without the search vector."""
+    return [c for c in sa_table.c if c.name != SEARCH_COLUMN]
+
+
+def get_search_trigger_ddl(table: Table) -> list[str]:
+    """
+    DDL of the trigger filling SEARCH_COLUMN from the table's STRING fields.
+
+    The vector is only recomputed when one of these fields changes.
+
+    :param table: table to create the trigger for.
+    :return: statements (re)creating the trigger function and the trigger.
+    """
+    string_fields = [
+        _quote(f.name) for f in table.fields if f.data_type is DataTypeEnum.STRING
+    ]
+    function_name = _quote(f"storage_{table.table_id}_search_vector")
+    table_name = _quote(table.name)
+    if not string_fields:
+        return [
+            f"DROP TRIGGER IF EXISTS search_vector ON {table_name}",
+            f"DROP FUNCTION IF EXISTS {function_name}()",
+        ]
+
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {function_name}() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.{SEARCH_COLUMN} := {get_search_vector_sql(table, "NEW.")};
+            RETURN NEW;
+        END
+        $$
+        """,
+        f"DROP TRIGGER IF EXISTS search_vector ON {table_name}",
+        f"""
+        CREATE TRIGGER search_vector
+        BEFORE INSERT OR UPDATE OF {", ".join(string_fields)} ON {table_name}
+        FOR EACH ROW EXECUTE FUNCTION {function_name}()
+        """,
+    ]
+
+
+def get_search_vector_sql(table: Table, prefix: str = "") -> str:
+    """Search vector of a row made of the table's STRING fields, NULL without any."""
+    document = ", ".join(
+        f"{prefix}{_quote(f.name)}" for f in table.fields if f.data_type is DataTypeEnum.STRING
     )
+    if not document:
+        return "NULL"
+    return f"to_tsvector('{settings.full_text_search_config}', concat_ws(' ', {document}))"
+
+
+def get_column_type_sql(data_type: DataTypeEnum) -> str:
+    return str(SQLALCHEMY_TYPES_MAP[data_type]().compile(dialect=pg_dialect()))
+
+
+def get_default_sql(field: UnSavedField) -> str:
+    """Default value of a field as an SQL literal."""
+    value = parse_value(field.data_type, cast(str, field.default_value))
+    return str(
+        literal(value, SQLALCHEMY_TYPES_MAP[field.data_type]()).compile(
+            dialect=pg_dialect(),
+            compile_kwargs={"literal_binds": True},
+        ),
+    )
+
+
+def get_conversion_sql(expression: str, data_type: DataTypeEnum) -> str:
+    """
+    SQL converting a value to another type through its text form.
+
+    Values that aren't valid input of the new type become NULL instead of
+    failing the statement, so writes racing a conversion don't fail on it.
+    `pg_input_is_valid` needs CONVERSION_SERVER_VERSION.
+    """
+    type_sql = get_column_type_sql(data_type)
+    as_text = f"CAST({expression} AS text)"
+    return (
+        f"CASE WHEN pg_input_is_valid({as_text}, '{type_sql}') "
+        f"THEN CAST({as_text} AS {type_sql}) END"
+    )
+
+
+def get_conversion_trigger_ddl(
+    table: Table,
+    conversions: dict[int, DataTypeEnum],
+) -> list[str]:
+    """
+    DDL of the trigger filling shadow columns of fields being converted.
+
+    :param table: table to create the trigger for.
+    :param conversions: new types of the fields by field id.
+    :return: statements (re)creating the trigger, or dropping it.
+    """
+    function_name = _quote(f"storage_{table.table_id}_convert_fields")
+    table_name = _quote(table.name)
+    if not conversions:
+        return [
+            f"DROP TRIGGER IF EXISTS convert_fields ON {table_name}",
+            f"DROP FUNCTION IF EXISTS {function_name}()",
+        ]
+
+    assignments = "\n".join(
+        f"NEW.{_quote(get_shadow_column(field.field_id))} := "
+        f"{get_conversion_sql(f'NEW.{_quote(field.name)}', conversions[field.field_id])};"
+        for field in table.fields
+        if field.field_id in conversions
+    )
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {function_name}() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            {assignments}
+            RETURN NEW;
+        END
+        $$
+        """,
+        f"DROP TRIGGER IF EXISTS convert_fields ON {table_name}",
+        f"""
+        CREATE TRIGGER convert_fields
+        BEFORE INSERT OR UPDATE ON {table_name}
+        FOR EACH ROW EXECUTE FUNCTION {function_name}()
+        """,
+    ]
+
+
+def get_change_tracking_upgrade_ddl(columns: dict[str, set[str]]) -> list[str]:
+    """
+    DDL adding columns missing from change tracking tables of older versions.
+
+    Columns are added with a constant default, which doesn't rewrite the
+    table: existing tombstones are older than any running transaction.
+
+    :param columns: column names of storage tables by table name.
+    :return: statements to run in one transaction, none if they're up to date.
+    """
+    ddl: list[str] = []
+    if "xid" not in columns.get(row_tombstones.name, {"xid"}):
+        ddl += [
+            f"ALTER TABLE {row_tombstones.name} "
+            "ADD COLUMN IF NOT EXISTS xid bigint NOT NULL DEFAULT 0",
+            f"ALTER TABLE {row_tombstones.name} ALTER COLUMN xid SET DEFAULT {CURRENT_XID_SQL}",
+            "DROP INDEX IF EXISTS ix_row_tombstones_table_id_seq",
+            "CREATE INDEX IF NOT EXISTS ix_row_tombstones_table_id_xid_seq "
+            f"ON {row_tombstones.name} (table_id, xid, seq)",
+        ]
+    if "xid" not in columns.get(row_tombstone_watermarks.name, {"xid"}):
+        ddl += [
+            f"ALTER TABLE {row_tombstone_watermarks.name} ALTER COLUMN seq SET DEFAULT 0",
+            f"ALTER TABLE {row_tombstone_watermarks.name} "
+            "ADD COLUMN IF NOT EXISTS xid bigint NOT NULL DEFAULT 0",
+        ]
+    return ddl
+
+
+def get_storage_upgrade_ddl(table: Table, columns: set[str]) -> list[str]:
+    """
+    DDL adding columns missing from a storage table of an older version.
+
+    :param table: table to upgrade.
+    :param columns: column names of its storage table.
+    :return: statements to run in one transaction, none if it's up to date.
+    """
+    table_name = _quote(table.name)
+    ddl: list[str] = []
+    if "_seq" not in columns:
+        # Existing rows get change numbers, so a fetch from the start returns them.
+        ddl += [
+            f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS _seq bigint NOT NULL "
+            f"DEFAULT nextval('{ROW_CHANGE_SEQ.name}')",
+            f"CREATE INDEX IF NOT EXISTS {_quote(f'ix_storage_{table.table_id}__seq')} "
+            f"ON {table_name} (_seq)",
+        ]
+    if "_xid" not in columns:
+        # Existing rows are older than any running transaction.
+        ddl += [
+            f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS _xid bigint NOT NULL DEFAULT 0",
+            f"ALTER TABLE {table_name} ALTER COLUMN _xid SET DEFAULT {CURRENT_XID_SQL}",
+            f"CREATE INDEX IF NOT EXISTS {_quote(f'ix_storage_{table.table_id}__xid_seq')} "
+            f"ON {table_name} (_xid, _seq)",
+        ]
+    if "_version" not in columns:
+        ddl.append(
+            f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS _version integer NOT NULL DEFAULT 1",
+        )
+    if SEARCH_COLUMN not in columns:
+        # Existing rows are backfilled before the index is created.
+        ddl.append(
+            f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {SEARCH_COLUMN} tsvector",
+        )
+        ddl += get_search_trigger_ddl(table)
+    return ddl
+
+
+async def _fetch_storage_indexes(conn: AsyncConnection) -> set[str]:
+    """Index names of the storage database."""
+    result = await conn.execute(
+        text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"),
+    )
+    return set(result.scalars().all())
+
+
+async def _fetch_storage_columns(conn: AsyncConnection) -> dict[str, set[str]]:
+    """Column names of tables in the storage database by table name."""
+    result = await conn.execute(
+        text(
+            "SELECT table_name, column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema()",
+        ),
+    )
+    columns: dict[str, set[str]] = {}
+    for table_name, column_name in result:
+        columns.setdefault(table_name, set()).add(column_name)
+    return columns
+
+
+def _get_search_query(search: str) -> Any:
+    return func.websearch_to_tsquery(settings.full_text_search_config, search)
+
+
+def _add_search_to_stmt(stmt: Select[T], sa_table: FromClause, search: str) -> Select[T]:
+    query = _get_search_query(search)
+    return stmt.where(sa_table.c[SEARCH_COLUMN].bool_op("@@")(query))
 
 
 def map_to_rows(table: Table, dict_rows: list[dict[str, Any]]) -> list[Row]:
@@ -95,27 +537,196 @@ def map_to_rows(table: Table, dict_rows: list[dict[str, Any]]) -> list[Row]:
             else:
                 val = BaseValue(raw_value)
             values.append(RowData(field_id=field.field_id, value=val))
-        rows.append(Row(table=table, row_id=d["id"], values=values))
+        rows.append(
+            Row(table=table, row_id=d["id"], values=values, version=d["_version"]),
+        )
     return rows
 
 
-T = TypeVar("T", bound=Any)
+def get_row_data(table: Table, values: list[RowData[BaseValue]]) -> dict[str, Any]:
+    row_data = {}
+    for rd in values:
+        field = table.get_field_by_id(rd.field_id)
+        if not field:
+            raise ValueError(
+                f"Field with id={rd.field_id} not found in table '{table.name}'",
+            )
+        row_data[field.name] = rd.value.value
+    return row_data
 
 
 def _add_ordering_params_to_stmt(
     stmt: Select[T],
+    sa_table: SATable,
+    table: Table,
     ordering_params: list[OrderingParam],
 ) -> Select[T]:
-    # TODO: Implement
-    return stmt
+    for param in ordering_params:
+        if param.field_id == 0:
+            col = sa_table.c.id
+        else:
+            field = table.get_field_by_id(param.field_id)
+            if not field:
+                raise ValueError(
+                    f"Field with id={param.field_id} not found in table '{table.name}'",
+                )
+            col = sa_table.c[field.name]
+        stmt = stmt.order_by(col.asc() if param.ascending else col.desc())
+    # Rows with equal values keep their order between pages.
+    return stmt.order_by(sa_table.c.id)
+
+
+def parse_value(data_type: DataTypeEnum, value: str) -> Any:
+    """Convert a value passed as string, e.g. in a filter, to the field type."""
+    if data_type in (DataTypeEnum.INT, DataTypeEnum.CHOICE):
+        return int(value)
+    if data_type is DataTypeEnum.FLOAT:
+        return float(value)
+    if data_type is DataTypeEnum.BOOL:
+        return value.lower() in ("true", "1")
+    if data_type is DataTypeEnum.DATETIME:
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+_COMPARISONS: Final = {
+    OperatorEnum.EQ: "__eq__",
+    OperatorEnum.NE: "__ne__",
+    OperatorEnum.LT: "__lt__",
+    OperatorEnum.LE: "__le__",
+    OperatorEnum.GT: "__gt__",
+    OperatorEnum.GE: "__ge__",
+}
+
+
+def _get_filter_condition(
+    sa_table: FromClause,
+    table: Table,
+    param: FilteringParam,
+) -> ColumnElement[bool]:
+    if param.field_id == 0:
+        col, data_type, has_trigram_index = sa_table.c.id, DataTypeEnum.INT, False
+    else:
+        field = table.get_field_by_id(param.field_id)
+        if not field:
+            raise ValueError(
+                f"Field with id={param.field_id} not found in table '{table.name}'",
+            )
+        col, data_type = sa_table.c[field.name], field.data_type
+        has_trigram_index = field.has_trigram_index
+
+    if param.operator in _COMPARISONS:
+        value = parse_value(data_type, param.value)
+        return cast(ColumnElement[bool], getattr(col, _COMPARISONS[param.operator])(value))
+
+    if data_type is not DataTypeEnum.STRING:
+        raise ValueError(f"Operator '{param.operator}' is only supported for strings")
+
+    # ILIKE with a pattern and `%` are what pg_trgm GIN indexes can serve,
+    # `lower(col) LIKE` as generated by icontains() would bypass them.
+    if param.operator is OperatorEnum.CONTAINS:
+        return col.ilike(f"%{_escape_like(param.value)}%", escape="\\")
+    if param.operator is OperatorEnum.STARTS_WITH:
+        return col.ilike(f"{_escape_like(param.value)}%", escape="\\")
+    # `%` comes with pg_trgm, which is only installed for trigram indexes.
+    if not has_trigram_index:
+        raise ValueError(f"Operator '{param.operator}' needs a field with a trigram index")
+    return col.bool_op("%")(param.value)
 
 
 def _add_filtering_params_to_stmt(
     stmt: Select[T],
+    sa_table: FromClause,
+    table: Table,
     filtering_params: list[FilteringParam],
 ) -> Select[T]:
-    # TODO: Implement
-    return stmt
+    return stmt.where(
+        or_(*(_get_filter_condition(sa_table, table, p) for p in filtering_params)),
+    )
+
+
+def _get_placeholder_value(field: Field) -> BaseValue:
+    """Any valid value of a field, for statements that are rolled back."""
+    if field.data_type is DataTypeEnum.INT:
+        return IntValue(0)
+    if field.data_type is DataTypeEnum.FLOAT:
+        return FloatValue(0.0)
+    if field.data_type is DataTypeEnum.BOOL:
+        return BoolValue(False)
+    if field.data_type is DataTypeEnum.DATETIME:
+        return DateTimeValue(datetime.datetime(2000, 1, 1))
+    if field.data_type is DataTypeEnum.CHOICE:
+        return ChoiceValue(field.choices[0].choice_id if field.choices else 0)
+    return StringValue("")
+
+
+def dump_row_change(change: RowChange) -> str:
+    return json.dumps(
+        {
+            "table_id": change.table_id,
+            "change_type": change.change_type.value,
+            "row_ids": change.row_ids,
+        },
+    )
+
+
+def load_row_change(payload: str) -> RowChange:
+    data = json.loads(payload)
+    return RowChange(
+        table_id=data["table_id"],
+        change_type=ChangeTypeEnum(data["change_type"]),
+        row_ids=data["row_ids"],
+    )
+
+
+def _get_operation_table(operation: BatchOperation) -> Table | None:
+    if isinstance(operation, DeleteRowsOperation):
+        return operation.table
+    return operation.rows[0].table if operation.rows else None
+
+
+async def _get_snapshot_xmin(conn: AsyncSession | AsyncConnection) -> int:
+    """Oldest transaction id still running, every older transaction is finished."""
+    result = await conn.execute(select(literal_column(SNAPSHOT_XMIN_SQL, BigInteger)))
+    return int(result.scalar_one())
+
+
+async def _check_conversions(
+    conn: AsyncConnection,
+    table: Table,
+    fields: list[Field],
+    conversions: dict[int, DataTypeEnum],
+) -> None:
+    """Raise ValueError if a value of the fields didn't convert to its new type."""
+    for field in fields:
+        lost = await conn.execute(
+            text(
+                f"SELECT EXISTS (SELECT FROM {_quote(table.name)} "
+                f"WHERE {_quote(field.name)} IS NOT NULL "
+                f"AND {_quote(get_shadow_column(field.field_id))} IS NULL)",
+            ),
+        )
+        if lost.scalar_one():
+            raise ValueError(
+                f"Values of field '{field.name}' can't be converted to "
+                f"{conversions[field.field_id].value}",
+            )
+
+
+def _get_resync_stmt(table_id: int) -> Any:
+    """Start a new generation of cursors of a table, so every client resyncs."""
+    stmt = pg_insert(row_tombstone_watermarks).values(
+        table_id=table_id,
+        seq=ROW_CHANGE_SEQ.next_value(),
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[row_tombstone_watermarks.c.table_id],
+        set_={"seq": stmt.excluded.seq},
+    )
 
 
 def map_table_model_to_domain(table_model: TableModel) -> Table:
@@ -129,9 +740,18 @@ def map_table_model_to_domain(table_model: TableModel) -> Table:
             is_nullable=f.is_nullable,
             default_value=f.default_value,
             choices=[FieldChoice(_choice_id=c.id, value=c.value) for c in f.choices],
+            has_trigram_index=f.has_trigram_index,
         )
         for f in table_model.fields
     ]
+    partitioning = None
+    if table_model.partition_field_id is not None:
+        partitioning = Partitioning(
+            field_id=table_model.partition_field_id,
+            id_range=table_model.partition_id_range or Partitioning.id_range,
+            period=table_model.partition_period or Partitioning.period,
+            retention=table_model.partition_retention,
+        )
 
     return Table(
         table_id=table_model.id,
@@ -139,6 +759,8 @@ def map_table_model_to_domain(table_model: TableModel) -> Table:
         fields=fields,
         verbose_name=table_model.verbose_name,
         description=table_model.description,
+        partitioning=partitioning,
+        shard=table_model.shard,
     )
 
 
@@ -148,12 +770,46 @@ class SqlAlchemyTablesService(AbstractTableService):
         db_session: AsyncSession,
         storage_db_session: AsyncSession,
         storage_engine: AsyncEngine,
+        table_cache: TTLCache[int, Table] | None = None,
+        shard_sessions: ShardSessions | None = None,
     ) -> None:
         self._db_session = db_session
         self._storage_db_session = storage_db_session
-        self._metadata = MetaData()
         self._storage_engine = storage_engine
+        # Tables by id, shared by services of the worker. Cached tables are
+        # copied both ways, callers are free to modify what they get.
+        self._table_cache = table_cache
+        # Sessions of other storage shards, the given storage session and
+        # engine are those of the default shard.
+        self._shard_sessions = shard_sessions
+
+    def _get_shards(self) -> list[str]:
+        if self._shard_sessions is None:
+            return [DEFAULT_SHARD]
+        return self._shard_sessions.shards.names
 
+    def _get_shard_session(self, shard: str) -> AsyncSession:
+        if shard == DEFAULT_SHARD:
+            return self._storage_db_session
+        if self._shard_sessions is None:
+            raise ValueError(f"Unknown storage shard '{shard}'")
+        return self._shard_sessions.get(shard)
+
+    def _get_shard_engine(self, shard: str) -> AsyncEngine:
+        if shard == DEFAULT_SHARD:
+            return self._storage_engine
+        if self._shard_sessions is None:
+            raise ValueError(f"Unknown storage shard '{shard}'")
+        return self._shard_sessions.shards.engine(shard)
+
+    def _get_storage_session(self, table: Table) -> AsyncSession:
+        """Session of the storage shard the table lives on."""
+        return self._get_shard_session(table.shard)
+
+    def _get_storage_engine(self, table: Table) -> AsyncEngine:
+        return self._get_shard_engine(table.shard)
+
+    @traced
     async def fetch_rows(
         self,
         table: Table,
@@ -161,26 +817,95 @@ class SqlAlchemyTablesService(AbstractTableService):
         offset: int = 0,
         ordering_params: list[OrderingParam] | None = None,
         filtering_params: list[FilteringParam] | None = None,
+        search: str | None = None,
     ) -> list[Row]:
-        sa_table = get_sa_table(table, self._metadata)
-        stmt = select(sa_table).limit(limit).offset(offset)
+        sa_table = get_shared_sa_table(table)
+        stmt = select(*get_row_columns(sa_table)).limit(limit).offset(offset)
 
-        if ordering_params:
-            stmt = _add_ordering_params_to_stmt(stmt, ordering_params)
+        if search:
+            rank = func.ts_rank(sa_table.c[SEARCH_COLUMN], _get_search_query(search))
+            stmt = _add_search_to_stmt(stmt, sa_table, search)
+            # Best matches first, ordering params break ties, then ids.
+            stmt = stmt.order_by(rank.desc())
+
+        if ordering_params or search:
+            stmt = _add_ordering_params_to_stmt(stmt, sa_table, table, ordering_params or [])
 
         if filtering_params:
-            stmt = _add_filtering_params_to_stmt(stmt, filtering_params)
+            stmt = _add_filtering_params_to_stmt(stmt, sa_table, table, filtering_params)
+
+        result = await self._get_storage_session(table).execute(stmt)
+        with tracer.start_span("map_to_rows"):
+            rows = map_to_rows(table, cast(list[dict[str, Any]], result.mappings().all()))
+        rows_read.labels(str(table.table_id)).inc(len(rows))
+        return rows
 
-        result = await self._storage_db_session.execute(stmt)
+    @traced
+    async def fetch_rows_by_ids(self, table: Table, row_ids: list[int]) -> list[Row]:
+        if not row_ids:
+            return []
+
+        sa_table = get_shared_sa_table(table)
+        stmt = (
+            select(*get_row_columns(sa_table))
+            .where(sa_table.c.id.in_(row_ids))
+            .order_by(sa_table.c.id)
+        )
+        result = await self._get_storage_session(table).execute(stmt)
         rows = map_to_rows(table, cast(list[dict[str, Any]], result.mappings().all()))
+        rows_read.labels(str(table.table_id)).inc(len(rows))
         return rows
 
+    async def _notify_row_changes(
+        self,
+        table: Table,
+        change_type: ChangeTypeEnum,
+        row_ids: list[int],
+    ) -> None:
+        """
+        Publish changed row ids to ROW_CHANGES_CHANNEL.
+
+        Notifications are queued in the current storage transaction, so
+        listeners only see them once the write is committed.
+        """
+        if not row_ids:
+            return
+
+        payloads = [
+            dump_row_change(
+                RowChange(
+                    table_id=table.table_id,
+                    change_type=change_type,
+                    row_ids=row_ids[i : i + ROW_CHANGES_CHUNK_SIZE],
+                ),
+            )
+            for i in range(0, len(row_ids), ROW_CHANGES_CHUNK_SIZE)
+        ]
+        stmt = text(
+            "SELECT pg_notify(:channel, payload) "
+            "FROM unnest(CAST(:payloads AS text[])) AS payload",
+        )
+        await self._get_storage_session(table).execute(
+            stmt,
+            {"channel": ROW_CHANGES_CHANNEL, "payloads": payloads},
+        )
+
+    @traced
     async def create_table(self, table: UnSavedTable) -> Table:
+        validate_partitioning(table)
+        partitioning = table.partitioning
         table_model = TableModel(
             name=table.name,
             verbose_name=table.verbose_name or table.name,
             description=table.description,
+            shard=await self._place_table(),
         )
+        if partitioning is not None:
+            # Set to the id of the partitioning field once it's saved.
+            table_model.partition_field_id = 0
+            table_model.partition_id_range = partitioning.id_range
+            table_model.partition_period = partitioning.period
+            table_model.partition_retention = partitioning.retention
         self._db_session.add(table_model)
         await self._db_session.flush()
 
@@ -192,11 +917,16 @@ class SqlAlchemyTablesService(AbstractTableService):
                 data_type=f.data_type,
                 is_nullable=f.is_nullable,
                 default_value=f.default_value,
+                has_trigram_index=(
+                    f.has_trigram_index and f.data_type is DataTypeEnum.STRING
+                ),
             )
             # N+1 problem, but it's ok for now
             # Hackathon style code :)))
             self._db_session.add(field_model)
             await self._db_session.flush()
+            if partitioning is not None and f.name == partitioning.field_name:
+                table_model.partition_field_id = field_model.id
 
             if f.data_type is DataTypeEnum.CHOICE:
                 for choice in f.choices:
@@ -207,16 +937,324 @@ class SqlAlchemyTablesService(AbstractTableService):
                     self._db_session.add(choice_model)
 
         await self._db_session.flush()
-        saved_table = await self.get_table_by_id(table_model.id)
+        # Not cached until committed, the caller may still roll it back.
+        saved_table = await self._load_table(table_model.id)
+        await self._create_storage_table(saved_table)
+        return saved_table  # type: ignore[return-value]
 
-        sa_table = get_sa_table(saved_table, self._metadata)
-        async with self._storage_engine.begin() as conn:
+    async def _place_table(self) -> str:
+        """Storage shard for a new table, the least loaded one."""
+        shards = self._get_shards()
+        if len(shards) == 1 or self._shard_sessions is None:
+            return shards[0]
+        return await self._shard_sessions.shards.get_least_loaded()
+
+    async def _create_storage_table(self, table: Table) -> None:
+        """Create the storage table of a table on its shard."""
+        # Indexes are attached to sa_table and created along with it, the
+        # shared one is left alone so it can be created again on another shard.
+        sa_table = get_sa_table(table, MetaData())
+        # Table names may be longer than identifiers, so they are named by id.
+        Index(f"ix_storage_{table.table_id}__seq", sa_table.c._seq)
+        Index(f"ix_storage_{table.table_id}__xid_seq", sa_table.c._xid, sa_table.c._seq)
+        Index(
+            f"ix_storage_{table.table_id}__search",
+            sa_table.c[SEARCH_COLUMN],
+            postgresql_using="gin",
+        )
+        async with self._get_storage_engine(table).begin() as conn:
+            await conn.run_sync(STORAGE_META.create_all)
             await conn.run_sync(sa_table.create)
+            for ddl in get_search_trigger_ddl(table):
+                await conn.execute(text(ddl))
+        if table.partitioning is not None:
+            await self.maintain_partitions(table)
 
-        return saved_table  # type: ignore[return-value]
+        for field in table.fields:
+            if field.has_trigram_index:
+                run_in_background(
+                    self.create_trigram_index(table, field),
+                    name=f"create trigram index of field {field.field_id}",
+                )
+
+    async def _drop_storage_table(self, table: Table) -> None:
+        """Drop the storage table of a table and its change tracking rows."""
+        async with self._get_storage_engine(table).begin() as conn:
+            await conn.execute(text(f"SET LOCAL lock_timeout = {settings.ddl_lock_timeout_ms}"))
+            await conn.run_sync(STORAGE_META.create_all)
+            await conn.execute(text(f"DROP TABLE IF EXISTS {_quote(table.name)}"))
+            await conn.execute(delete(row_tombstones).filter_by(table_id=table.table_id))
+            await conn.execute(
+                delete(row_tombstone_watermarks).filter_by(table_id=table.table_id),
+            )
+
+    @traced
+    async def move_table(self, table: Table, shard: str) -> Table:
+        """
+        Move the rows of a table to another storage shard.
 
+        The table stays readable and writable while its rows are copied in
+        batches by change number, changes made meanwhile are copied by the
+        following batches. Once fewer than `table_move_final_changes` are
+        left, writes to the table wait until the rest is copied and the table
+        is placed on the new shard. Writes of other workers that waited fail
+        once the old storage table is dropped, until they learn of the move.
+        Change numbers differ between shards, delta sync clients resync.
+
+        :param table: table to move.
+        :param shard: shard to move the table to.
+        :return: the moved table.
+        """
+        if shard == table.shard:
+            return table
+        target = dataclasses.replace(table, shard=shard)
+        target_engine = self._get_storage_engine(target)
+        table_name = _quote(table.name)
+        async with self._get_storage_engine(table).connect() as source:
+            locked = await source.scalar(
+                select(func.pg_try_advisory_lock(TABLE_MOVE_LOCK, table.table_id)),
+            )
+            await source.commit()
+            if not locked:
+                raise ValueError(f"Table '{table.name}' is already being moved")
+            placed = False
+            try:
+                # Left behind by a failed move, table names are unique.
+                await self._drop_storage_table(target)
+                await self._create_storage_table(target)
+                async with target_engine.connect() as dest:
+                    partitions = (
+                        set(await self._list_partitions(dest, target))
+                        if table.partitioning is not None
+                        else set()
+                    )
+                    cursor: ChangePosition = (0, 0)
+                    while True:
+                        cursor, copied, has_more = await self._copy_changes(
+                            source,
+                            dest,
+                            target,
+                            cursor,
+                            partitions,
+                        )
+                        await source.commit()
+                        await dest.commit()
+                        if not has_more and copied < settings.table_move_final_changes:
+                            break
+
+                    await source.execute(
+                        text(f"SET LOCAL lock_timeout = {settings.ddl_lock_timeout_ms}"),
+                    )
+                    await source.execute(text(f"LOCK TABLE {table_name} IN EXCLUSIVE MODE"))
+                    # Batches only read finished transactions, so writes that
+                    # were in flight are all after the cursor.
+                    has_more = True
+                    while has_more:
+                        cursor, _, has_more = await self._copy_changes(
+                            source,
+                            dest,
+                            target,
+                            cursor,
+                            partitions,
+                            is_locked=True,
+                        )
+                    await self._copy_sequences(source, dest, table)
+                    await dest.execute(_get_resync_stmt(table.table_id))
+                    await dest.commit()
+
+                    await self._db_session.execute(
+                        update(TableModel).filter_by(id=table.table_id).values(shard=shard),
+                    )
+                    await self._invalidate_table(table.table_id)
+                    await self._db_session.commit()
+                    placed = True
+                    _known_partitions.pop(table.table_id)
+
+                await source.execute(text(f"DROP TABLE {table_name}"))
+                await source.execute(delete(row_tombstones).filter_by(table_id=table.table_id))
+                await source.execute(
+                    delete(row_tombstone_watermarks).filter_by(table_id=table.table_id),
+                )
+                await source.commit()
+            except BaseException:
+                await source.rollback()
+                if not placed:
+                    await self._drop_storage_table(target)
+                raise
+            finally:
+                await source.execute(
+                    select(func.pg_advisory_unlock(TABLE_MOVE_LOCK, table.table_id)),
+                )
+                await source.commit()
+        return await self.get_table_by_id(table.table_id)  # type: ignore[return-value]
+
+    async def _copy_changes(
+        self,
+        source: AsyncConnection,
+        dest: AsyncConnection,
+        table: Table,
+        since: ChangePosition,
+        partitions: set[PartitionStart],
+        is_locked: bool = False,
+    ) -> tuple[ChangePosition, int, bool]:
+        """
+        Copy a batch of changes of a table after `since` to another shard.
+
+        :param is_locked: writes to the table wait, so no transaction that
+            changed it is running and all committed changes can be copied.
+        :return: cursor of the batch, number of changes copied and whether
+            more are left.
+        """
+        sa_table = get_shared_sa_table(table)
+        before_xid = None if is_locked else await _get_snapshot_xmin(source)
+        changes, has_more = await self._fetch_change_batch(
+            source,
+            sa_table,
+            table,
+            since,
+            settings.table_move_batch_size,
+            before_xid,
+        )
+        if not changes:
+            return since, 0, False
+
+        # Rows are written again with their ids and versions, deleted ones
+        # are only removed: tombstones of the source don't apply after a move.
+        row_ids = [d["id"] if d is not None else i for _, d, i in changes]
+        values = [
+            {k: v for k, v in d.items() if k not in ("_seq", "_xid")}
+            for _, d, _ in changes
+            if d is not None
+        ]
+        await dest.execute(delete(sa_table).where(sa_table.c.id.in_(row_ids)))
+        if values:
+            if table.partitioning is not None:
+                key = get_partition_key(table)
+                for start in {get_partition_start(table.partitioning, v[key]) for v in values}:
+                    if start not in partitions:
+                        await dest.execute(text(get_partition_ddl(table, start)))
+                        partitions.add(start)
+            await dest.execute(insert(sa_table), values)
+        return changes[-1][0], len(changes), has_more
+
+    async def _copy_sequences(
+        self,
+        source: AsyncConnection,
+        dest: AsyncConnection,
+        table: Table,
+    ) -> None:
+        """Advance sequences of a moved table past their values on the source."""
+        stmt = text("SELECT pg_sequence_last_value(CAST(:name AS regclass))")
+        id_sequence = await source.scalar(
+            text("SELECT pg_get_serial_sequence(:name, 'id')"),
+            {"name": _quote(table.name)},
+        )
+        last_id = await source.scalar(stmt, {"name": id_sequence})
+        if last_id is not None:
+            await dest.execute(
+                text("SELECT setval(pg_get_serial_sequence(:name, 'id'), :value)"),
+                {"name": _quote(table.name), "value": last_id},
+            )
+        # Changes on the new shard are numbered after those on the old one,
+        # so cursors of clients are behind the watermark and get resync.
+        last_seq = await source.scalar(stmt, {"name": ROW_CHANGE_SEQ.name})
+        await dest.execute(
+            text(
+                "SELECT setval(CAST(:name AS regclass), greatest("
+                "pg_sequence_last_value(CAST(:name AS regclass)), :value, 1))",
+            ),
+            {"name": ROW_CHANGE_SEQ.name, "value": last_seq},
+        )
+
+    @traced
+    async def create_trigram_index(self, table: Table, field: Field) -> None:
+        """
+        Build a pg_trgm GIN index on a STRING field without blocking writes.
+
+        CREATE INDEX CONCURRENTLY can't run in a transaction and takes a while
+        on large tables, so it's meant to be run in the background.
+        Partitioned tables can't be indexed concurrently, their index is
+        built right after the table is created, while it's still empty.
+        """
+        index_name = _quote(f"ix_storage_{table.table_id}_{field.field_id}_trgm")
+        async with self._get_storage_engine(table).connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            if table.partitioning is not None:
+                await conn.execute(
+                    text(
+                        f"CREATE INDEX IF NOT EXISTS {index_name} ON {_quote(table.name)} "
+                        f"USING gin ({_quote(field.name)} gin_trgm_ops)",
+                    ),
+                )
+                return
+            try:
+                await conn.execute(
+                    text(
+                        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} "
+                        f"ON {_quote(table.name)} "
+                        f"USING gin ({_quote(field.name)} gin_trgm_ops)",
+                    ),
+                )
+            except Exception:
+                # A failed concurrent build leaves an invalid index behind.
+                await conn.execute(
+                    text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"),
+                )
+                raise
+
+    @traced
+    async def autocomplete(
+        self,
+        table: Table,
+        field: Field,
+        prefix: str,
+        limit: int = 10,
+    ) -> list[str]:
+        """
+        Most frequent values of a STRING field starting with `prefix`.
+
+        :param table: table to search in.
+        :param field: STRING field of the table.
+        :param prefix: case-insensitive prefix of the values.
+        :param limit: maximum number of values to return.
+        :return: distinct values, most frequent first.
+        """
+        if field.data_type is not DataTypeEnum.STRING:
+            raise ValueError("Autocomplete is only supported for string fields")
+
+        sa_table = get_shared_sa_table(table)
+        col = sa_table.c[field.name]
+        condition = _get_filter_condition(
+            sa_table,
+            table,
+            FilteringParam(field.field_id, prefix, OperatorEnum.STARTS_WITH),
+        )
+        stmt = (
+            select(col)
+            .where(condition)
+            .group_by(col)
+            .order_by(func.count().desc(), col)
+            .limit(limit)
+        )
+        result = await self._get_storage_session(table).execute(stmt)
+        return list(result.scalars().all())
+
+    @traced
     async def get_table_by_id(self, table_id: int) -> Table:
         """Возвращает доменную модель таблицы по её ID."""
+        note_table(table_id)
+        if self._table_cache is not None:
+            cached = self._table_cache.get(table_id)
+            if cached is not None:
+                return copy.deepcopy(cached)
+
+        table = await self._load_table(table_id)
+        if self._table_cache is not None:
+            self._table_cache.set(table_id, copy.deepcopy(table))
+        return table
+
+    async def _load_table(self, table_id: int) -> Table:
         stmt = (
             select(TableModel)
             .filter_by(id=table_id)
@@ -226,9 +1264,92 @@ class SqlAlchemyTablesService(AbstractTableService):
         table_model: TableModel | None = result.scalar_one_or_none()
         if not table_model:
             raise ValueError("There is no such table with id=%s" % table_id)
-
         return map_table_model_to_domain(table_model)
 
+    async def _invalidate_table(self, table_id: int, types_changed: bool = False) -> None:
+        """
+        Drop a table from caches of all workers.
+
+        Other workers are notified once the metadata transaction commits.
+
+        :param table_id: id of the changed table.
+        :param types_changed: whether column types of the table changed, so
+            workers must also prepare statements again.
+        """
+        if self._table_cache is not None:
+            self._table_cache.pop(table_id)
+        payload = f"{table_id}{COLUMN_TYPES_CHANGED}" if types_changed else str(table_id)
+        await self._db_session.execute(
+            select(func.pg_notify(TABLE_CHANGES_CHANNEL, payload)),
+        )
+
+    @traced
+    async def fetch_recent_tables(self, limit: int) -> list[Table]:
+        """
+        Tables most recently opened for editing, then the newest ones.
+
+        :param limit: maximum number of tables to return.
+        """
+        last_used = (
+            select(
+                EditSessionModel.table_id,
+                func.max(EditSessionModel.created_at).label("last_used_at"),
+            )
+            .group_by(EditSessionModel.table_id)
+            .subquery()
+        )
+        stmt = (
+            select(TableModel)
+            .outerjoin(last_used, last_used.c.table_id == TableModel.id)
+            .where(TableModel.is_delete.is_(False))
+            .order_by(last_used.c.last_used_at.desc().nulls_last(), TableModel.id.desc())
+            .limit(limit)
+            .options(selectinload(TableModel.fields).selectinload(FieldModel.choices))
+        )
+        result = await self._db_session.execute(stmt)
+        tables = [map_table_model_to_domain(tm) for tm in result.scalars().all()]
+        if self._table_cache is not None:
+            for table in tables:
+                self._table_cache.set(table.table_id, copy.deepcopy(table))
+        return tables
+
+    @traced
+    async def warm_up_statements(self, table: Table) -> None:
+        """
+        Run the usual row statements of a table once, so they are compiled.
+
+        Writes are rolled back, they only cost a few sequence values. They are
+        skipped for tables partitioned by a field, the placeholder values would
+        lock the table to create a partition for them.
+
+        :param table: table to warm up statements of.
+        """
+        sa_table = get_shared_sa_table(table)
+        await self.fetch_rows(table, limit=1)
+        await self.count_rows(table)
+        if table.partitioning is not None and table.partitioning.field_id != 0:
+            return
+
+        values: list[RowData[BaseValue]] = [
+            RowData(f.field_id, _get_placeholder_value(f)) for f in table.fields
+        ]
+        storage_session = self._get_storage_session(table)
+        savepoint = await storage_session.begin_nested()
+        try:
+            # Single and multi-row inserts are compiled separately.
+            await self._insert_rows([InsertRow(table, values)])
+            rows = await self._insert_rows([InsertRow(table, values)] * 2)
+            await self._update_rows([UpdateRow(table, r.row_id, values) for r in rows])
+            await self._delete_rows(table, [r.row_id for r in rows])
+            await storage_session.execute(
+                select(*get_row_columns(sa_table)).where(
+                    sa_table.c.id.in_([r.row_id for r in rows]),
+                ),
+            )
+        finally:
+            await savepoint.rollback()
+
+    @traced
     async def update_table(self, table: Table) -> Table:
         """Обновляет метаданные таблицы."""
         stmt = (
@@ -242,86 +1363,1198 @@ class SqlAlchemyTablesService(AbstractTableService):
             .returning(TableModel.id)
         )
         await self._db_session.execute(stmt)
+        await self._invalidate_table(table.table_id)
         await self._db_session.commit()
         return await self.get_table_by_id(table.table_id)  # type: ignore[return-value]
 
-    async def delete_rows(self, table: Table, row_ids: list[int]) -> None:
-        sa_table = get_sa_table(table, self._metadata)
-        stmt = delete(sa_table).where(sa_table.c.id.in_(row_ids))
-        await self._storage_db_session.execute(stmt)
-        await self._storage_db_session.commit()
+    async def _get_converting_field_ids(self, conn: AsyncConnection, table: Table) -> set[int]:
+        """Ids of fields of a table whose values are being converted to another type."""
+        result = await conn.execute(
+            text(
+                "SELECT attname FROM pg_attribute "
+                "WHERE attrelid = to_regclass(:name) AND attnum > 0 AND NOT attisdropped",
+            ),
+            {"name": _quote(table.name)},
+        )
+        return {
+            field_id
+            for name in result.scalars().all()
+            if (field_id := parse_shadow_column(name)) is not None
+        }
+
+    @traced
+    async def alter_fields(
+        self,
+        table: Table,
+        fields: list[Field | UnSavedField],
+    ) -> SchemaChange:
+        """
+        Add, change and drop fields so the table has exactly `fields`.
+
+        Unsaved fields are added, fields of the table missing from `fields`
+        are dropped and choices are added by value. Storage changes are made
+        by a single ALTER TABLE that only changes the catalog: added columns
+        get their default without rewriting rows and drops leave the data to
+        be reclaimed by later writes. Existing rows of fields made required
+        are checked beforehand without blocking writes.
+
+        Values of fields changing type are converted into shadow columns
+        kept up to date by a trigger, `finish_schema_change` fills them for
+        existing rows and swaps them in. Until then the fields keep their type.
+
+        :param table: table to alter.
+        :param fields: fields the table should have.
+        :return: the altered table and what's left to finish.
+        """
+        result = await self._db_session.execute(
+            select(TableModel)
+            .filter_by(id=table.table_id)
+            .options(selectinload(TableModel.fields).selectinload(FieldModel.choices))
+            .with_for_update()
+            .execution_options(populate_existing=True),
+        )
+        table_model = result.scalar_one_or_none()
+        if table_model is None:
+            raise ValueError("There is no such table with id=%s" % table.table_id)
+        current = map_table_model_to_domain(table_model)
+        table_name = _quote(current.name)
+        engine = self._get_storage_engine(current)
+        async with engine.connect() as conn:
+            converting = await self._get_converting_field_ids(conn, current)
+            server_version = await conn.scalar(text("SHOW server_version_num"))
+        validate_field_changes(current, fields, converting)
+        added, changed, dropped = diff_fields(current, fields)
+        if int(server_version) < CONVERSION_SERVER_VERSION and any(
+            new.data_type is not old.data_type for old, new in changed
+        ):
+            raise ValueError("Converting fields to another type needs PostgreSQL 16 or later")
+        savepoint = await self._db_session.begin_nested()
+
+        field_models = {f.id: f for f in table_model.fields}
+        for old, new in changed:
+            field_model = field_models[old.field_id]
+            field_model.name = new.name
+            field_model.verbose_name = new.verbose_name
+            field_model.is_nullable = new.is_nullable
+            field_model.default_value = new.default_value
+            choice_values = {c.value for c in old.choices}
+            for choice in new.choices:
+                if choice.value not in choice_values:
+                    field_model.choices.append(FieldChoiceModel(value=choice.value))
+        for field in dropped:
+            table_model.fields.remove(field_models[field.field_id])
+        for new_field in added:
+            table_model.fields.append(
+                FieldModel(
+                    name=new_field.name,
+                    verbose_name=new_field.verbose_name,
+                    data_type=new_field.data_type,
+                    is_nullable=new_field.is_nullable,
+                    default_value=new_field.default_value,
+                    has_trigram_index=(
+                        new_field.has_trigram_index
+                        and new_field.data_type is DataTypeEnum.STRING
+                    ),
+                    choices=[
+                        FieldChoiceModel(value=c.value)
+                        for c in new_field.choices
+                        if new_field.data_type is DataTypeEnum.CHOICE
+                    ],
+                ),
+            )
+        await self._db_session.flush()
+        altered = map_table_model_to_domain(table_model)
+
+        conversions = {
+            old.field_id: new.data_type
+            for old, new in changed
+            if new.data_type is not old.data_type
+        }
+        # Required fields are checked by a constraint validated without
+        # blocking writes, SET NOT NULL then skips scanning the table.
+        required = [
+            old
+            for old, new in changed
+            if old.is_nullable and not new.is_nullable and old.field_id not in conversions
+        ]
+        subcommands: list[str] = []
+        statements: list[str] = []
+        for new_field in added:
+            column = f"{_quote(new_field.name)} {get_column_type_sql(new_field.data_type)}"
+            if new_field.default_value is not None:
+                # Existing rows get the default without being rewritten, new
+                # ones get it from the application like in other columns.
+                column += f" DEFAULT {get_default_sql(new_field)}"
+                statements.append(
+                    f"ALTER TABLE {table_name} ALTER COLUMN {_quote(new_field.name)} DROP DEFAULT",
+                )
+            if not new_field.is_nullable:
+                column += " NOT NULL"
+            subcommands.append(f"ADD COLUMN {column}")
+        for field in dropped:
+            subcommands.append(f"DROP COLUMN {_quote(field.name)}")
+        for old, new in changed:
+            name = _quote(old.name)
+            if old.field_id in conversions:
+                shadow = _quote(get_shadow_column(old.field_id))
+                subcommands.append(
+                    f"ADD COLUMN {shadow} {get_column_type_sql(new.data_type)}",
+                )
+            elif new.is_nullable and not old.is_nullable:
+                subcommands.append(f"ALTER COLUMN {name} DROP NOT NULL")
+            elif old in required:
+                constraint = _quote(get_not_null_constraint(current, old.field_id))
+                subcommands.append(f"ALTER COLUMN {name} SET NOT NULL")
+                statements.append(f"ALTER TABLE {table_name} DROP CONSTRAINT {constraint}")
+            if new.name != old.name:
+                statements.append(
+                    f"ALTER TABLE {table_name} RENAME COLUMN {name} TO {_quote(new.name)}",
+                )
+
+        # Rows read by this unit of work would hold off the schema change.
+        await self._get_storage_session(current).commit()
+        try:
+            if required:
+                await self._check_required(current, required)
+            # Metadata is committed before the DDL, which is rolled back if
+            # that fails: storage never has columns metadata doesn't know of.
+            async with engine.begin() as conn:
+                await conn.execute(
+                    text(f"SET LOCAL lock_timeout = {settings.ddl_lock_timeout_ms}"),
+                )
+                # The trigger depends on the columns it's fired by.
+                await conn.execute(text(f"DROP TRIGGER IF EXISTS search_vector ON {table_name}"))
+                if subcommands:
+                    await conn.execute(
+                        text(f"ALTER TABLE {table_name} {', '.join(subcommands)}"),
+                    )
+                for statement in statements:
+                    await conn.execute(text(statement))
+                ddl = get_search_trigger_ddl(altered)
+                if conversions:
+                    ddl += get_conversion_trigger_ddl(altered, conversions)
+                for statement in ddl:
+                    await conn.execute(text(statement))
+                await savepoint.commit()
+                await self._invalidate_table(altered.table_id)
+                await self._db_session.commit()
+        except BaseException:
+            if savepoint.is_active:
+                await savepoint.rollback()
+            else:
+                await self._db_session.rollback()
+            if required:
+                await self._drop_not_null_constraints(current, required)
+            raise
+
+        for field in altered.fields:
+            if field.has_trigram_index and field.name in {f.name for f in added}:
+                run_in_background(
+                    self.create_trigram_index(altered, field),
+                    name=f"create trigram index of field {field.field_id}",
+                )
+
+        return SchemaChange(
+            table=altered,
+            conversions=conversions,
+            # Rows get the search vector of an added field's default only
+            # once rewritten, renames change nothing in vectors.
+            reindex_search=any(f.data_type is DataTypeEnum.STRING for f in dropped)
+            or any(
+                f.data_type is DataTypeEnum.STRING and f.default_value is not None
+                for f in added
+            ),
+        )
+
+    async def _check_required(self, table: Table, fields: list[Field]) -> None:
+        """Raise ValueError if any existing row has no value of a field."""
+        table_name = _quote(table.name)
+        async with self._get_storage_engine(table).connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"SET lock_timeout = {settings.ddl_lock_timeout_ms}"))
+            try:
+                for field in fields:
+                    constraint = _quote(get_not_null_constraint(table, field.field_id))
+                    await conn.execute(
+                        text(
+                            f"ALTER TABLE {table_name} ADD CONSTRAINT {constraint} "
+                            f"CHECK ({_quote(field.name)} IS NOT NULL) NOT VALID",
+                        ),
+                    )
+                    # Validation scans the table while letting writes through.
+                    try:
+                        await conn.execute(
+                            text(f"ALTER TABLE {table_name} VALIDATE CONSTRAINT {constraint}"),
+                        )
+                    except IntegrityError:
+                        raise ValueError(f"Field '{field.name}' is empty in some rows") from None
+            finally:
+                await conn.execute(text("RESET lock_timeout"))
+
+    async def _drop_not_null_constraints(self, table: Table, fields: list[Field]) -> None:
+        async with self._get_storage_engine(table).begin() as conn:
+            for field in fields:
+                constraint = _quote(get_not_null_constraint(table, field.field_id))
+                await conn.execute(
+                    text(
+                        f"ALTER TABLE {_quote(table.name)} "
+                        f"DROP CONSTRAINT IF EXISTS {constraint}",
+                    ),
+                )
+
+    async def _backfill(self, table: Table, assignments: str) -> None:
+        """
+        Rewrite existing rows of a table in batches of ids, committing each.
+
+        Rows inserted meanwhile are left alone, they're written right by triggers.
+
+        :param table: table to rewrite.
+        :param assignments: SET clause of the UPDATE.
+        """
+        table_name = _quote(table.name)
+        async with self._get_storage_engine(table).connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            last_id = await conn.scalar(text(f"SELECT max(id) FROM {table_name}"))
+            after = 0
+            while last_id is not None and after < last_id:
+                result = await conn.execute(
+                    text(
+                        f"UPDATE {table_name} SET {assignments} WHERE id IN ("
+                        f"SELECT id FROM {table_name} WHERE id > :after AND id <= :last "
+                        "ORDER BY id LIMIT :limit) RETURNING id",
+                    ),
+                    {"after": after, "last": last_id, "limit": settings.schema_change_batch_size},
+                )
+                row_ids = result.scalars().all()
+                if not row_ids:
+                    break
+                after = max(row_ids)
+
+    @traced
+    async def finish_schema_change(self, change: SchemaChange) -> Table:
+        """
+        Convert values of fields changing type and reindex search of rows.
+
+        Existing rows are rewritten in batches while the table stays
+        writable. Converted values then replace those of the fields in a
+        single short transaction, and delta sync clients are asked to resync.
+        A conversion is undone if any value can't be converted.
+
+        :param change: result of `alter_fields`.
+        :return: the table with its fields converted.
+        """
+        table = change.table
+        reindex_search = change.reindex_search
+        if change.conversions:
+            string_fields = {
+                f.field_id for f in table.fields if f.data_type is DataTypeEnum.STRING
+            }
+            table = await self._convert_fields(table, change.conversions)
+            reindex_search = reindex_search or any(
+                (field_id in string_fields) != (data_type is DataTypeEnum.STRING)
+                for field_id, data_type in change.conversions.items()
+            )
+        if reindex_search:
+            await self._backfill(table, f"{SEARCH_COLUMN} = {get_search_vector_sql(table)}")
+        return table
+
+    async def _convert_fields(
+        self,
+        table: Table,
+        conversions: dict[int, DataTypeEnum],
+    ) -> Table:
+        fields = [f for f in table.fields if f.field_id in conversions]
+        required = [f for f in fields if not f.is_nullable]
+        table_name = _quote(table.name)
+        engine = self._get_storage_engine(table)
+        converted = copy.deepcopy(table)
+        for field in converted.fields:
+            if field.field_id in conversions:
+                field.data_type = conversions[field.field_id]
+                field.has_trigram_index = False
+
+        await self._get_storage_session(table).commit()
+        try:
+            await self._backfill(
+                table,
+                ", ".join(
+                    f"{_quote(get_shadow_column(f.field_id))} = "
+                    f"{get_conversion_sql(_quote(f.name), conversions[f.field_id])}"
+                    for f in fields
+                ),
+            )
+            async with engine.connect() as conn:
+                await _check_conversions(conn, table, fields, conversions)
+                await conn.commit()
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(text(f"SET lock_timeout = {settings.ddl_lock_timeout_ms}"))
+                # Only now, values written before couldn't have been rejected.
+                for field in required:
+                    shadow = _quote(get_shadow_column(field.field_id))
+                    constraint = _quote(get_not_null_constraint(table, field.field_id))
+                    await conn.execute(
+                        text(
+                            f"ALTER TABLE {table_name} ADD CONSTRAINT {constraint} "
+                            f"CHECK ({shadow} IS NOT NULL) NOT VALID",
+                        ),
+                    )
+                    try:
+                        await conn.execute(
+                            text(f"ALTER TABLE {table_name} VALIDATE CONSTRAINT {constraint}"),
+                        )
+                    except IntegrityError:
+                        raise ValueError(
+                            f"Values of field '{field.name}' can't be converted to "
+                            f"{conversions[field.field_id].value}",
+                        ) from None
+                await conn.execute(text("RESET lock_timeout"))
+
+            async with engine.begin() as conn:
+                await conn.execute(
+                    text(f"SET LOCAL lock_timeout = {settings.ddl_lock_timeout_ms}"),
+                )
+                # Writes committed since the check were converted by the trigger,
+                # which can't reject values, so they are checked again with
+                # writes locked out until the swap commits.
+                await conn.execute(text(f"LOCK TABLE {table_name} IN SHARE ROW EXCLUSIVE MODE"))
+                await _check_conversions(conn, table, fields, conversions)
+                await conn.execute(text(f"DROP TRIGGER IF EXISTS search_vector ON {table_name}"))
+                for statement in get_conversion_trigger_ddl(table, {}):
+                    await conn.execute(text(statement))
+                subcommands = [f"DROP COLUMN {_quote(f.name)}" for f in fields] + [
+                    f"ALTER COLUMN {_quote(get_shadow_column(f.field_id))} SET NOT NULL"
+                    for f in required
+                ]
+                await conn.execute(text(f"ALTER TABLE {table_name} {', '.join(subcommands)}"))
+                for field in fields:
+                    await conn.execute(
+                        text(
+                            f"ALTER TABLE {table_name} RENAME COLUMN "
+                            f"{_quote(get_shadow_column(field.field_id))} TO {_quote(field.name)}",
+                        ),
+                    )
+                for field in required:
+                    constraint = _quote(get_not_null_constraint(table, field.field_id))
+                    await conn.execute(
+                        text(f"ALTER TABLE {table_name} DROP CONSTRAINT {constraint}"),
+                    )
+                for statement in get_search_trigger_ddl(converted):
+                    await conn.execute(text(statement))
+                # Values of all rows changed without new change numbers.
+                await conn.execute(_get_resync_stmt(table.table_id))
+        except BaseException:
+            await self._undo_conversions(table, fields)
+            await self._drop_not_null_constraints(table, required)
+            raise
+
+        invalidate_prepared_statements(engine)
+        for field in fields:
+            await self._db_session.execute(
+                update(FieldModel)
+                .filter_by(id=field.field_id)
+                .values(data_type=conversions[field.field_id], has_trigram_index=False),
+            )
+        await self._invalidate_table(table.table_id, types_changed=True)
+        await self._db_session.commit()
+        return converted
+
+    async def _undo_conversions(self, table: Table, fields: list[Field]) -> None:
+        """Drop shadow columns of fields and the trigger filling them."""
+        table_name = _quote(table.name)
+        async with self._get_storage_engine(table).begin() as conn:
+            await conn.execute(text(f"SET LOCAL lock_timeout = {settings.ddl_lock_timeout_ms}"))
+            for statement in get_conversion_trigger_ddl(table, {}):
+                await conn.execute(text(statement))
+            subcommands = [
+                f"DROP COLUMN IF EXISTS {_quote(get_shadow_column(f.field_id))}" for f in fields
+            ]
+            await conn.execute(text(f"ALTER TABLE {table_name} {', '.join(subcommands)}"))
+
+    @traced
+    async def delete_rows(
+        self,
+        table: Table,
+        row_ids: list[int],
+        expected_versions: dict[int, int] | None = None,
+    ) -> list[int]:
+        deleted_ids = await self._delete_rows(table, row_ids, expected_versions)
+        await self._get_storage_session(table).commit()
+        return deleted_ids
+
+    async def _delete_rows(
+        self,
+        table: Table,
+        row_ids: list[int],
+        expected_versions: dict[int, int] | None = None,
+    ) -> list[int]:
+        if not row_ids:
+            return []
 
+        sa_table = get_shared_sa_table(table)
+        stmt = delete(sa_table).returning(sa_table.c.id)
+        if expected_versions:
+            checks = values(
+                column("_id", Integer),
+                column("_expected_version", Integer),
+                name="checks",
+            ).data([(i, expected_versions.get(i)) for i in row_ids])
+            # NULLs in VALUES are untyped, so they are cast where used.
+            expected_version = sa_cast(checks.c._expected_version, Integer)
+            stmt = stmt.where(
+                sa_table.c.id == checks.c._id,
+                or_(
+                    expected_version.is_(None),
+                    sa_table.c._version == expected_version,
+                ),
+            )
+        else:
+            stmt = stmt.where(sa_table.c.id.in_(row_ids))
+        storage_session = self._get_storage_session(table)
+        result = await storage_session.execute(stmt)
+        deleted_ids = list(result.scalars().all())
+        rows_written.labels(str(table.table_id), "delete").inc(len(deleted_ids))
+        if deleted_ids:
+            await storage_session.execute(
+                insert(row_tombstones),
+                [{"table_id": table.table_id, "row_id": i} for i in deleted_ids],
+            )
+        await self._notify_row_changes(table, ChangeTypeEnum.DELETE, deleted_ids)
+        return deleted_ids
+
+    @traced
     async def insert_rows(self, rows: list[InsertRow]) -> list[Row]:
+        inserted_rows = await self._insert_rows(rows)
+        if rows:
+            await self._get_storage_session(rows[0].table).commit()
+        return inserted_rows
+
+    async def _insert_rows(self, rows: list[InsertRow]) -> list[Row]:
         if not rows:
             return []
 
         table = rows[0].table
-        sa_table = get_sa_table(table, self._metadata)
+        sa_table = get_shared_sa_table(table)
 
-        insert_values = []
-        for r in rows:
-            row_data = {}
-            for rd in r.values:
-                field = table.get_field_by_id(rd.field_id)
-                if not field:
-                    raise ValueError(
-                        f"Field with id={rd.field_id} not found in table '{table.name}'",
-                    )
-                row_data[field.name] = rd.value.value
-            insert_values.append(row_data)
+        insert_values = [get_row_data(table, r.values) for r in rows]
+        await self._create_missing_partitions(table, insert_values)
 
-        stmt = sa_table.insert().returning(sa_table)
-        result = await self._storage_db_session.execute(stmt, insert_values)
-        await self._storage_db_session.commit()
-
-        return map_to_rows(table, cast(list[dict[str, Any]], result.mappings().all()))
+        stmt = sa_table.insert().returning(*get_row_columns(sa_table))
+        result = await self._get_storage_session(table).execute(stmt, insert_values)
+        inserted_rows = map_to_rows(
+            table,
+            cast(list[dict[str, Any]], result.mappings().all()),
+        )
+        rows_written.labels(str(table.table_id), "insert").inc(len(inserted_rows))
+        if inserted_rows:
+            self._maintain_partitions_if_filled(table, max(r.row_id for r in inserted_rows))
+        await self._notify_row_changes(
+            table,
+            ChangeTypeEnum.INSERT,
+            [r.row_id for r in inserted_rows],
+        )
+        return inserted_rows
 
+    @traced
     async def update_rows(self, rows: list[UpdateRow]) -> list[Row]:
+        updated_rows = await self._update_rows(rows)
+        if rows:
+            await self._get_storage_session(rows[0].table).commit()
+        return updated_rows
+
+    async def _update_rows(self, rows: list[UpdateRow]) -> list[Row]:
         if not rows:
             return []
 
         table = rows[0].table
-        sa_table = get_sa_table(table, self._metadata)
-
-        updated_rows: list[Row] = []
+        sa_table = get_shared_sa_table(table)
+        seen_ids: set[int] = set()
+        for r in rows:
+            # A second update of a row would fail its version check or be lost.
+            if r.row_id in seen_ids:
+                raise ValueError(f"Row with ID '{r.row_id}' is updated more than once")
+            seen_ids.add(r.row_id)
 
+        # Rows setting the same fields are updated by a single
+        # UPDATE ... FROM (VALUES ...) statement, checking versions in place.
+        batches: dict[tuple[str, ...], dict[int, tuple[int | None, dict[str, Any]]]]
+        batches = {}
         for r in rows:
-            update_data = {}
-            for rd in r.new_values:
-                field = table.get_field_by_id(rd.field_id)
-                if not field:
-                    raise ValueError(
-                        f"Field with id={rd.field_id} not found in table '{table.name}'",
-                    )
-                update_data[field.name] = rd.value.value
+            update_data = get_row_data(table, r.new_values)
+            batch = batches.setdefault(tuple(sorted(update_data)), {})
+            batch[r.row_id] = (r.expected_version, update_data)
+        await self._create_missing_partitions(
+            table,
+            [data for batch in batches.values() for _, data in batch.values()],
+        )
 
-            stmt = (
-                sa_table.update()
-                .where(sa_table.c.id == r.row_id)
-                .values(**update_data)
-                .returning(sa_table)
+        updated_by_id: dict[int, Row] = {}
+        for names, batch in batches.items():
+            new_values = values(
+                column("_id", Integer),
+                column("_expected_version", Integer),
+                *(column(name, sa_table.c[name].type) for name in names),
+                name="new_values",
+            ).data(
+                [
+                    (row_id, expected_version, *(data[n] for n in names))
+                    for row_id, (expected_version, data) in batch.items()
+                ],
             )
-            result = await self._storage_db_session.execute(stmt)
-            updated_rows.extend(
-                map_to_rows(
-                    table,
-                    cast(list[dict[str, Any]], result.mappings().all()),
-                ),
+            # NULLs in VALUES are untyped, so they are cast where used.
+            expected_version = sa_cast(new_values.c._expected_version, Integer)
+            stmt = (
+                update(sa_table)
+                .where(
+                    sa_table.c.id == new_values.c._id,
+                    or_(
+                        expected_version.is_(None),
+                        sa_table.c._version == expected_version,
+                    ),
+                )
+                .values(
+                    {
+                        name: sa_cast(new_values.c[name], sa_table.c[name].type)
+                        for name in names
+                    }
+                    | {
+                        "_version": sa_table.c._version + 1,
+                        "_seq": ROW_CHANGE_SEQ.next_value(),
+                        "_xid": literal_column(CURRENT_XID_SQL),
+                    },
+                )
+                .returning(*get_row_columns(sa_table))
             )
+            result = await self._get_storage_session(table).execute(stmt)
+            for row in map_to_rows(
+                table,
+                cast(list[dict[str, Any]], result.mappings().all()),
+            ):
+                updated_by_id[row.row_id] = row
+
+        updated_rows = [
+            updated_by_id[row_id]
+            for row_id in dict.fromkeys(r.row_id for r in rows)
+            if row_id in updated_by_id
+        ]
+        rows_written.labels(str(table.table_id), "update").inc(len(updated_rows))
 
-        await self._storage_db_session.commit()
+        await self._notify_row_changes(
+            table,
+            ChangeTypeEnum.UPDATE,
+            [r.row_id for r in updated_rows],
+        )
         return updated_rows
 
-    async def count_rows(self, table: Table) -> int:
-        sa_table = get_sa_table(table, self._metadata)
+    @traced
+    async def execute_batch(
+        self,
+        operations: list[BatchOperation],
+    ) -> tuple[bool, list[BatchOperationResult]]:
+        """
+        Execute write operations in order within a single storage transaction.
+
+        The transaction is only committed if no operation had version
+        conflicts, so either all operations are applied or none.
+
+        :param operations: operations to execute.
+        :return: whether the batch was committed and a result per operation.
+        """
+        tables = [_get_operation_table(o) for o in operations]
+        shards = {t.shard for t in tables if t is not None}
+        if len(shards) > 1:
+            raise ValueError("A batch can only write to tables of a single storage shard")
+        storage_session = self._get_shard_session(shards.pop() if shards else DEFAULT_SHARD)
+
+        results: list[BatchOperationResult] = []
+        try:
+            for operation in operations:
+                results.append(await self._execute_operation(operation))
+        except Exception:
+            await storage_session.rollback()
+            raise
+
+        if any(r.conflicts for r in results):
+            await storage_session.rollback()
+            return False, results
+
+        await storage_session.commit()
+        return True, results
+
+    async def _execute_operation(
+        self,
+        operation: BatchOperation,
+    ) -> BatchOperationResult:
+        if isinstance(operation, InsertRowsOperation):
+            return BatchOperationResult(rows=await self._insert_rows(operation.rows))
+
+        if isinstance(operation, UpdateRowsOperation):
+            rows = await self._update_rows(operation.rows)
+            if not operation.rows:
+                return BatchOperationResult()
+            conflicts = await self.get_row_conflicts(
+                operation.rows[0].table,
+                {
+                    r.row_id: r.expected_version
+                    for r in operation.rows
+                    if r.expected_version is not None
+                },
+                [r.row_id for r in rows],
+            )
+            return BatchOperationResult(rows=rows, conflicts=conflicts)
+
+        deleted_ids = await self._delete_rows(
+            operation.table,
+            operation.row_ids,
+            operation.expected_versions,
+        )
+        expected_versions = operation.expected_versions or {}
+        conflicts = await self.get_row_conflicts(
+            operation.table,
+            {i: expected_versions[i] for i in operation.row_ids if i in expected_versions},
+            deleted_ids,
+        )
+        return BatchOperationResult(deleted_row_ids=deleted_ids, conflicts=conflicts)
+
+    @traced
+    async def get_row_conflicts(
+        self,
+        table: Table,
+        expected_versions: dict[int, int],
+        written_row_ids: list[int],
+    ) -> list[RowConflict]:
+        """
+        Report rows that were skipped because of a version mismatch.
+
+        :param table: table the rows were written to.
+        :param expected_versions: versions the write expected by row ID.
+        :param written_row_ids: IDs of rows that were actually written.
+        :return: conflicts with the current versions of the rows.
+        """
+        skipped_ids = set(expected_versions) - set(written_row_ids)
+        if not skipped_ids:
+            return []
+
+        sa_table = get_shared_sa_table(table)
+        result = await self._get_storage_session(table).execute(
+            select(sa_table.c.id, sa_table.c._version).where(
+                sa_table.c.id.in_(skipped_ids),
+            ),
+        )
+        current_versions = dict(result.tuples().all())
+        return [
+            RowConflict(
+                row_id=row_id,
+                expected_version=expected_versions[row_id],
+                current_version=current_versions.get(row_id),
+            )
+            for row_id in sorted(skipped_ids)
+        ]
+
+    @traced
+    async def fetch_changes(
+        self,
+        table: Table,
+        since: ChangeCursor | None = None,
+        limit: int = 1000,
+    ) -> RowsDelta:
+        """
+        Fetch rows inserted, updated or deleted after a cursor.
+
+        Changes of transactions that might still be followed by a commit of
+        an older, still running one are left for a later fetch.
+
+        :param table: table to fetch changes from.
+        :param since: `cursor` of the previous delta, None to fetch all rows.
+        :param limit: maximum number of changes to return.
+        :return: changed rows and ids of deleted rows in cursor order.
+        """
+        storage_session = self._get_storage_session(table)
+        watermark = (
+            await storage_session.execute(
+                select(row_tombstone_watermarks.c.seq, row_tombstone_watermarks.c.xid)
+                .filter_by(table_id=table.table_id),
+            )
+        ).one_or_none()
+        generation, compacted_xid = watermark or (0, 0)
+        if since is not None and (
+            since.generation != generation or since.xid <= compacted_xid
+        ):
+            return RowsDelta(
+                rows=[],
+                deleted_row_ids=[],
+                cursor=ChangeCursor(generation),
+                resync=True,
+            )
+
+        # Every transaction older than this one is finished and visible to
+        # the statements below.
+        xmin = await _get_snapshot_xmin(storage_session)
+        position: ChangePosition = (since.xid, since.seq) if since is not None else (0, 0)
+        changes, has_more = await self._fetch_change_batch(
+            storage_session,
+            get_shared_sa_table(table),
+            table,
+            position,
+            limit,
+            before_xid=xmin,
+        )
+        if changes:
+            position = changes[-1][0]
+        if not has_more:
+            # Caught up, changes of later transactions come after the xmin.
+            position = max(position, (xmin, 0))
+        return RowsDelta(
+            rows=map_to_rows(table, [d for _, d, _ in changes if d is not None]),
+            deleted_row_ids=[i for _, _, i in changes if i is not None],
+            cursor=ChangeCursor(generation, *position),
+            has_more=has_more,
+        )
+
+    async def _fetch_change_batch(
+        self,
+        conn: AsyncSession | AsyncConnection,
+        sa_table: SATable,
+        table: Table,
+        since: ChangePosition,
+        limit: int,
+        before_xid: int | None,
+    ) -> tuple[list[tuple[ChangePosition, dict[str, Any] | None, int | None]], bool]:
+        """
+        Changed rows and tombstones after `since`, merged by position.
+
+        :param before_xid: only changes of transactions older than this one
+            are read, None to read all committed ones.
+        :return: up to `limit` changes as (position, row or None, deleted
+            row id or None), and whether more are left.
+        """
+        rows_stmt = (
+            select(*get_row_columns(sa_table))
+            .where(tuple_(sa_table.c._xid, sa_table.c._seq) > since)
+            .order_by(sa_table.c._xid, sa_table.c._seq)
+            .limit(limit)
+        )
+        tombstones_stmt = (
+            select(row_tombstones.c.xid, row_tombstones.c.seq, row_tombstones.c.row_id)
+            .where(
+                row_tombstones.c.table_id == table.table_id,
+                tuple_(row_tombstones.c.xid, row_tombstones.c.seq) > since,
+            )
+            .order_by(row_tombstones.c.xid, row_tombstones.c.seq)
+            .limit(limit)
+        )
+        if before_xid is not None:
+            rows_stmt = rows_stmt.where(sa_table.c._xid < before_xid)
+            tombstones_stmt = tombstones_stmt.where(row_tombstones.c.xid < before_xid)
+        rows_result = await conn.execute(rows_stmt)
+        dict_rows = cast(list[dict[str, Any]], rows_result.mappings().all())
+        tombstones = (await conn.execute(tombstones_stmt)).all()
+
+        # Merge both sources by position and keep the first `limit`.
+        changes: list[tuple[ChangePosition, dict[str, Any] | None, int | None]] = sorted(
+            [((d["_xid"], d["_seq"]), d, None) for d in dict_rows]
+            + [((t.xid, t.seq), None, t.row_id) for t in tombstones],
+            key=lambda c: c[0],
+        )
+        has_more = limit in (len(dict_rows), len(tombstones))
+        return changes[:limit], has_more
+
+    @traced
+    async def compact_row_tombstones(self, older_than: datetime.timedelta) -> None:
+        """
+        Remove tombstones of rows deleted before `older_than` ago.
+
+        Clients whose cursor is older than the removed tombstones
+        get `resync` from fetch_changes.
+        """
+        compacted = (
+            delete(row_tombstones)
+            .where(row_tombstones.c.deleted_at <= func.now() - older_than)
+            .returning(row_tombstones.c.table_id, row_tombstones.c.xid)
+            .cte("compacted")
+        )
+        stmt = pg_insert(row_tombstone_watermarks).from_select(
+            ["table_id", "xid"],
+            select(compacted.c.table_id, func.max(compacted.c.xid)).group_by(
+                compacted.c.table_id,
+            ),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[row_tombstone_watermarks.c.table_id],
+            set_={
+                "xid": func.greatest(
+                    row_tombstone_watermarks.c.xid,
+                    stmt.excluded.xid,
+                ),
+            },
+        )
+        for shard in self._get_shards():
+            storage_session = self._get_shard_session(shard)
+            await storage_session.execute(stmt)
+            await storage_session.commit()
+
+    async def _list_partitions(
+        self,
+        conn: AsyncConnection,
+        table: Table,
+    ) -> dict[PartitionStart, bool]:
+        """Partitions of a table by lower bound, with whether a detach is pending."""
+        result = await conn.execute(
+            text(
+                "SELECT c.relname, i.inhdetachpending "
+                "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:name)",
+            ),
+            {"name": _quote(table.name)},
+        )
+        partitioning = cast(Partitioning, table.partitioning)
+        return {parse_partition_name(partitioning, name): pending for name, pending in result}
+
+    async def _get_current_partition_start(
+        self,
+        conn: AsyncConnection,
+        table: Table,
+    ) -> PartitionStart:
+        """Lower bound of the partition of the latest row id or of the current time."""
+        partitioning = cast(Partitioning, table.partitioning)
+        if partitioning.field_id != 0:
+            return get_partition_start(partitioning, datetime.datetime.now(datetime.timezone.utc))
+        last_id = await conn.scalar(
+            text("SELECT pg_sequence_last_value(pg_get_serial_sequence(:name, 'id'))"),
+            {"name": _quote(table.name)},
+        )
+        return get_partition_start(partitioning, last_id or 0)
+
+    @traced
+    async def maintain_partitions(self, table: Table) -> None:
+        """
+        Create partitions ahead of the current one and drop expired ones.
+
+        Runs on its own connection: partition DDL is kept out of request
+        transactions and DETACH CONCURRENTLY can't run in one. Dropped
+        partitions take their rows without leaving tombstones, so delta sync
+        clients are asked to resync.
+
+        :param table: partitioned table.
+        """
+        partitioning = table.partitioning
+        if partitioning is None:
+            return
+        table_name = _quote(table.name)
+        async with self._get_storage_engine(table).connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"SET lock_timeout = {settings.ddl_lock_timeout_ms}"))
+            try:
+                partitions = await self._list_partitions(conn, table)
+                current = await self._get_current_partition_start(conn, table)
+                for i in range(settings.partitions_ahead + 1):
+                    start = get_next_start(partitioning, current, i)
+                    if start not in partitions:
+                        await conn.execute(text(get_partition_ddl(table, start)))
+                        partitions[start] = False
+
+                expired: list[PartitionStart] = []
+                if partitioning.retention is not None:
+                    keep_from = get_next_start(partitioning, current, 1 - partitioning.retention)
+                    expired = sorted(s for s in partitions if s < keep_from)  # type: ignore[operator]
+                for start in expired:
+                    name = _quote(get_partition_name(table, start))
+                    # A concurrent detach waits for queries using the table
+                    # instead of blocking them, an interrupted one is finalized.
+                    mode = "FINALIZE" if partitions.pop(start) else "CONCURRENTLY"
+                    await conn.execute(
+                        text(f"ALTER TABLE {table_name} DETACH PARTITION {name} {mode}"),
+                    )
+                    await conn.execute(text(f"DROP TABLE {name}"))
+                if expired:
+                    await conn.execute(_get_resync_stmt(table.table_id))
+            finally:
+                await conn.execute(text("RESET lock_timeout"))
+        _known_partitions.set(table.table_id, set(partitions))
+
+    async def _maintain_partitions_in_background(self, table: Table) -> None:
+        try:
+            await self.maintain_partitions(table)
+        finally:
+            _partitions_in_maintenance.discard(table.table_id)
+
+    def _maintain_partitions_if_filled(self, table: Table, row_id: int) -> None:
+        """
+        Maintain partitions in the background once row ids use up those ahead.
+
+        Row ids only become known on insert, so new partitions can't be
+        created for them in advance the way they are for dates. Creating them
+        as soon as ids move on to the next partition keeps them ahead between
+        runs of the maintenance job.
+        """
+        partitioning = table.partitioning
+        if (
+            partitioning is None
+            or partitioning.field_id != 0
+            or table.table_id in _partitions_in_maintenance
+        ):
+            return
+        last_start = get_next_start(
+            partitioning,
+            get_partition_start(partitioning, row_id),
+            settings.partitions_ahead,
+        )
+        known = _known_partitions.get(table.table_id)
+        if known is not None and last_start in known:
+            return
+        _partitions_in_maintenance.add(table.table_id)
+        run_in_background(
+            self._maintain_partitions_in_background(table),
+            name=f"maintain partitions of table {table.table_id}",
+        )
+
+    async def _create_missing_partitions(
+        self,
+        table: Table,
+        row_data: list[dict[str, Any]],
+    ) -> None:
+        """
+        Create partitions for rows about to be written, if they don't exist.
+
+        Partitions for the coming periods are created by `maintain_partitions`,
+        this is for rows outside of them, e.g. backfilled history. Creating a
+        partition in the write's transaction locks the table until it commits,
+        so it's only done for partitions that are actually missing.
+        """
+        partitioning = table.partitioning
+        if partitioning is None or partitioning.field_id == 0:
+            return
+        key = get_partition_key(table)
+        starts = {
+            get_partition_start(partitioning, data[key])
+            for data in row_data
+            if data.get(key) is not None
+        }
+        starts -= _known_partitions.get(table.table_id) or set()
+        if not starts:
+            return
+
+        names = {get_partition_name(table, start): start for start in starts}
+        storage_session = self._get_storage_session(table)
+        # Concurrent writers would otherwise both find a partition missing.
+        await storage_session.execute(
+            select(func.pg_advisory_xact_lock(PARTITION_CREATE_LOCK, table.table_id)),
+        )
+        result = await storage_session.execute(
+            text(
+                "SELECT name FROM unnest(CAST(:names AS text[])) AS name "
+                "WHERE to_regclass(quote_ident(name)) IS NULL",
+            ),
+            {"names": sorted(names)},
+        )
+        for name in result.scalars().all():
+            await storage_session.execute(text(get_partition_ddl(table, names[name])))
+
+    @traced
+    async def count_rows(
+        self,
+        table: Table,
+        search: str | None = None,
+        filtering_params: list[FilteringParam] | None = None,
+    ) -> int:
+        sa_table = get_shared_sa_table(table)
         stmt = select(func.count()).select_from(sa_table)
-        result = await self._storage_db_session.execute(stmt)
+        if filtering_params:
+            stmt = _add_filtering_params_to_stmt(stmt, sa_table, table, filtering_params)
+        if search:
+            stmt = _add_search_to_stmt(stmt, sa_table, search)
+        result = await self._get_storage_session(table).execute(stmt)
         count = result.scalar_one()
         return int(count)
 
+    @traced
+    async def aggregate(
+        self,
+        table: Table,
+        aggregates: list[AggregateParam],
+        grouping_params: list[GroupingParam] | None = None,
+        filtering_params: list[FilteringParam] | None = None,
+        search: str | None = None,
+        limit: int = 1000,
+    ) -> AggregationResult:
+        """
+        Aggregate rows in the storage database.
+
+        :param table: table to aggregate.
+        :param aggregates: aggregates to compute per group.
+        :param grouping_params: fields to group by, none for a single total.
+        :param filtering_params: filters applied before aggregation.
+        :param search: full-text query applied before aggregation.
+        :param limit: maximum number of groups to return.
+        :return: one row per group.
+        """
+        sa_table = get_shared_sa_table(table)
+        stmt = build_aggregation_stmt(
+            sa_table,
+            table,
+            aggregates,
+            grouping_params or [],
+        ).limit(limit)
+        if filtering_params:
+            stmt = _add_filtering_params_to_stmt(stmt, sa_table, table, filtering_params)
+        if search:
+            stmt = _add_search_to_stmt(stmt, sa_table, search)
+
+        result = await self._get_storage_session(table).execute(stmt)
+        return AggregationResult(
+            columns=list(result.keys()),
+            rows=[list(r) for r in result.all()],
+        )
+
+    @traced
+    async def fetch_facets(
+        self,
+        table: Table,
+        fields: list[Field],
+        limit: int = 10,
+        filtering_params: list[FilteringParam] | None = None,
+        search: str | None = None,
+        sample_percent: float | None = None,
+    ) -> list[Facet]:
+        """
+        Most frequent values of fields with their row counts.
+
+        :param table: table to count values in.
+        :param fields: fields to count values of.
+        :param limit: number of values per field.
+        :param filtering_params: filters applied before counting.
+        :param search: full-text query applied before counting.
+        :param sample_percent: count only this percent of table pages
+            and extrapolate, for tables too large to scan.
+        :return: facet per field, in the order of `fields`.
+        """
+        if not fields:
+            return []
+        sa_table = get_shared_sa_table(table)
+        source: FromClause = sa_table
+        if sample_percent is not None:
+            source = sa_table.tablesample(func.system(sample_percent))
+
+        rows_stmt = select(*(source.c[f.name] for f in fields))
+        if filtering_params:
+            rows_stmt = _add_filtering_params_to_stmt(rows_stmt, source, table, filtering_params)
+        if search:
+            rows_stmt = _add_search_to_stmt(rows_stmt, source, search)
+
+        result = await self._get_storage_session(table).execute(
+            build_facets_stmt(rows_stmt.subquery("facet_rows"), fields, limit),
+        )
+        scale = 100 / sample_percent if sample_percent is not None else 1.0
+        return map_facets(fields, list(result.all()), scale)
+
+    @traced
+    async def get_data_version(self, table: Table) -> int:
+        """
+        The latest row change sequence number of a table.
+
+        It grows on every insert, update and delete, so anything derived from
+        the rows of a table can be cached by it.
+        """
+        sa_table = get_shared_sa_table(table)
+        version = await self._get_storage_session(table).scalar(
+            select(
+                func.greatest(
+                    select(func.max(sa_table.c._seq)).scalar_subquery(),
+                    select(func.max(row_tombstones.c.seq))
+                    .filter_by(table_id=table.table_id)
+                    .scalar_subquery(),
+                    select(row_tombstone_watermarks.c.seq)
+                    .filter_by(table_id=table.table_id)
+                    .scalar_subquery(),
+                ),
+            ),
+        )
+        return int(version or 0)
+
+    @traced
+    async def compute_statistics(
+        self,
+        table: Table,
+        known_version: int | None = None,
+        exact_row_limit: int | None = None,
+        histogram_buckets: int | None = None,
+    ) -> TableStatistics | None:
+        """
+        Compute per field statistics of a table.
+
+        Tables up to `exact_row_limit` rows are scanned once, larger ones are
+        ANALYZEd and estimated from `pg_stats`.
+
+        :param table: table to compute statistics for.
+        :param known_version: data version of already known statistics.
+        :param exact_row_limit: defaults to `settings.statistics_exact_row_limit`.
+        :param histogram_buckets: defaults to `settings.statistics_histogram_buckets`.
+        :return: statistics or None if data version is still `known_version`.
+        """
+        if exact_row_limit is None:
+            exact_row_limit = settings.statistics_exact_row_limit
+        if histogram_buckets is None:
+            histogram_buckets = settings.statistics_histogram_buckets
+
+        data_version = await self.get_data_version(table)
+        if data_version == known_version:
+            return None
+
+        sa_table = get_shared_sa_table(table)
+        # reltuples is kept up to date by (auto)vacuum and ANALYZE,
+        # it's -1 if the table has never been analyzed.
+        estimate_stmt = text(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)",
+        ).bindparams(name=_quote(sa_table.name))
+        if table.partitioning is not None:
+            # Autovacuum never analyzes a partitioned table itself, only its
+            # partitions.
+            estimate_stmt = text(
+                "SELECT CASE WHEN bool_or(c.reltuples < 0) THEN -1 "
+                "ELSE sum(c.reltuples)::bigint END "
+                "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:name)",
+            ).bindparams(name=_quote(sa_table.name))
+        analyze_stmt = text(f"ANALYZE {_quote(sa_table.name)}")
+        storage_session = self._get_storage_session(table)
+        row_estimate = int(await storage_session.scalar(estimate_stmt) or 0)
+        is_analyzed = False
+        if row_estimate >= exact_row_limit or row_estimate < 0:
+            await storage_session.execute(analyze_stmt)
+            row_estimate = int(await storage_session.scalar(estimate_stmt) or 0)
+            is_analyzed = True
+
+        if row_estimate < exact_row_limit:
+            result = await storage_session.execute(
+                build_exact_statistics_stmt(sa_table, table, histogram_buckets),
+            )
+            row_count, fields = map_exact_statistics(table, result.one())
+            is_exact = True
+        else:
+            if not is_analyzed:
+                await storage_session.execute(analyze_stmt)
+            row_count = row_estimate
+            estimates_stmt, bounds_stmt = build_sampled_statistics_stmts(sa_table, table)
+            estimates = (await storage_session.execute(estimates_stmt)).all()
+            bounds = None
+            if bounds_stmt is not None:
+                bounds = (await storage_session.execute(bounds_stmt)).one()
+            fields = map_sampled_statistics(table, row_count, estimates, bounds)
+            is_exact = False
+
+        return TableStatistics(
+            table_id=table.table_id,
+            data_version=data_version,
+            row_count=row_count,
+            is_exact=is_exact,
+            fields=fields,
+        )
+
+    @traced
     async def get_tables_by_ids(self, table_ids: list[int]) -> list[Table]:
         if not table_ids:
             return []
+        for table_id in table_ids:
+            note_table(table_id)
 
         stmt = (
             select(TableModel)
@@ -335,7 +2568,89 @@ class SqlAlchemyTablesService(AbstractTableService):
 
         return tables
 
+    @traced
+    async def upgrade_storage(self) -> None:
+        """
+        Add columns and indexes missing from storage of older versions.
+
+        It can run again and from several workers at once: tables up to date
+        are left alone without taking locks. Each table is upgraded in its
+        own transaction, adding a column with change numbers rewrites it.
+        Search vectors of existing rows are backfilled before their index is
+        created, so an interrupted backfill is done again on the next run.
+        """
+        stmt = (
+            select(TableModel)
+            .where(TableModel.is_delete.is_(False))
+            .options(selectinload(TableModel.fields).selectinload(FieldModel.choices))
+        )
+        result = await self._db_session.execute(stmt)
+        tables = [map_table_model_to_domain(tm) for tm in result.scalars().all()]
+        for shard in self._get_shards():
+            async with self._get_shard_engine(shard).connect() as conn:
+                await conn.execute(select(func.pg_advisory_lock(STORAGE_UPGRADE_LOCK)))
+                try:
+                    await conn.run_sync(STORAGE_META.create_all)
+                    await conn.commit()
+                    columns = await _fetch_storage_columns(conn)
+                    indexes = await _fetch_storage_indexes(conn)
+                    for statement in get_change_tracking_upgrade_ddl(columns):
+                        await conn.execute(text(statement))
+                    await conn.commit()
+                    for table in tables:
+                        # Tables of other shards, or moved meanwhile, have no columns here.
+                        if table.shard != shard or table.name not in columns:
+                            continue
+                        for statement in get_storage_upgrade_ddl(table, columns[table.name]):
+                            await conn.execute(text(statement))
+                        await conn.commit()
+                        search_index = f"ix_storage_{table.table_id}__search"
+                        if search_index not in indexes:
+                            await self._backfill(
+                                table,
+                                f"{SEARCH_COLUMN} = {get_search_vector_sql(table)}",
+                            )
+                            await conn.execute(
+                                text(
+                                    f"CREATE INDEX IF NOT EXISTS {_quote(search_index)} "
+                                    f"ON {_quote(table.name)} USING gin ({SEARCH_COLUMN})",
+                                ),
+                            )
+                            await conn.commit()
+                finally:
+                    await conn.rollback()
+                    await conn.execute(select(func.pg_advisory_unlock(STORAGE_UPGRADE_LOCK)))
+                    await conn.commit()
+
+    @traced
+    async def fetch_partitioned_tables(self) -> list[Table]:
+        """Tables with partitioned storage, for partition maintenance."""
+        stmt = (
+            select(TableModel)
+            .where(
+                TableModel.partition_field_id.is_not(None),
+                TableModel.is_delete.is_(False),
+            )
+            .options(selectinload(TableModel.fields).selectinload(FieldModel.choices))
+        )
+        result = await self._db_session.execute(stmt)
+        return [map_table_model_to_domain(tm) for tm in result.scalars().all()]
+
+    @traced
+    async def count_tables_by_shard(self) -> dict[str, int]:
+        """Number of tables placed on every storage shard."""
+        stmt = (
+            select(TableModel.shard, func.count())
+            .where(TableModel.is_delete.is_(False))
+            .group_by(TableModel.shard)
+        )
+        result = await self._db_session.execute(stmt)
+        counts = dict.fromkeys(self._get_shards(), 0)
+        counts.update({shard: count for shard, count in result.tuples()})
+        return counts
+
     # TODO: Remove it after initializing Policies for namespaces and tables
+    @traced
     async def fetch_all_tables(self) -> list[Table]:
         """Возвращает список всех таблиц."""
         stmt = select(TableModel).options(
@@ -345,14 +2660,16 @@ class SqlAlchemyTablesService(AbstractTableService):
         table_models = result.scalars().all()
         return [map_table_model_to_domain(tm) for tm in table_models]
 
+    @traced
     async def delete_table(self, table: Table) -> None:
         """Удаляет таблицу и все связанные с ней данные."""
         # Просто отметим что таблица удалена в метаданных
         stmt = update(TableModel).filter_by(id=table.table_id).values(is_delete=True)
         await self._db_session.execute(stmt)
+        await self._invalidate_table(table.table_id)
         await self._db_session.flush()
 
 
-        # sa_table = get_sa_table(table, self._metadata)
+        # sa_table = get_shared_sa_table(table)
         # async with self._storage_engine.begin() as conn:
         #     await conn.run_sync(sa_table.drop)
@@ -2,7 +2,14 @@ import dataclasses
 import datetime
 from typing import Any, Generic, TypeVar
 
-from drawbridge_backend.domain.enums import DataTypeEnum
+from drawbridge_backend.domain.enums import (
+    AggregateFunctionEnum,
+    ChangeTypeEnum,
+    DataTypeEnum,
+    DateTruncEnum,
+    OperatorEnum,
+)
+from drawbridge_backend.settings import DEFAULT_SHARD
 
 
 @dataclasses.dataclass
@@ -13,8 +20,70 @@ class OrderingParam:
 
 @dataclasses.dataclass
 class FilteringParam:
+    # 0 stands for the row id
     field_id: int
     value: str
+    operator: OperatorEnum = OperatorEnum.EQ
+
+
+@dataclasses.dataclass
+class GroupingParam:
+    field_id: int
+    # DATETIME only, values are truncated to this unit
+    bucket: DateTruncEnum | None = None
+
+
+@dataclasses.dataclass
+class AggregateParam:
+    function: AggregateFunctionEnum
+    # None with COUNT counts rows, otherwise non-null values are aggregated
+    field_id: int | None = None
+
+
+@dataclasses.dataclass
+class AggregationResult:
+    # group field names followed by aggregate names
+    columns: list[str]
+    rows: list[list[Any]]
+
+
+@dataclasses.dataclass
+class FacetValue:
+    value: Any
+    count: int
+    # CHOICE only, label of the choice
+    label: str | None = None
+
+
+@dataclasses.dataclass
+class Facet:
+    field_id: int
+    # most frequent first
+    values: list[FacetValue]
+    # counts are extrapolated from a sample
+    is_approximate: bool = False
+
+
+@dataclasses.dataclass
+class FieldStatistics:
+    field_id: int
+    null_ratio: float
+    distinct_estimate: int
+    min_value: Any = None
+    max_value: Any = None
+    # equi-depth bucket bounds, each bucket holds about the same number of rows
+    histogram: list[Any] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class TableStatistics:
+    table_id: int
+    # the latest row change sequence number the statistics account for
+    data_version: int
+    row_count: int
+    # False when estimated from ANALYZE samples
+    is_exact: bool
+    fields: list[FieldStatistics]
 
 
 @dataclasses.dataclass
@@ -95,6 +164,8 @@ class Row:
     # pk of the row always auto-generated by service on insert
     row_id: int
     values: list[RowData[BaseValue]]
+    # incremented by every update, see UpdateRow.expected_version
+    version: int = 1
 
 
 @dataclasses.dataclass
@@ -108,6 +179,44 @@ class UpdateRow:
     table: "Table"
     row_id: int
     new_values: list[RowData[BaseValue]]
+    # update is skipped if the row's version differs
+    expected_version: int | None = None
+
+
+@dataclasses.dataclass
+class RowConflict:
+    row_id: int
+    expected_version: int
+    # None if the row was deleted
+    current_version: int | None
+
+
+@dataclasses.dataclass
+class InsertRowsOperation:
+    rows: list[InsertRow]
+
+
+@dataclasses.dataclass
+class UpdateRowsOperation:
+    rows: list[UpdateRow]
+
+
+@dataclasses.dataclass
+class DeleteRowsOperation:
+    table: "Table"
+    row_ids: list[int]
+    expected_versions: dict[int, int] | None = None
+
+
+BatchOperation = InsertRowsOperation | UpdateRowsOperation | DeleteRowsOperation
+
+
+@dataclasses.dataclass
+class BatchOperationResult:
+    # inserted or updated rows
+    rows: list[Row] = dataclasses.field(default_factory=list)
+    deleted_row_ids: list[int] = dataclasses.field(default_factory=list)
+    conflicts: list[RowConflict] = dataclasses.field(default_factory=list)
 
 
 @dataclasses.dataclass
@@ -119,6 +228,8 @@ class Field:
     is_nullable: bool
     default_value: str | None = None
     choices: list["FieldChoice"] = dataclasses.field(default_factory=list)
+    # STRING only, speeds up contains/startswith/similar filters
+    has_trigram_index: bool = False
 
     @property
     def field_id(self) -> int:
@@ -156,6 +267,32 @@ class UnSavedField:
     is_nullable: bool
     default_value: str | None = None
     choices: list[UnSavedChoice] = dataclasses.field(default_factory=list)
+    # STRING only, speeds up contains/startswith/similar filters
+    has_trigram_index: bool = False
+
+
+@dataclasses.dataclass
+class Partitioning:
+    """Storage table split into partitions by ranges of the row id or a DATETIME field."""
+
+    # 0 stands for the row id, otherwise a non-nullable DATETIME field
+    field_id: int = 0
+    # rows per partition, partitioning by the row id only
+    id_range: int = 1_000_000
+    # partition width, partitioning by a DATETIME field only
+    period: DateTruncEnum = DateTruncEnum.MONTH
+    # partitions kept counting the current one, older ones are dropped;
+    # None keeps all of them
+    retention: int | None = None
+
+
+@dataclasses.dataclass
+class UnSavedPartitioning:
+    # DATETIME field to partition by, None partitions by the row id
+    field_name: str | None = None
+    id_range: int = 1_000_000
+    period: DateTruncEnum = DateTruncEnum.MONTH
+    retention: int | None = None
 
 
 @dataclasses.dataclass
@@ -165,6 +302,9 @@ class Table:
     fields: list[Field]
     verbose_name: str | None = None
     description: str | None = None
+    partitioning: Partitioning | None = None
+    # storage database the table's rows live in
+    shard: str = DEFAULT_SHARD
 
     def get_field_by_id(self, field_id: int) -> Field | None:
         for f in self.fields:
@@ -187,3 +327,67 @@ class UnSavedTable:
     fields: list[UnSavedField]
     verbose_name: str | None = None
     description: str | None = None
+    partitioning: UnSavedPartitioning | None = None
+
+
+@dataclasses.dataclass
+class SchemaChange:
+    """Fields of a table altered, with what's left to finish in the background."""
+
+    table: Table
+    # new types of fields whose values are still being converted, by field id
+    conversions: dict[int, DataTypeEnum] = dataclasses.field(default_factory=dict)
+    # search vectors of existing rows no longer match the STRING fields
+    reindex_search: bool = False
+
+    @property
+    def is_finished(self) -> bool:
+        return not self.conversions and not self.reindex_search
+
+
+@dataclasses.dataclass
+class RowChange:
+    table_id: int
+    change_type: ChangeTypeEnum
+    row_ids: list[int]
+
+
+@dataclasses.dataclass(frozen=True)
+class ChangeCursor:
+    """
+    Position in the changes of a table.
+
+    Changes are ordered by the id of the transaction that made them, then by
+    change number. Only transactions older than any still running are read,
+    so a commit can't land behind a cursor handed out before it.
+    """
+
+    # change number of the last resync of the table, cursors of an earlier
+    # one must resync
+    generation: int = 0
+    xid: int = 0
+    seq: int = 0
+
+    def __str__(self) -> str:
+        return f"{self.generation}.{self.xid}.{self.seq}"
+
+    @classmethod
+    def parse(cls, value: str) -> "ChangeCursor":
+        """Cursor from its string form, raise ValueError if it's malformed."""
+        parts = value.split(".")
+        if len(parts) != 3 or not all(p.isdigit() for p in parts):
+            raise ValueError(f"Invalid cursor '{value}'")
+        return cls(*map(int, parts))
+
+
+@dataclasses.dataclass
+class RowsDelta:
+    """Rows changed in a table after a given cursor."""
+
+    rows: list[Row]
+    deleted_row_ids: list[int]
+    # cursor to pass as `since` to get the following changes
+    cursor: ChangeCursor
+    has_more: bool = False
+    # changes before `since` were compacted, client has to refetch the table
+    resync: bool = False
@@ -27,6 +27,7 @@ class AbstractTableService(abc.ABC):
         offset: int = 0,
         ordering_params: list[OrderingParam] | None = None,
         filtering_params: list[FilteringParam] | None = None,
+        search: str | None = None,
     ) -> list[Row]:
         """Fetch rows from a table.
 
@@ -35,6 +36,8 @@ class AbstractTableService(abc.ABC):
         :param offset: Number of rows to skip before starting to fetch.
         :param ordering_params: List of ordering parameters.
         :param filtering_params: List of filtering parameters. Casts as OR conditions.
+        :param search: Full-text query over string fields, matching rows are
+            ordered by relevance.
         :return: List of rows as dictionaries.
         """
 
@@ -89,7 +92,11 @@ class AbstractTableService(abc.ABC):
     ) -> list[Row]:
         """Update rows in a table.
 
+        Rows with `expected_version` set are only updated if their current
+        version matches, otherwise they are left untouched and not returned.
+
         :param rows: List of rows to update.
+        :return: Updated rows.
         """
 
     async def update_row(
@@ -108,11 +115,15 @@ class AbstractTableService(abc.ABC):
         self,
         table: Table,
         row_ids: list[int],
-    ) -> None:
+        expected_versions: dict[int, int] | None = None,
+    ) -> list[int]:
         """Delete rows from a table.
 
         :param table: table to delete rows from.
         :param row_ids: List of row IDs to delete.
+        :param expected_versions: Versions by row ID, rows with another
+            current version are not deleted.
+        :return: IDs of deleted rows.
         """
 
     async def delete_row(
@@ -144,7 +155,12 @@ class AbstractTableService(abc.ABC):
         pass
 
     @abc.abstractmethod
-    async def count_rows(self, table: Table) -> int:
+    async def count_rows(
+        self,
+        table: Table,
+        search: str | None = None,
+        filtering_params: list[FilteringParam] | None = None,
+    ) -> int:
         pass
 
     @abc.abstractmethod
@@ -1,51 +1,248 @@
+import atexit
+import contextvars
+import datetime
+import json
 import logging
+import queue
+import random
 import sys
-from typing import Union
+import threading
+import time
+import traceback
+from typing import Any, Callable, TextIO
 
 from loguru import logger
 
-from drawbridge_backend.settings import settings
+from drawbridge_backend.metrics import registry
+from drawbridge_backend.settings import LogFormat, settings
+from drawbridge_backend.tracing import tracer
 
+# Set per HTTP request by RequestIdMiddleware, added to every log record.
+request_id: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "request_id",
+    default=None,
+)
 
-class InterceptHandler(logging.Handler):
+dropped_records = registry.counter(
+    "drawbridge_log_records_dropped_total",
+    "Log records dropped because the log queue was full.",
+).labels()
+
+Formatter = Callable[[logging.LogRecord], str]
+
+
+def _prepare(record: logging.LogRecord) -> None:
+    """Resolve on the logging thread what can't wait for the writer."""
+    # Arguments may be changed after logging, render the message now.
+    record.message = record.getMessage()
+    record.msg, record.args = record.message, None
+    record.request_id = request_id.get()
+    record.trace_id = tracer.current_trace_id
+
+
+def _format_exception(record: logging.LogRecord) -> str | None:
+    if record.exc_text:
+        return record.exc_text
+    if record.exc_info and record.exc_info[0] is not None:
+        return "".join(traceback.format_exception(*record.exc_info)).rstrip()
+    return None
+
+
+def format_text(record: logging.LogRecord) -> str:
+    created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
+    line = (
+        f"{created}.{int(record.msecs):03d} | {record.levelname:<8} | "
+        f"{record.name}:{record.funcName}:{record.lineno} - {record.message}"
+    )
+    record_request_id = getattr(record, "request_id", None)
+    if record_request_id:
+        line += f" [{record_request_id}]"
+    exception = _format_exception(record)
+    return f"{line}\n{exception}\n" if exception else f"{line}\n"
+
+
+def format_json(record: logging.LogRecord) -> str:
+    created = datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+    entry: dict[str, Any] = {
+        "time": created.isoformat(),
+        "level": record.levelname,
+        "logger": record.name,
+        "function": record.funcName,
+        "line": record.lineno,
+        "message": record.message,
+    }
+    for key in ("request_id", "trace_id"):
+        if value := getattr(record, key, None):
+            entry[key] = value
+    if exception := _format_exception(record):
+        entry["exception"] = exception
+    return json.dumps(entry, default=str) + "\n"
+
+
+class LogWriter:
+    """Formats records and writes them to a stream as they come."""
+
+    def __init__(self, stream: TextIO, formatter: Formatter) -> None:
+        self._stream = stream
+        self._formatter = formatter
+        self._lock = threading.Lock()
+
+    def write(self, record: logging.LogRecord) -> None:
+        line = self._formatter(record)
+        with self._lock:
+            self._stream.write(line)
+            self._stream.flush()
+
+    def stop(self) -> None:
+        # At exit the stream may already be closed, e.g. by test runners.
+        if not self._stream.closed:
+            self._stream.flush()
+
+
+class QueueLogWriter(LogWriter):
     """
-    Default handler from examples in loguru documentation.
+    Hands records to a writer thread through a bounded queue.
+
+    Logging never waits for a slow stdout and records are formatted off the
+    event loop. When the queue is full records are dropped and counted
+    instead of blocking the worker.
+    """
+
+    def __init__(self, stream: TextIO, formatter: Formatter, maxsize: int) -> None:
+        super().__init__(stream, formatter)
+        self._maxsize = maxsize
+        # SimpleQueue is several times cheaper to put to than Queue, the
+        # size check is racy but only has to bound memory roughly.
+        self._queue: queue.SimpleQueue[logging.LogRecord | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="log_writer", daemon=True)
+        self._thread.start()
+
+    def write(self, record: logging.LogRecord) -> None:
+        if self._queue.qsize() >= self._maxsize:
+            dropped_records.inc()
+            return
+        self._queue.put(record)
+
+    def _run(self) -> None:
+        while (record := self._queue.get()) is not None:
+            try:
+                self._stream.write(self._formatter(record))
+                # Flush once the backlog is written rather than per record.
+                if self._queue.empty():
+                    self._stream.flush()
+            except Exception as error:
+                sys.stderr.write(f"Failed to write a log record: {error}\n")
+
+    def stop(self) -> None:
+        """Write out queued records and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+        super().stop()
 
-    This handler intercepts all log requests and
-    passes them to loguru.
 
-    For more info see:
-    https://loguru.readthedocs.io/en/stable/overview.html#entirely-compatible-with-standard-logging
+class InterceptHandler(logging.Handler):
+    """
+    Passes stdlib log records to the log writer.
+
+    Records skip loguru: the logging module already resolved the caller,
+    finding it again by walking the stack per record only costs time.
     """
 
+    def __init__(self, writer: LogWriter) -> None:
+        super().__init__()
+        self.writer = writer
+
     def emit(self, record: logging.LogRecord) -> None:  # pragma: no cover
         """
-        Propagates logs to loguru.
+        Propagates logs to the writer.
 
         :param record: record to log.
         """
         try:
-            level: Union[str, int] = logger.level(record.levelname).name
-        except ValueError:
-            level = record.levelno
-
-        # Find caller from where originated the logged message
-        frame, depth = logging.currentframe(), 2
-        while frame.f_code.co_filename == logging.__file__:
-            frame = frame.f_back  # type: ignore
-            depth += 1
-
-        logger.opt(depth=depth, exception=record.exc_info).log(
-            level,
-            record.getMessage(),
+            _prepare(record)
+            self.writer.write(record)
+        except Exception:
+            self.handleError(record)
+
+
+class LoguruSink:
+    """Passes records logged with loguru to the log writer."""
+
+    def __init__(self, writer: LogWriter) -> None:
+        self.writer = writer
+
+    def write(self, message: Any) -> None:
+        loguru_record = message.record
+        exception = loguru_record["exception"]
+        record = logging.LogRecord(
+            loguru_record["name"],
+            loguru_record["level"].no,
+            loguru_record["file"].path,
+            loguru_record["line"],
+            loguru_record["message"],
+            None,
+            (exception.type, exception.value, exception.traceback) if exception else None,
+            loguru_record["function"],
         )
+        record.levelname = loguru_record["level"].name
+        _prepare(record)
+        self.writer.write(record)
+
 
+class AccessLogSampler(logging.Filter):
+    """
+    Keeps a share of uvicorn access logs of successful requests.
+
+    Access logs of requests that failed (status 400 and above) are always kept.
+    """
 
-def configure_logging() -> None:  # pragma: no cover
-    """Configures logging."""
-    intercept_handler = InterceptHandler()
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # uvicorn passes (client, method, path, http version, status)
+        args = record.args
+        if isinstance(args, tuple) and len(args) == 5 and isinstance(args[4], int):
+            if args[4] >= 400:
+                return True
+        return random.random() < self.rate  # noqa: S311
+
+
+_writer: LogWriter | None = None
+
+
+@atexit.register
+def shutdown_logging() -> None:
+    """Write out queued records and stop the writer thread."""
+    global _writer  # noqa: PLW0603
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+def configure_logging(stream: TextIO | None = None) -> None:  # pragma: no cover
+    """
+    Configures logging.
+
+    :param stream: where logs go, stdout by default.
+    """
+    global _writer  # noqa: PLW0603
+    formatter = format_json if settings.log_format == LogFormat.JSON else format_text
+    writer = (
+        QueueLogWriter(stream or sys.stdout, formatter, settings.log_queue_size)
+        if settings.log_queue_size > 0
+        else LogWriter(stream or sys.stdout, formatter)
+    )
+    intercept_handler = InterceptHandler(writer)
+    intercept_handler.setLevel(settings.log_level.value)
 
     logging.basicConfig(handlers=[intercept_handler], level=logging.NOTSET)
+    # basicConfig does nothing once configured, replace the previous handler.
+    logging.root.handlers = [
+        intercept_handler if isinstance(h, InterceptHandler) else h
+        for h in logging.root.handlers
+    ]
 
     for logger_name in logging.root.manager.loggerDict:
         if logger_name.startswith("uvicorn."):
@@ -53,11 +250,19 @@ def configure_logging() -> None:  # pragma: no cover
 
     # change handler for default uvicorn logger
     logging.getLogger("uvicorn").handlers = [intercept_handler]
-    logging.getLogger("uvicorn.access").handlers = [intercept_handler]
+    access_logger = logging.getLogger("uvicorn.access")
+    access_logger.handlers = [intercept_handler]
+    access_logger.filters = []
+    if settings.access_log_sample_rate < 1:
+        access_logger.addFilter(AccessLogSampler(settings.access_log_sample_rate))
 
-    # set logs output, level and format
+    # logs of code using loguru directly go to the same writer
     logger.remove()
     logger.add(
-        sys.stdout,
+        LoguruSink(writer),
         level=settings.log_level.value,
+        # The sink formats records itself.
+        format=lambda _: "{message}",
     )
+    shutdown_logging()
+    _writer = writer
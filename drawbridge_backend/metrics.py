@@ -0,0 +1,234 @@
+"""
+In-process metrics rendered in the Prometheus text format.
+
+Metrics are updated from the event loop thread only, so updates are plain
+dict and float operations without locks. Values that already live somewhere
+else (pool sizes, cache and hashing counters) are read by collectors when
+the metrics are rendered instead of being mirrored on every change.
+"""
+
+import abc
+import bisect
+import math
+from typing import Any, Callable, Generic, Iterable, TypeVar
+
+from drawbridge_backend.cache import TTLCache
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, suited for request and query latencies.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+
+C = TypeVar("C")
+M = TypeVar("M", bound="_Metric[Any]")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (
+        v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in values
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC, Generic[C]):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], C] = {}
+
+    @abc.abstractmethod
+    def _new_child(self) -> C:
+        """New child of a combination of label values."""
+
+    def labels(self, *values: str) -> C:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for values, child in self._children.items():
+            lines.extend(self._render_child(_format_labels(self.labelnames, values), child))
+        return lines
+
+    @abc.abstractmethod
+    def _render_child(self, labels: str, child: C) -> list[str]:
+        """Exposition lines of a child with its formatted labels."""
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _ValueMetric(_Metric[_Value]):
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _render_child(self, labels: str, child: _Value) -> list[str]:
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class Counter(_ValueMetric):
+    """Monotonically increasing value, e.g. number of processed rows."""
+
+    type_name = "counter"
+
+
+class Gauge(_ValueMetric):
+    """Value that goes up and down, e.g. number of requests in flight."""
+
+    type_name = "gauge"
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # the last one counts observations above every bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric[_HistogramValue]):
+    """Distribution of observed values, e.g. request durations in seconds."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, labels: str, child: _HistogramValue) -> list[str]:
+        prefix = labels[:-1] + "," if labels else "{"
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), child.counts):
+            cumulative += count
+            lines.append(
+                f'{self.name}_bucket{prefix}le="{_format_value(bound)}"}} {cumulative}',
+            )
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+Collector = Callable[[], Iterable[_Metric[Any]]]
+
+
+class Registry:
+    """Metrics of the worker and collectors building metrics on render."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric[Any]] = {}
+        self._collectors: dict[str, Collector] = {}
+
+    def _register(self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def set_collector(self, name: str, collector: Collector) -> None:
+        """Add a collector, replacing the one previously set under `name`."""
+        self._collectors[name] = collector
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for collector in self._collectors.values():
+            for collected in collector():
+                lines.extend(collected.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+_caches: dict[str, TTLCache[Any, Any]] = {}
+
+
+def watch_cache(name: str, cache: TTLCache[Any, Any]) -> None:
+    """Report hits, misses and size of `cache`, replacing a cache watched as `name`."""
+    _caches[name] = cache
+
+
+def _collect_caches() -> Iterable[_Metric[Any]]:
+    hits = Counter("drawbridge_cache_hits_total", "Cache lookups that found a value.", ["cache"])
+    misses = Counter(
+        "drawbridge_cache_misses_total",
+        "Cache lookups that found nothing or an expired value.",
+        ["cache"],
+    )
+    ratio = Gauge("drawbridge_cache_hit_ratio", "Hits over all lookups.", ["cache"])
+    entries = Gauge("drawbridge_cache_entries", "Values held by the cache.", ["cache"])
+    for name, cache in _caches.items():
+        hits.labels(name).set(cache.hits)
+        misses.labels(name).set(cache.misses)
+        lookups = cache.hits + cache.misses
+        ratio.labels(name).set(cache.hits / lookups if lookups else 0)
+        entries.labels(name).set(len(cache))
+    return (hits, misses, ratio, entries)
+
+
+registry.set_collector("caches", _collect_caches)
@@ -0,0 +1 @@
+"""Services for drawbridge_backend."""
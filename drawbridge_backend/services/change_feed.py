@@ -0,0 +1,234 @@
+import asyncio
+import contextlib
+import dataclasses
+import logging
+from collections import defaultdict
+from typing import Any, AsyncIterator, Callable, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from drawbridge_backend.domain.enums import ChangeTypeEnum
+from drawbridge_backend.domain.impl.tables import ROW_CHANGES_CHANNEL, load_row_change
+from drawbridge_backend.domain.tables.entities import RowChange
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class ChangeBatch:
+    """
+    Coalesced row changes of a single table.
+
+    Every row id ends up in at most one of the sets, so a row updated many
+    times within a batch is reported once, and a row both inserted and deleted
+    within a batch is not reported at all.
+    """
+
+    inserted: set[int] = dataclasses.field(default_factory=set)
+    updated: set[int] = dataclasses.field(default_factory=set)
+    deleted: set[int] = dataclasses.field(default_factory=set)
+    resync: bool = False
+
+    def add(self, change: RowChange) -> None:
+        for row_id in change.row_ids:
+            if change.change_type is ChangeTypeEnum.INSERT:
+                self.inserted.add(row_id)
+            elif change.change_type is ChangeTypeEnum.UPDATE:
+                if row_id not in self.inserted:
+                    self.updated.add(row_id)
+            elif row_id in self.inserted:
+                self.inserted.discard(row_id)
+            else:
+                self.updated.discard(row_id)
+                self.deleted.add(row_id)
+
+    def __bool__(self) -> bool:
+        return bool(self.inserted or self.updated or self.deleted or self.resync)
+
+
+class Subscription:
+    """Pending row changes of one table for a single consumer."""
+
+    def __init__(self, table_id: int, queue_size: int) -> None:
+        self.table_id = table_id
+        # None only wakes up the consumer, see `request_resync`.
+        self._queue: asyncio.Queue[RowChange | None] = asyncio.Queue(maxsize=queue_size)
+        self._needs_resync = False
+
+    def push(self, change: RowChange) -> None:
+        try:
+            self._queue.put_nowait(change)
+        except asyncio.QueueFull:
+            # Consumer can't keep up, it has to refetch the table anyway.
+            self._needs_resync = True
+
+    def request_resync(self) -> None:
+        """Make the next batch ask the consumer to refetch the table."""
+        self._needs_resync = True
+        with contextlib.suppress(asyncio.QueueFull):
+            self._queue.put_nowait(None)
+
+    async def next_batch(self, window: float) -> ChangeBatch:
+        """
+        Wait for changes and coalesce everything arriving within `window`.
+
+        :param window: seconds to keep collecting after the first change.
+        :return: coalesced changes.
+        """
+        changes = [await self._queue.get()]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + window
+        while (timeout := deadline - loop.time()) > 0 and not self._needs_resync:
+            try:
+                changes.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        while not self._queue.empty():
+            changes.append(self._queue.get_nowait())
+
+        if self._needs_resync:
+            self._needs_resync = False
+            return ChangeBatch(resync=True)
+        batch = ChangeBatch()
+        for change in changes:
+            if change is not None:
+                batch.add(change)
+        return batch
+
+
+class ChangeFeed:
+    """
+    Fans out storage row changes to subscribers of this worker.
+
+    Write paths of SqlAlchemyTablesService publish changed row ids with
+    NOTIFY, so a single LISTEN connection per worker receives changes made
+    by every worker. Given an engine, the connection is only opened once
+    somebody needs changes, most workers never do. Changes are published
+    on the storage shard of the table, so there's a connection per shard.
+
+    A dropped connection is reopened with backoff. Changes made meanwhile
+    are lost, so every subscriber is asked to resync once it's back.
+    """
+
+    def __init__(
+        self,
+        queue_size: int,
+        engine: AsyncEngine | None = None,
+        shard_engines: Sequence[AsyncEngine] = (),
+        reconnect_delay: float = 0.5,
+        max_reconnect_delay: float = 30.0,
+    ) -> None:
+        self._queue_size = queue_size
+        self._engine = engine
+        self._shard_engines = shard_engines
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._start_lock = asyncio.Lock()
+        self._subscriptions: dict[int, set[Subscription]] = defaultdict(set)
+        self._listeners: list[Callable[[RowChange], None]] = []
+        # LISTEN connections by engine, a lost one is missing until reopened.
+        self._connections: dict[AsyncEngine, AsyncConnection] = {}
+        self._reconnect_tasks: set[asyncio.Task[None]] = set()
+
+    @property
+    def is_started(self) -> bool:
+        return bool(self._connections or self._reconnect_tasks)
+
+    async def _listen(self, engine: AsyncEngine) -> AsyncConnection:
+        connection = await engine.connect()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection: Any = raw_connection.driver_connection
+        await driver_connection.add_listener(ROW_CHANGES_CHANNEL, self._on_notification)
+        driver_connection.add_termination_listener(
+            lambda _: self._on_connection_lost(engine, connection),
+        )
+        return connection
+
+    async def start(self, engine: AsyncEngine) -> None:
+        self._connections[engine] = await self._listen(engine)
+
+    async def ensure_started(self) -> None:
+        """Start listening with the engines given on construction, once."""
+        async with self._start_lock:
+            if not self.is_started and self._engine is not None:
+                for engine in (self._engine, *self._shard_engines):
+                    await self.start(engine)
+
+    async def stop(self) -> None:
+        for task in self._reconnect_tasks:
+            task.cancel()
+        await asyncio.gather(*self._reconnect_tasks, return_exceptions=True)
+        connections = list(self._connections.values())
+        # Connections closed here aren't lost, see `_on_connection_lost`.
+        self._connections.clear()
+        for connection in connections:
+            await connection.close()
+
+    def _on_connection_lost(self, engine: AsyncEngine, connection: AsyncConnection) -> None:
+        if self._connections.get(engine) is not connection:
+            return
+        del self._connections[engine]
+        logger.warning("Connection listening for row changes was lost, reconnecting")
+        task = asyncio.create_task(self._reconnect(engine, connection))
+        self._reconnect_tasks.add(task)
+        task.add_done_callback(self._reconnect_tasks.discard)
+
+    async def _reconnect(self, engine: AsyncEngine, lost: AsyncConnection) -> None:
+        # The lost connection must not go back to the pool.
+        with contextlib.suppress(Exception):
+            await lost.invalidate()
+        delay = self._reconnect_delay
+        while True:
+            try:
+                self._connections[engine] = await self._listen(engine)
+                break
+            except Exception:
+                logger.warning(
+                    "Failed to listen for row changes, retrying in %.1fs",
+                    delay,
+                    exc_info=True,
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self._max_reconnect_delay)
+        logger.info("Listening for row changes again")
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.request_resync()
+
+    def add_listener(self, listener: Callable[[RowChange], None]) -> None:
+        """Call `listener` on every row change of any table."""
+        self._listeners.append(listener)
+
+    def publish(self, change: RowChange) -> None:
+        for listener in self._listeners:
+            listener(change)
+        for subscription in self._subscriptions.get(change.table_id, ()):
+            subscription.push(change)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, table_id: int) -> AsyncIterator[Subscription]:
+        await self.ensure_started()
+        subscription = Subscription(table_id, self._queue_size)
+        self._subscriptions[table_id].add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscriptions[table_id].discard(subscription)
+            if not self._subscriptions[table_id]:
+                del self._subscriptions[table_id]
+
+    def _on_notification(
+        self,
+        connection: Any,
+        pid: int,
+        channel: str,
+        payload: str,
+    ) -> None:
+        try:
+            change = load_row_change(payload)
+        except (ValueError, KeyError):
+            logger.warning("Malformed row change notification: %s", payload)
+            return
+        self.publish(change)
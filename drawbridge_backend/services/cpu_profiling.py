@@ -0,0 +1,168 @@
+import collections
+import contextlib
+import cProfile
+import dataclasses
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+import types
+import uuid
+from typing import Iterator, Literal
+
+from drawbridge_backend.cache import TTLCache
+from drawbridge_backend.settings import settings
+
+ProfileKind = Literal["sample", "cprofile"]
+
+
+def _frame_label(frame: types.FrameType) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of a thread from a separate thread.
+
+    The profiled thread runs undisturbed, sampling costs it only the GIL
+    switches, so it is fit for profiling a worker under real traffic. On
+    the event loop thread the samples include whatever coroutine runs.
+    """
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        # "outermost;...;innermost" -> number of samples
+        self.stacks: collections.Counter[str] = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="sampling_profiler", daemon=True)
+
+    def _sample(self) -> None:
+        labels: dict[types.CodeType, str] = {}
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # noqa: SLF001
+            stack = []
+            while frame is not None:
+                label = labels.get(frame.f_code)
+                if label is None:
+                    label = labels[frame.f_code] = _frame_label(frame)
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> str:
+        """
+        Stop sampling.
+
+        :return: stacks in the collapsed format of flamegraph.pl and speedscope.
+        """
+        self._stopped.set()
+        self._thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def format_pstats(profiler: cProfile.Profile, limit: int = 50) -> str:
+    """Functions of a deterministic profile sorted by cumulative time."""
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
+
+
+def dump_pstats(profiler: cProfile.Profile) -> bytes:
+    """Profile in the format of pstats.Stats.dump_stats, for snakeviz and the like."""
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)  # type: ignore[attr-defined]
+
+
+@dataclasses.dataclass
+class StoredProfile:
+    kind: ProfileKind
+    # what was profiled, e.g. "POST /api/tables/fetchRows"
+    target: str
+    created_at: float = dataclasses.field(default_factory=time.time)
+    # collapsed stacks for "sample", pstats report for "cprofile"
+    report: str = ""
+    # marshalled pstats for "cprofile"
+    pstats: bytes | None = None
+
+
+@contextlib.contextmanager
+def profile_thread(kind: ProfileKind, target: str, interval: float) -> Iterator[StoredProfile]:
+    """
+    Profile the current thread while in the block.
+
+    :param interval: seconds between samples of the sampling profiler.
+    :yield: the profile, filled in when the block ends.
+    """
+    profile = StoredProfile(kind, target)
+    if kind == "sample":
+        sampler = SamplingProfiler(threading.get_ident(), interval)
+        sampler.start()
+        try:
+            yield profile
+        finally:
+            profile.report = sampler.stop()
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profile
+    finally:
+        profiler.disable()
+        profile.report = format_pstats(profiler)
+        profile.pstats = dump_pstats(profiler)
+
+
+class CPUProfiler:
+    """
+    Runs one profile at a time on the event loop thread and keeps the results.
+
+    cProfile can't be nested and overlapping samplers would only add up
+    their overhead, so profiles requested while one runs are refused. Both
+    profilers see the whole thread, a request profile includes whatever
+    other requests ran on the event loop meanwhile.
+    """
+
+    def __init__(self, stored_profiles: int, ttl: float = 60 * 60) -> None:
+        self._lock = threading.Lock()
+        self._profiles: TTLCache[str, StoredProfile] = TTLCache(stored_profiles, ttl)
+
+    @property
+    def is_busy(self) -> bool:
+        return self._lock.locked()
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[bool]:
+        """
+        Claim the profiler.
+
+        :yield: whether it was free, if not the caller must not profile.
+        """
+        acquired = self._lock.acquire(blocking=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._lock.release()
+
+    def store(self, profile_id: str, profile: StoredProfile) -> None:
+        self._profiles.set(profile_id, profile)
+
+    def get(self, profile_id: str) -> StoredProfile | None:
+        return self._profiles.get(profile_id)
+
+
+def new_profile_id() -> str:
+    return uuid.uuid4().hex
+
+
+cpu_profiler = CPUProfiler(settings.profiling_stored_profiles)
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from drawbridge_backend.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+loop_lag = registry.histogram(
+    "drawbridge_event_loop_lag_seconds",
+    "Delay of the event loop in running a task that was due.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+).labels()
+loop_blocks = registry.counter(
+    "drawbridge_event_loop_blocked_total",
+    "Times the event loop was blocked for longer than the lag threshold.",
+).labels()
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag and logs what blocks the loop.
+
+    A task on the loop wakes up every `interval` seconds and records how
+    late it was woken. A watchdog thread checks that the task keeps waking
+    up, once it hasn't for `threshold` seconds the loop is blocked and the
+    stack of the loop thread, i.e. the blocking code, is logged while it
+    still runs. Each block is logged once.
+    """
+
+    def __init__(self, interval: float, threshold: float) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id = 0
+        self._heartbeat_task: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+        # time.monotonic() of the last heartbeat, written by the loop thread
+        self._last_beat = 0.0
+
+    def start(self) -> None:
+        """Start monitoring the running loop."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(
+            target=self._watch,
+            name="loop_monitor",
+            daemon=True,
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - self._last_beat - self.interval, 0.0)
+            loop_lag.observe(lag)
+            if lag >= self.threshold:
+                loop_blocks.inc()
+
+    def _watch(self) -> None:
+        reported_beat = None
+        # Checked often enough to catch the loop blocked soon after the threshold.
+        while not self._stopped.wait(min(self.interval, self.threshold) / 2):
+            beat = self._last_beat
+            blocked_for = time.monotonic() - beat - self.interval
+            if blocked_for >= self.threshold and beat != reported_beat:
+                reported_beat = beat
+                self._report(blocked_for)
+
+    def _report(self, blocked_for: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)  # noqa: SLF001
+        if frame is None:
+            return
+        # Reading the current task from another thread is racy, but it is
+        # only a name for the log.
+        task = asyncio.current_task(self._loop)
+        coroutine = task.get_coro() if task is not None else None
+        logger.warning(
+            "Event loop blocked for %.0fms so far, in %s:\n%s",
+            blocked_for * 1000,
+            getattr(coroutine, "__qualname__", "a callback"),
+            "".join(traceback.format_stack(frame)),
+        )
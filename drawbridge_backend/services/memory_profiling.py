@@ -0,0 +1,148 @@
+import contextvars
+import dataclasses
+import tracemalloc
+import uuid
+from typing import Literal, Sequence
+
+from drawbridge_backend.cache import TTLCache
+from drawbridge_backend.settings import settings
+
+GroupBy = Literal["lineno", "filename", "traceback"]
+
+# Allocations of tracemalloc itself and of imports are noise in snapshots.
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+@dataclasses.dataclass
+class RequestMemory:
+    """Table a request worked on, memory it used is recorded against it."""
+
+    # table id, "none" or "multiple"
+    table: str = "none"
+
+
+current_request_memory: contextvars.ContextVar[RequestMemory | None] = contextvars.ContextVar(
+    "current_request_memory",
+    default=None,
+)
+
+
+def note_table(table_id: int) -> None:
+    """Record that the current request works on a table."""
+    usage = current_request_memory.get()
+    if usage is None:
+        return
+    label = str(table_id)
+    if usage.table == "none":
+        usage.table = label
+    elif usage.table != label:
+        usage.table = "multiple"
+
+
+class MemoryTracker:
+    """
+    Controls tracemalloc and keeps snapshots for diffing.
+
+    Tracing slows allocations down and takes memory for every traced block,
+    so it only runs when started by an admin.
+    """
+
+    def __init__(self, stored_snapshots: int, ttl: float = 60 * 60) -> None:
+        self._snapshots: TTLCache[str, tracemalloc.Snapshot] = TTLCache(stored_snapshots, ttl)
+        self._requests_in_flight = 0
+
+    @property
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int) -> None:
+        """Start tracing, keeping `frames` frames of every allocation's traceback."""
+        if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+            tracemalloc.stop()
+        tracemalloc.start(frames)
+
+    def stop(self) -> None:
+        """Stop tracing, stored snapshots stay available."""
+        tracemalloc.stop()
+
+    def take_snapshot(self) -> str:
+        """
+        Snapshot of memory allocated since tracing started.
+
+        :return: id of the stored snapshot.
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        snapshot_id = uuid.uuid4().hex
+        self._snapshots.set(snapshot_id, snapshot)
+        return snapshot_id
+
+    def get(self, snapshot_id: str) -> tracemalloc.Snapshot | None:
+        return self._snapshots.get(snapshot_id)
+
+    def request_started(self) -> int:
+        """
+        Start measuring the peak memory of a request.
+
+        tracemalloc only has a single peak. It is reset when no other
+        request runs, so with concurrent requests each is charged for the
+        allocations of those overlapping it: peaks are upper bounds, exact
+        for a request that ran alone.
+
+        :return: traced memory at the start, for `request_finished`.
+        """
+        if self._requests_in_flight == 0:
+            tracemalloc.reset_peak()
+        self._requests_in_flight += 1
+        return tracemalloc.get_traced_memory()[0]
+
+    def request_finished(self, traced_at_start: int) -> int:
+        """
+        Finish measuring the peak memory of a request.
+
+        :return: bytes the peak went above memory traced at the start.
+        """
+        self._requests_in_flight -= 1
+        return max(tracemalloc.get_traced_memory()[1] - traced_at_start, 0)
+
+
+def _format_size(size: int) -> str:
+    if abs(size) < 1024:
+        return f"{size} B"
+    scaled = float(size)
+    for unit in ("KiB", "MiB", "GiB"):
+        scaled /= 1024
+        if abs(scaled) < 1024 or unit == "GiB":
+            break
+    return f"{scaled:.1f} {unit}"
+
+
+def format_statistics(
+    statistics: Sequence[tracemalloc.Statistic | tracemalloc.StatisticDiff],
+    limit: int,
+) -> str:
+    """Largest statistics or differences of a snapshot as text, one per block."""
+    lines = []
+    for stat in statistics[:limit]:
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            lines.append(
+                f"{_format_size(stat.size)} ({stat.size_diff:+,} B) in "
+                f"{stat.count} blocks ({stat.count_diff:+,})",
+            )
+        else:
+            lines.append(f"{_format_size(stat.size)} in {stat.count} blocks")
+        lines.extend(stat.traceback.format(most_recent_first=True))
+    total = sum(stat.size for stat in statistics)
+    lines.append(f"Total: {_format_size(total)} in {len(statistics)} places")
+    diffs = [stat for stat in statistics if isinstance(stat, tracemalloc.StatisticDiff)]
+    if diffs:
+        growth = sum(stat.size_diff for stat in diffs)
+        lines[-1] += f" ({growth:+,} B)"
+    return "\n".join(lines) + "\n"
+
+
+memory_tracker = MemoryTracker(settings.memory_stored_snapshots)
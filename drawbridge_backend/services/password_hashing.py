@@ -0,0 +1,159 @@
+import asyncio
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from fastapi_users.password import PasswordHelperProtocol
+
+from drawbridge_backend.metrics import Counter, Gauge
+
+T = TypeVar("T")
+
+
+@dataclasses.dataclass
+class PasswordHashingStats:
+    # calls waiting for a free worker
+    queued: int = 0
+    running: int = 0
+    completed: int = 0
+    # seconds spent waiting for a worker and hashing, over completed calls
+    wait_seconds: float = 0.0
+    run_seconds: float = 0.0
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification on a bounded thread pool.
+
+    Hashes are deliberately slow and CPU bound, on the event loop a burst of
+    logins would stall every other request of the worker. Argon2 and bcrypt
+    release the GIL, so threads are enough to run them in parallel.
+
+    The semaphore keeps waiting calls out of the executor's unbounded queue:
+    they are counted in `stats` and a call cancelled while waiting (e.g. the
+    client went away) never occupies a worker.
+    """
+
+    def __init__(self, password_helper: PasswordHelperProtocol, workers: int) -> None:
+        self.password_helper = password_helper
+        self.stats = PasswordHashingStats()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="password_hashing",
+        )
+        self._semaphore = asyncio.Semaphore(workers)
+
+    async def _run(self, func: Callable[..., T], *args: str) -> T:
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        self.stats.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.stats.queued -= 1
+        started_at = loop.time()
+        self.stats.running += 1
+        try:
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._semaphore.release()
+            self.stats.running -= 1
+            self.stats.completed += 1
+            self.stats.wait_seconds += started_at - queued_at
+            self.stats.run_seconds += loop.time() - started_at
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.password_helper.hash, password)
+
+    async def verify_and_update(
+        self,
+        plain_password: str,
+        hashed_password: str,
+    ) -> tuple[bool, Optional[str]]:
+        return await self._run(
+            self.password_helper.verify_and_update,
+            plain_password,
+            hashed_password,
+        )
+
+    def prepared_helper(self) -> "PreparedPasswordHelper":
+        """Password helper returning results of calls prepared on this hasher."""
+        return PreparedPasswordHelper(self)
+
+    def collect_metrics(self) -> list[Gauge | Counter]:
+        """Metrics of `stats`, for the metrics registry."""
+        values: dict[Gauge | Counter, float] = {
+            Gauge(
+                "drawbridge_password_hashing_queued",
+                "Calls waiting for a worker.",
+            ): self.stats.queued,
+            Gauge(
+                "drawbridge_password_hashing_running",
+                "Calls being run by a worker.",
+            ): self.stats.running,
+            Counter(
+                "drawbridge_password_hashing_completed_total",
+                "Completed calls.",
+            ): self.stats.completed,
+            Counter(
+                "drawbridge_password_hashing_wait_seconds_total",
+                "Time completed calls waited for a worker.",
+            ): self.stats.wait_seconds,
+            Counter(
+                "drawbridge_password_hashing_run_seconds_total",
+                "Time completed calls were run.",
+            ): self.stats.run_seconds,
+        }
+        for metric, value in values.items():
+            metric.labels().set(value)
+        return list(values)
+
+
+class PreparedPasswordHelper(PasswordHelperProtocol):
+    """
+    Password helper of a user manager, with slow calls made ahead of time.
+
+    fastapi-users calls its password helper synchronously from the event
+    loop. The manager prepares the hashes and verifications it's about to
+    need on the `PasswordHasher` pool, and the helper hands them out once.
+    Calls that weren't prepared run inline.
+    """
+
+    def __init__(self, hasher: PasswordHasher) -> None:
+        self._hasher = hasher
+        self._hashes: dict[str, str] = {}
+        self._verifications: dict[tuple[str, str], tuple[bool, Optional[str]]] = {}
+
+    async def prepare_hash(self, password: str) -> None:
+        self._hashes[password] = await self._hasher.hash(password)
+
+    async def prepare_verify_and_update(
+        self,
+        plain_password: str,
+        hashed_password: str,
+    ) -> None:
+        self._verifications[plain_password, hashed_password] = (
+            await self._hasher.verify_and_update(plain_password, hashed_password)
+        )
+
+    def hash(self, password: str) -> str:
+        hashed = self._hashes.pop(password, None)
+        if hashed is None:
+            hashed = self._hasher.password_helper.hash(password)
+        return hashed
+
+    def verify_and_update(
+        self,
+        plain_password: str,
+        hashed_password: str,
+    ) -> tuple[bool, Optional[str]]:
+        result = self._verifications.pop((plain_password, hashed_password), None)
+        if result is None:
+            result = self._hasher.password_helper.verify_and_update(
+                plain_password,
+                hashed_password,
+            )
+        return result
+
+    def generate(self) -> str:
+        return self._hasher.password_helper.generate()
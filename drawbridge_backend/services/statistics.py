@@ -0,0 +1,88 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from drawbridge_backend.background import run_in_background
+from drawbridge_backend.cache import TTLCache
+from drawbridge_backend.domain.tables.entities import RowChange, TableStatistics
+
+# Computes statistics of a table given the data version of the cached ones,
+# returns None if the data hasn't changed since.
+StatisticsLoader = Callable[[int, int | None], Awaitable[TableStatistics | None]]
+
+
+class StatisticsCache:
+    """
+    Latest column statistics of tables, refreshed in the background.
+
+    Only tables whose statistics were requested recently are kept, at most
+    `maxsize` of them. Row changes mark
+    them stale and schedule a refresh, which is delayed so that a burst of
+    writes costs a single recomputation. Readers get the cached statistics
+    right away, stale or not.
+    """
+
+    def __init__(
+        self,
+        loader: StatisticsLoader,
+        refresh_delay: float,
+        maxsize: int,
+        ttl: float,
+    ) -> None:
+        self._loader = loader
+        self._refresh_delay = refresh_delay
+        self._entries: TTLCache[int, TableStatistics] = TTLCache(maxsize, ttl)
+        self._stale: set[int] = set()
+        self._pending: dict[int, "asyncio.Task[None]"] = {}
+
+    def get(self, table_id: int) -> tuple[TableStatistics | None, bool]:
+        """
+        :return: cached statistics and whether they are stale.
+        """
+        statistics = self._entries.get(table_id)
+        return statistics, statistics is not None and table_id in self._stale
+
+    def put(self, statistics: TableStatistics) -> None:
+        self._entries.set(statistics.table_id, statistics)
+
+    async def load(self, table_id: int) -> TableStatistics:
+        """Compute and cache statistics of a table not cached yet."""
+        statistics = await self._loader(table_id, None)
+        if statistics is None:
+            raise RuntimeError(f"No statistics computed for table {table_id}")
+        self._stale.discard(table_id)
+        self.put(statistics)
+        return statistics
+
+    def forget(self, table_id: int) -> None:
+        self._entries.pop(table_id)
+        self._stale.discard(table_id)
+        if task := self._pending.pop(table_id, None):
+            task.cancel()
+
+    def on_row_change(self, change: RowChange) -> None:
+        if change.table_id not in self._entries:
+            return
+        self._stale.add(change.table_id)
+        if change.table_id not in self._pending:
+            self._pending[change.table_id] = run_in_background(
+                self._refresh(change.table_id),
+                name=f"refresh_statistics_{change.table_id}",
+            )
+
+    async def stop(self) -> None:
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+
+    async def _refresh(self, table_id: int) -> None:
+        await asyncio.sleep(self._refresh_delay)
+        # Changes arriving from now on need another refresh.
+        self._pending.pop(table_id, None)
+        self._stale.discard(table_id)
+        cached = self._entries.get(table_id)
+        statistics = await self._loader(
+            table_id,
+            cached.data_version if cached else None,
+        )
+        if statistics is not None and table_id in self._entries:
+            self.put(statistics)
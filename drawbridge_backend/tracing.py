@@ -0,0 +1,292 @@
+"""
+Lightweight request tracing.
+
+A trace is started per sampled request (or continued from a W3C
+`traceparent` header) and spans are opened around route handlers, tables
+service methods and SQL statements. When the local root span ends, the
+spans of the trace are handed to an exporter on a background thread, so
+exporting never blocks the event loop.
+
+Requests that aren't sampled only pay for a context variable lookup per
+would-be span.
+"""
+
+import contextlib
+import contextvars
+import dataclasses
+import functools
+import json
+import queue
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Iterator,
+    ParamSpec,
+    Protocol,
+    TextIO,
+    TypeVar,
+)
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+# Span times are taken from the monotonic clock and shifted to wall time.
+_PERF_COUNTER_EPOCH_NS = time.time_ns() - time.perf_counter_ns()
+
+
+def to_unix_ns(perf_counter: float) -> int:
+    """Wall time of a time.perf_counter() value, in nanoseconds."""
+    return int(perf_counter * 1e9) + _PERF_COUNTER_EPOCH_NS
+
+
+def _now_ns() -> int:
+    return time.perf_counter_ns() + _PERF_COUNTER_EPOCH_NS
+
+
+@dataclasses.dataclass
+class Span:
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    name: str
+    start_ns: int
+    end_ns: int | None = None
+    attributes: dict[str, Any] = dataclasses.field(default_factory=dict)
+    # "error" if an exception escaped the span
+    status: str = "ok"
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": ((self.end_ns or self.start_ns) - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+@dataclasses.dataclass
+class Trace:
+    """Spans of one trace recorded by this worker."""
+
+    trace_id: str
+    spans: list[Span] = dataclasses.field(default_factory=list)
+
+
+class SpanExporter(Protocol):
+    def export(self, spans: list[Span]) -> None:
+        """Write out finished spans of a trace, called from the export thread."""
+
+    def shutdown(self) -> None:
+        """Flush and release resources."""
+
+
+class StreamSpanExporter:
+    """Writes spans as JSON lines, to stderr by default."""
+
+    def __init__(self, stream: TextIO | None = None) -> None:
+        self._stream = stream or sys.stderr
+
+    def export(self, spans: list[Span]) -> None:
+        self._stream.write("".join(json.dumps(s.to_dict()) + "\n" for s in spans))
+        self._stream.flush()
+
+    def shutdown(self) -> None:
+        self._stream.flush()
+
+
+class FileSpanExporter(StreamSpanExporter):
+    """Appends spans as JSON lines to a file."""
+
+    def __init__(self, path: str) -> None:
+        super().__init__(open(path, "a", encoding="utf-8"))  # noqa: SIM115
+
+    def shutdown(self) -> None:
+        self._stream.close()
+
+
+class Tracer:
+    """Starts, samples and exports traces."""
+
+    def __init__(self) -> None:
+        self._exporter: SpanExporter | None = None
+        self._sample_rate = 0.0
+        self._queue: queue.SimpleQueue[list[Span] | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._current_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+            "current_trace",
+            default=None,
+        )
+        self._current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+            "current_span",
+            default=None,
+        )
+
+    def configure(self, exporter: SpanExporter | None, sample_rate: float) -> None:
+        """Start tracing to `exporter`, None stops tracing."""
+        self.shutdown()
+        self._exporter = exporter
+        self._sample_rate = sample_rate
+        if exporter is not None:
+            self._thread = threading.Thread(target=self._export, name="tracing", daemon=True)
+            self._thread.start()
+
+    def shutdown(self) -> None:
+        """Export queued traces and stop the export thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._exporter is not None:
+            self._exporter.shutdown()
+            self._exporter = None
+
+    def _export(self) -> None:
+        while (spans := self._queue.get()) is not None:
+            try:
+                self._exporter.export(spans)  # type: ignore[union-attr]
+            except Exception as error:
+                sys.stderr.write(f"Failed to export spans: {error}\n")
+
+    @property
+    def is_recording(self) -> bool:
+        """Whether the current request is traced."""
+        return self._current_trace.get() is not None
+
+    @property
+    def current_trace_id(self) -> str | None:
+        trace = self._current_trace.get()
+        return trace.trace_id if trace is not None else None
+
+    @contextlib.contextmanager
+    def start_trace(self, name: str, traceparent: str | None = None) -> Iterator[Span | None]:
+        """
+        Root span of the worker for a request.
+
+        Continues the trace of a valid `traceparent` if its sampled flag is
+        set, otherwise a new trace is sampled at the configured rate.
+
+        :yield: the span, None if the request isn't traced.
+        """
+        trace_id, parent_id, sampled = None, None, False
+        if self._exporter is not None:
+            parsed = parse_traceparent(traceparent) if traceparent else None
+            if parsed is not None:
+                trace_id, parent_id, sampled = parsed
+            else:
+                sampled = random.random() < self._sample_rate  # noqa: S311
+        if not sampled:
+            yield None
+            return
+
+        trace = Trace(trace_id or secrets.token_hex(16))
+        token = self._current_trace.set(trace)
+        try:
+            with self._span(trace, parent_id, name, {}) as span:
+                yield span
+        finally:
+            self._current_trace.reset(token)
+            self._queue.put(trace.spans)
+
+    @contextlib.contextmanager
+    def start_span(self, name: str, **attributes: Any) -> Iterator[Span | None]:
+        """
+        Child of the current span.
+
+        :yield: the span, None if the current request isn't traced.
+        """
+        trace = self._current_trace.get()
+        if trace is None:
+            yield None
+            return
+        parent = self._current_span.get()
+        with self._span(trace, parent.span_id if parent else None, name, attributes) as span:
+            yield span
+
+    @contextlib.contextmanager
+    def _span(
+        self,
+        trace: Trace,
+        parent_id: str | None,
+        name: str,
+        attributes: dict[str, Any],
+    ) -> Iterator[Span]:
+        span = Span(trace.trace_id, secrets.token_hex(8), parent_id, name, _now_ns())
+        span.attributes.update(attributes)
+        token = self._current_span.set(span)
+        try:
+            yield span
+        except BaseException:
+            span.status = "error"
+            raise
+        finally:
+            self._current_span.reset(token)
+            span.end_ns = _now_ns()
+            trace.spans.append(span)
+
+    def record_span(self, name: str, start_ns: int, end_ns: int, **attributes: Any) -> None:
+        """Add an already finished child of the current span, e.g. measured elsewhere."""
+        trace, parent = self._current_trace.get(), self._current_span.get()
+        if trace is None:
+            return
+        trace.spans.append(
+            Span(
+                trace.trace_id,
+                secrets.token_hex(8),
+                parent.span_id if parent else None,
+                name,
+                start_ns,
+                end_ns,
+                attributes,
+            ),
+        )
+
+
+def parse_traceparent(header: str) -> tuple[str, str, bool] | None:
+    """
+    Trace id, parent span id and sampled flag of a W3C traceparent header.
+
+    :return: None if the header is malformed.
+    """
+    match = _TRACEPARENT.match(header.strip())
+    if match is None:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def format_traceparent(span: Span) -> str:
+    return f"00-{span.trace_id}-{span.span_id}-01"
+
+
+tracer = Tracer()
+
+
+def traced(
+    func: Callable[P, Coroutine[Any, Any, T]],
+) -> Callable[P, Coroutine[Any, Any, T]]:
+    """Run a coroutine function in a span named after it."""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        if not tracer.is_recording:
+            return await func(*args, **kwargs)
+        with tracer.start_span(name):
+            return await func(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,5 @@
+"""API for superusers to inspect workers."""
+
+from drawbridge_backend.web.api.admin.views import router
+
+__all__ = ["router"]
@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+
+
+class MemoryTracingSchema(BaseModel):
+    tracing: bool
+    # frames kept per allocation, 0 while not tracing
+    frames: int
+    traced_bytes: int
+    peak_bytes: int
+
+
+class MemorySnapshotSchema(BaseModel):
+    snapshot_id: str
+    traced_bytes: int
+    peak_bytes: int
+
+
+class ShardSchema(BaseModel):
+    name: str
+    # size of the shard's database
+    size_bytes: int
+    tables: int
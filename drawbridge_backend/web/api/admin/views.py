@@ -0,0 +1,218 @@
+import asyncio
+import threading
+import tracemalloc
+from typing import Literal
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse
+
+from drawbridge_backend.background import run_in_background
+from drawbridge_backend.db.models.users import current_superuser  # type: ignore
+from drawbridge_backend.db.shards import StorageShards
+from drawbridge_backend.services.cpu_profiling import (
+    SamplingProfiler,
+    StoredProfile,
+    cpu_profiler,
+    new_profile_id,
+)
+from drawbridge_backend.services.memory_profiling import (
+    GroupBy,
+    format_statistics,
+    memory_tracker,
+)
+from drawbridge_backend.settings import settings
+from drawbridge_backend.web.api.admin.schemas import (
+    MemorySnapshotSchema,
+    MemoryTracingSchema,
+    ShardSchema,
+)
+from drawbridge_backend.web.dependencies.tables import TableServiceDep, open_tables_service
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(current_superuser)],
+)
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = Query(default=10.0, gt=0),
+    interval_ms: float = Query(default=5.0, ge=0.1),
+) -> Response:
+    """
+    Sample the event loop of this worker for a while.
+
+    Returns the stacks in the collapsed format of flamegraph.pl and
+    speedscope, the profile can be fetched again by its X-Profile-Id.
+    """
+    if not settings.profiling_enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    seconds = min(seconds, settings.profiling_max_seconds)
+    with cpu_profiler.acquire() as acquired:
+        if not acquired:
+            raise HTTPException(status_code=409, detail="Another profile is running")
+        # Endpoints run on the event loop thread.
+        sampler = SamplingProfiler(threading.get_ident(), interval_ms / 1000)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            report = sampler.stop()
+
+    profile_id = new_profile_id()
+    profile = StoredProfile("sample", f"worker for {seconds:g}s", report=report)
+    cpu_profiler.store(profile_id, profile)
+    return PlainTextResponse(report, headers={"X-Profile-Id": profile_id})
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: Literal["text", "pstats"] = "text",
+) -> Response:
+    """
+    Profile of a request or of the worker.
+
+    "text" is collapsed stacks for sampled profiles and a report sorted by
+    cumulative time for cProfile ones, "pstats" is the raw cProfile data
+    for pstats, snakeviz and the like.
+    """
+    profile = cpu_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found or expired")
+    if format == "text":
+        return PlainTextResponse(profile.report)
+    if profile.pstats is None:
+        raise HTTPException(status_code=400, detail="Only cProfile profiles have pstats")
+    return Response(
+        profile.pstats,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.pstats"'},
+    )
+
+
+def _memory_tracing() -> MemoryTracingSchema:
+    traced, peak = tracemalloc.get_traced_memory()
+    return MemoryTracingSchema(
+        tracing=memory_tracker.is_tracing,
+        frames=tracemalloc.get_traceback_limit() if memory_tracker.is_tracing else 0,
+        traced_bytes=traced,
+        peak_bytes=peak,
+    )
+
+
+def _get_snapshot(snapshot_id: str) -> tracemalloc.Snapshot:
+    snapshot = memory_tracker.get(snapshot_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found or expired")
+    return snapshot
+
+
+@router.get("/memory")
+async def get_memory_tracing() -> MemoryTracingSchema:
+    """Whether tracemalloc traces allocations of this worker."""
+    return _memory_tracing()
+
+
+@router.post("/memory/start")
+async def start_memory_tracing(
+    frames: int = Query(default=10, ge=1, le=100),
+) -> MemoryTracingSchema:
+    """
+    Start tracing allocations of this worker.
+
+    Tracing makes allocations slower and memory use higher, more so with
+    more frames, stop it when done.
+    """
+    memory_tracker.start(frames)
+    return _memory_tracing()
+
+
+@router.post("/memory/stop")
+async def stop_memory_tracing() -> MemoryTracingSchema:
+    """Stop tracing allocations, snapshots can still be read."""
+    memory_tracker.stop()
+    return _memory_tracing()
+
+
+@router.post("/memory/snapshots")
+async def take_memory_snapshot() -> MemorySnapshotSchema:
+    """Snapshot memory allocated since tracing started."""
+    if not memory_tracker.is_tracing:
+        raise HTTPException(status_code=409, detail="Memory tracing isn't started")
+    # Taking a snapshot copies every trace, keep the loop responsive meanwhile.
+    snapshot_id = await asyncio.to_thread(memory_tracker.take_snapshot)
+    traced, peak = tracemalloc.get_traced_memory()
+    return MemorySnapshotSchema(snapshot_id=snapshot_id, traced_bytes=traced, peak_bytes=peak)
+
+
+@router.get("/memory/snapshots/{snapshot_id}", response_class=PlainTextResponse)
+async def get_memory_snapshot(
+    snapshot_id: str,
+    group_by: GroupBy = "lineno",
+    limit: int = Query(default=25, ge=1, le=1000),
+) -> Response:
+    """Places holding the most memory in a snapshot."""
+    snapshot = _get_snapshot(snapshot_id)
+    statistics = await asyncio.to_thread(snapshot.statistics, group_by)
+    return PlainTextResponse(format_statistics(statistics, limit))
+
+
+@router.get(
+    "/memory/snapshots/{snapshot_id}/diff/{base_snapshot_id}",
+    response_class=PlainTextResponse,
+)
+async def diff_memory_snapshots(
+    snapshot_id: str,
+    base_snapshot_id: str,
+    group_by: GroupBy = "lineno",
+    limit: int = Query(default=25, ge=1, le=1000),
+) -> Response:
+    """Places whose memory grew the most since the base snapshot."""
+    snapshot, base = _get_snapshot(snapshot_id), _get_snapshot(base_snapshot_id)
+    statistics = await asyncio.to_thread(snapshot.compare_to, base, group_by)
+    return PlainTextResponse(format_statistics(statistics, limit))
+
+
+@router.get("/shards")
+async def get_shards(request: Request, table_service: TableServiceDep) -> list[ShardSchema]:
+    """Storage shards with their size and number of tables."""
+    shards: StorageShards = request.app.state.storage_shards
+    sizes = await shards.get_sizes()
+    tables = await table_service.count_tables_by_shard()
+    return [
+        ShardSchema(name=name, size_bytes=sizes[name], tables=tables.get(name, 0))
+        for name in shards.names
+    ]
+
+
+async def _move_table(app: FastAPI, table_id: int, shard: str) -> None:
+    async with open_tables_service(app) as table_service:
+        table = await table_service.get_table_by_id(table_id)
+        await table_service.move_table(table, shard)
+
+
+@router.post("/tables/{table_id}/move", status_code=202)
+async def move_table(
+    table_id: int,
+    shard: str,
+    request: Request,
+    table_service: TableServiceDep,
+) -> None:
+    """
+    Start moving a table to another storage shard.
+
+    The table stays writable while it's copied, except for a moment at the
+    end. It's counted on the new shard by GET /admin/shards once moved.
+    """
+    if shard not in request.app.state.storage_shards.names:
+        raise HTTPException(status_code=400, detail=f"Unknown storage shard '{shard}'")
+    try:
+        await table_service.get_table_by_id(table_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Table not found") from None
+    run_in_background(
+        _move_table(request.app, table_id, shard),
+        name=f"move table {table_id} to shard {shard}",
+    )
@@ -1,12 +1,22 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from drawbridge_backend.metrics import CONTENT_TYPE, registry
 
 router = APIRouter()
 
 
 @router.get("/health")
-def health_check() -> None:
+async def health_check(request: Request) -> None:
     """
     Checks the health of a project.
 
-    It returns 200 if the project is healthy.
+    It returns 200 if the project is healthy and done warming up.
     """
+    if not getattr(request.app.state, "ready", True):
+        raise HTTPException(status_code=503, detail="Warming up")
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Metrics of this worker in the Prometheus text format."""
+    return Response(registry.render(), media_type=CONTENT_TYPE)
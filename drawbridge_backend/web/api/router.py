@@ -1,6 +1,6 @@
 from fastapi.routing import APIRouter
 
-from drawbridge_backend.web.api import monitoring, tables, users, sessions, namespaces
+from drawbridge_backend.web.api import admin, monitoring, tables, users, sessions, namespaces
 
 api_router = APIRouter()
 api_router.include_router(monitoring.router)
@@ -8,3 +8,4 @@ api_router.include_router(users.router)
 api_router.include_router(tables.router)
 api_router.include_router(sessions.router)
 api_router.include_router(namespaces.router)
+api_router.include_router(admin.router)
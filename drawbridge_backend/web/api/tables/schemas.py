@@ -1,10 +1,13 @@
 import datetime
+from typing import Annotated, Literal
 
 from pydantic import BaseModel, Field
 
-from drawbridge_backend.domain.enums import DataTypeEnum
+from drawbridge_backend.domain.enums import DataTypeEnum, DateTruncEnum
 from drawbridge_backend.domain.tables.entities import (
+    AggregateParam,
     FilteringParam,
+    GroupingParam,
     OrderingParam,
     RowData,
 )
@@ -23,13 +26,17 @@ class FieldSchema(BaseModel):
     is_nullable: bool
     default_value: str | None
     choices: list[ChoiceSchema] | None = None
+    has_trigram_index: bool = False
 
 
 class UpdateFieldDataSchema(BaseModel):
-    name: str | None
-    verbose_name: str | None
-    is_nullable: bool | None
-    default_value: str | None
+    name: str | None = None
+    verbose_name: str | None = None
+    is_nullable: bool | None = None
+    default_value: str | None = None
+    # Existing values are converted, a field can't be changed until it's done.
+    data_type: DataTypeEnum | None = None
+    # Choices can only be added, missing ones are kept.
     choices: list[str] | None = None
 
 
@@ -39,18 +46,38 @@ class UpdateFieldSchema(BaseModel):
     updated_data: UpdateFieldDataSchema
 
 
-class AddFieldSchema(BaseModel):
-    table_id: int
+class CreateFieldSchema(BaseModel):
     name: str
     verbose_name: str
     data_type: DataTypeEnum
-    is_nullable: bool
-    default_value: str | None
-    choices: list[str] | None
+    is_nullable: bool = True
+    default_value: str | None = None
+    choices: list[str] | None = None
+    has_trigram_index: bool = False
 
 
-class CreateFieldSchema(BaseModel):
-    pass
+class AddFieldSchema(CreateFieldSchema):
+    table_id: int
+
+
+class FieldUpdateSchema(BaseModel):
+    field_id: int
+    updated_data: UpdateFieldDataSchema
+
+
+class AlterFieldsSchema(BaseModel):
+    table_id: int
+    added: list[CreateFieldSchema] = []
+    updated: list[FieldUpdateSchema] = []
+    deleted: list[int] = []
+
+
+class PartitioningSchema(BaseModel):
+    # 0 stands for the row id
+    field_id: int
+    id_range: int
+    period: DateTruncEnum
+    retention: int | None = None
 
 
 class TableSchema(BaseModel):
@@ -61,6 +88,9 @@ class TableSchema(BaseModel):
     description: str | None
     namespace_id: int | None = None
     last_modified_at: datetime.datetime | None = None
+    partitioning: PartitioningSchema | None = None
+    # Storage shard the rows live on.
+    shard: str
 
     fields: list[FieldSchema]
 
@@ -89,6 +119,7 @@ class ValueSchema(BaseModel):
 class RowSchema(BaseModel):
     id: int = Field(alias="row_id")
     values: list[ValueSchema]
+    version: int
 
 
 class FetchRowsRequestSchema(BaseModel):
@@ -97,6 +128,8 @@ class FetchRowsRequestSchema(BaseModel):
     offset: int = 0
     filter_params: list[FilteringParam] | None = None
     ordering_params: list[OrderingParam] | None = None
+    # full-text query over string fields, e.g. `"exact phrase" -excluded`
+    search: str | None = None
 
 
 class FetchRowsResponseSchema(BaseModel):
@@ -104,6 +137,76 @@ class FetchRowsResponseSchema(BaseModel):
     rows: list[RowSchema]
 
 
+class FetchChangesRequestSchema(BaseModel):
+    table_id: int
+    # cursor of a previous response, all rows are fetched without one
+    since: str | None = None
+    limit: int = 1000
+
+
+class FetchChangesResponseSchema(BaseModel):
+    rows: list[RowSchema]
+    deleted: list[int]
+    cursor: str
+    has_more: bool
+    resync: bool
+
+
+class AggregateRequestSchema(BaseModel):
+    table_id: int
+    aggregates: list[AggregateParam]
+    group_by: list[GroupingParam] = []
+    filter_params: list[FilteringParam] | None = None
+    search: str | None = None
+    limit: int = 1000
+
+
+class AggregateResponseSchema(BaseModel):
+    columns: list[str]
+    rows: list[list[str | int | float | bool | datetime.datetime | None]]
+
+
+class FacetsRequestSchema(BaseModel):
+    table_id: int
+    field_ids: list[int]
+    limit: int = 10
+    filter_params: list[FilteringParam] | None = None
+    search: str | None = None
+    # count a sample of this percent of the table, for very large tables
+    sample_percent: float | None = Field(default=None, gt=0, le=100)
+
+
+class FacetValueSchema(BaseModel):
+    value: str | int | float | bool | datetime.datetime | None
+    count: int
+    label: str | None = None
+
+
+class FacetSchema(BaseModel):
+    field_id: int
+    values: list[FacetValueSchema]
+    is_approximate: bool
+
+
+class FieldStatisticsSchema(BaseModel):
+    field_id: int
+    null_ratio: float
+    distinct_estimate: int
+    min_value: str | int | float | datetime.datetime | None
+    max_value: str | int | float | datetime.datetime | None
+    histogram: list[str | int | float | datetime.datetime]
+
+
+class TableStatisticsSchema(BaseModel):
+    table_id: int
+    data_version: int
+    row_count: int
+    is_exact: bool
+    # a refresh is scheduled, rows have changed since data_version
+    is_stale: bool
+    fields: list[FieldStatisticsSchema]
+
+
 class InsertRowSchema(BaseModel):
     values: list[RowData]  # type: ignore
 
@@ -116,6 +219,7 @@ class InsertRowsRequestSchema(BaseModel):
 class UpdateRowSchema(BaseModel):
     row_id: int
     new_values: list[RowData]  # type: ignore
+    expected_version: int | None = None
 
 
 class UpdateRowsRequestSchema(BaseModel):
@@ -123,11 +227,69 @@ class UpdateRowsRequestSchema(BaseModel):
     updated_rows: list[UpdateRowSchema]
 
 
+class RowConflictSchema(BaseModel):
+    row_id: int
+    expected_version: int
+    current_version: int | None
+
+
 class InsertRowsResponseSchema(BaseModel):
     success: bool
     errors: list[str] | None
+    conflicts: list[RowConflictSchema] = []
 
 
 class DeleteRowsRequestSchema(BaseModel):
     table_id: int
     row_ids: list[int]
+    # row_id -> version, rows with another current version are kept
+    expected_versions: dict[int, int] | None = None
+
+
+class RowChangesMessageSchema(BaseModel):
+    inserted: list[RowSchema] = []
+    updated: list[RowSchema] = []
+    deleted: list[int] = []
+    resync: bool = False
+
+
+class InsertRowsOperationSchema(BaseModel):
+    type: Literal["insert"]
+    table_id: int
+    rows: list[InsertRowSchema]
+
+
+class UpdateRowsOperationSchema(BaseModel):
+    type: Literal["update"]
+    table_id: int
+    updated_rows: list[UpdateRowSchema]
+
+
+class DeleteRowsOperationSchema(BaseModel):
+    type: Literal["delete"]
+    table_id: int
+    row_ids: list[int]
+    expected_versions: dict[int, int] | None = None
+
+
+class BatchRequestSchema(BaseModel):
+    operations: list[
+        Annotated[
+            InsertRowsOperationSchema
+            | UpdateRowsOperationSchema
+            | DeleteRowsOperationSchema,
+            Field(discriminator="type"),
+        ]
+    ]
+
+
+class BatchOperationResultSchema(BaseModel):
+    rows: list[RowSchema]
+    deleted: list[int] = Field(alias="deleted_row_ids")
+    conflicts: list[RowConflictSchema]
+
+
+class BatchResponseSchema(BaseModel):
+    success: bool
+    errors: list[str] | None
+    results: list[BatchOperationResultSchema] = []
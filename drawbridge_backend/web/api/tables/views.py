@@ -1,18 +1,73 @@
-from fastapi import APIRouter
+import asyncio
+import dataclasses
+from typing import Any
 
-from drawbridge_backend.domain.tables.entities import UnSavedTable, InsertRow, UpdateRow
+from fastapi import (
+    APIRouter,
+    FastAPI,
+    HTTPException,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
+
+from drawbridge_backend.background import run_in_background
+from drawbridge_backend.domain.impl.tables import SqlAlchemyTablesService
+from drawbridge_backend.domain.tables.entities import (
+    BatchOperation,
+    ChangeCursor,
+    DeleteRowsOperation,
+    Field,
+    FieldChoice,
+    InsertRowsOperation,
+    UnSavedTable,
+    InsertRow,
+    UpdateRow,
+    UpdateRowsOperation,
+    SchemaChange,
+    Table,
+    UnSavedChoice,
+    UnSavedField,
+)
+from drawbridge_backend.services.change_feed import ChangeBatch, Subscription
+from drawbridge_backend.settings import settings
+from drawbridge_backend.tracing import tracer
 from drawbridge_backend.web.api.tables.schemas import (
+    AddFieldSchema,
+    AggregateRequestSchema,
+    AggregateResponseSchema,
+    AlterFieldsSchema,
+    BatchOperationResultSchema,
+    BatchRequestSchema,
+    BatchResponseSchema,
+    CreateFieldSchema,
+    DeleteFieldSchema,
+    FieldSchema,
+    InsertRowsOperationSchema,
+    UpdateRowsOperationSchema,
+    FetchChangesRequestSchema,
+    FetchChangesResponseSchema,
     FetchRowsRequestSchema,
     FetchRowsResponseSchema,
     InsertRowsRequestSchema,
     InsertRowsResponseSchema,
     TableSchema,
+    TableStatisticsSchema,
+    UpdateFieldDataSchema,
+    UpdateFieldSchema,
     UpdateRowsRequestSchema,
     UpdateTableSchema,
     RowSchema,
     DeleteRowsRequestSchema,
+    FacetSchema,
+    FacetsRequestSchema,
+    RowChangesMessageSchema,
+    RowConflictSchema,
+)
+from drawbridge_backend.web.dependencies.tables import (
+    TableServiceDep,
+    open_tables_service,
 )
-from drawbridge_backend.web.dependencies.tables import TableServiceDep
 
 router = APIRouter()
 
@@ -39,14 +94,209 @@ async def retrieve_table_by_id(
     return TableSchema.model_validate(table, from_attributes=True)
 
 
+@router.get("/tables/{table_id}/fields/{field_id}/autocomplete", tags=["rows"])
+async def autocomplete_field_values(
+    table_id: int,
+    field_id: int,
+    prefix: str,
+    table_service: TableServiceDep,
+    limit: int = 10,
+) -> list[str]:
+    """Most frequent values of a string field starting with a prefix."""
+    table = await table_service.get_table_by_id(table_id)
+    field = table.get_field_by_id(field_id)
+    if not field:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Field with ID '{field_id}' not found.",
+        )
+    return await table_service.autocomplete(table, field, prefix, limit)
+
+
+@router.get("/tables/{table_id}/statistics", tags=["rows"])
+async def retrieve_table_statistics(
+    table_id: int,
+    request: Request,
+) -> TableStatisticsSchema:
+    """
+    Per field statistics of a table.
+
+    Statistics are computed on the first request and then served from cache,
+    rows written since are accounted for by a background refresh.
+    """
+    cache = request.app.state.statistics
+    statistics, is_stale = cache.get(table_id)
+    if statistics is None:
+        # Cached statistics are refreshed on row changes.
+        await request.app.state.change_feed.ensure_started()
+        try:
+            statistics = await cache.load(table_id)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e)) from e
+    return TableStatisticsSchema.model_validate(
+        {**dataclasses.asdict(statistics), "is_stale": is_stale},
+    )
+
+
 @router.post("/tables", tags=["tables"])
 async def create_table(
     table_service: TableServiceDep, request: UnSavedTable
 ) -> TableSchema:
-    table = await table_service.create_table(request)
+    try:
+        table = await table_service.create_table(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
     return TableSchema.model_validate(table, from_attributes=True)
 
 
+async def _get_table(table_service: SqlAlchemyTablesService, table_id: int) -> Table:
+    try:
+        return await table_service.get_table_by_id(table_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Table not found") from None
+
+
+def _get_field(table: Table, field_id: int) -> Field:
+    field = table.get_field_by_id(field_id)
+    if not field:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Field with ID '{field_id}' not found.",
+        )
+    return field
+
+
+def _create_field(req: CreateFieldSchema) -> UnSavedField:
+    return UnSavedField(
+        name=req.name,
+        verbose_name=req.verbose_name,
+        data_type=req.data_type,
+        is_nullable=req.is_nullable,
+        default_value=req.default_value,
+        choices=[UnSavedChoice(value) for value in req.choices or []],
+        has_trigram_index=req.has_trigram_index,
+    )
+
+
+def _update_field(field: Field, req: UpdateFieldDataSchema) -> Field:
+    changes = {
+        attr: val
+        for attr, val in req.model_dump(exclude_unset=True).items()
+        # Only the default can be cleared.
+        if val is not None or attr == "default_value"
+    }
+    values = {c.value for c in field.choices}
+    # Choices are matched by value, new ones get their id once saved.
+    changes["choices"] = [
+        *field.choices,
+        *(FieldChoice(0, v) for v in changes.pop("choices", []) if v not in values),
+    ]
+    return dataclasses.replace(field, **changes)
+
+
+async def _finish_schema_change(app: FastAPI, change: SchemaChange) -> None:
+    async with open_tables_service(app) as table_service:
+        await table_service.finish_schema_change(change)
+    app.state.statistics.forget(change.table.table_id)
+
+
+async def _alter_fields(
+    request: Request,
+    table_service: SqlAlchemyTablesService,
+    table: Table,
+    fields: list[Field | UnSavedField],
+) -> Table:
+    try:
+        change = await table_service.alter_fields(table, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    request.app.state.statistics.forget(table.table_id)
+    if not change.is_finished:
+        run_in_background(
+            _finish_schema_change(request.app, change),
+            name=f"finish schema change of table {table.table_id}",
+        )
+    return change.table
+
+
+@router.post("/tables/alterFields", tags=["fields"])
+async def alter_table_fields(
+    req: AlterFieldsSchema,
+    table_service: TableServiceDep,
+    request: Request,
+) -> TableSchema:
+    """
+    Add, update and delete fields of a table at once.
+
+    Changes are made by a single schema change of the storage table, which
+    doesn't rewrite or block it. Values of fields changing type are
+    converted in the background, the fields keep their type until then.
+    """
+    table = await _get_table(table_service, req.table_id)
+    updates = {u.field_id: u.updated_data for u in req.updated}
+    for field_id in [*updates, *req.deleted]:
+        _get_field(table, field_id)
+    fields: list[Field | UnSavedField] = [
+        _update_field(f, updates[f.field_id]) if f.field_id in updates else f
+        for f in table.fields
+        if f.field_id not in req.deleted
+    ]
+    fields.extend(_create_field(f) for f in req.added)
+    table = await _alter_fields(request, table_service, table, fields)
+    return TableSchema.model_validate(table, from_attributes=True)
+
+
+@router.delete("/tables/deleteField", tags=["fields"])
+async def delete_table_field(
+    req: DeleteFieldSchema,
+    table_service: TableServiceDep,
+    request: Request,
+) -> TableSchema:
+    """Delete a field from a table."""
+    table = await _get_table(table_service, req.table_id)
+    _get_field(table, req.field_id)
+    fields: list[Field | UnSavedField] = [
+        f for f in table.fields if f.field_id != req.field_id
+    ]
+    table = await _alter_fields(request, table_service, table, fields)
+    return TableSchema.model_validate(table, from_attributes=True)
+
+
+@router.patch("/tables/updateField", tags=["fields"])
+async def update_table_field(
+    req: UpdateFieldSchema,
+    table_service: TableServiceDep,
+    request: Request,
+) -> TableSchema:
+    """
+    Update a field in a table.
+
+    A new data type is applied once existing values are converted in the background.
+    """
+    table = await _get_table(table_service, req.table_id)
+    _get_field(table, req.field_id)
+    fields: list[Field | UnSavedField] = [
+        _update_field(f, req.updated_data) if f.field_id == req.field_id else f
+        for f in table.fields
+    ]
+    table = await _alter_fields(request, table_service, table, fields)
+    return TableSchema.model_validate(table, from_attributes=True)
+
+
+@router.post("/tables/addField", tags=["fields"])
+async def add_table_field(
+    req: AddFieldSchema,
+    table_service: TableServiceDep,
+    request: Request,
+) -> FieldSchema:
+    """Add a field to a table, existing rows get its default value."""
+    table = await _get_table(table_service, req.table_id)
+    fields: list[Field | UnSavedField] = [*table.fields, _create_field(req)]
+    table = await _alter_fields(request, table_service, table, fields)
+    field = next(f for f in table.fields if f.name == req.name)
+    return FieldSchema.model_validate(field, from_attributes=True)
+
+
 @router.patch("/tables/{table_id}", tags=["tables"])
 async def update_table(
     table_id: int,
@@ -62,10 +312,15 @@ async def update_table(
 
 
 @router.delete("/tables/{table_id}", tags=["tables"])
-async def delete_table(table_id: int, table_service: TableServiceDep) -> None:
+async def delete_table(
+    table_id: int,
+    table_service: TableServiceDep,
+    request: Request,
+) -> None:
     """Delete a table by its ID."""
     table = await table_service.get_table_by_id(table_id)
     await table_service.delete_table(table)
+    request.app.state.statistics.forget(table_id)
 
 
 
@@ -76,18 +331,131 @@ async def fetch_table_rows(
 ) -> FetchRowsResponseSchema:
     """Fetch rows from a table."""
     table = await table_service.get_table_by_id(req.table_id)
-    rows = await table_service.fetch_rows(
-        table=table,
-        limit=req.limit,
-        offset=req.offset,
-        ordering_params=req.ordering_params,
-        filtering_params=req.filter_params,
+    try:
+        rows = await table_service.fetch_rows(
+            table=table,
+            limit=req.limit,
+            offset=req.offset,
+            ordering_params=req.ordering_params,
+            filtering_params=req.filter_params,
+            search=req.search,
+        )
+        total_rows = await table_service.count_rows(
+            table,
+            search=req.search,
+            filtering_params=req.filter_params,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    with tracer.start_span("build_response"):
+        return FetchRowsResponseSchema(
+            total=total_rows,
+            rows=[RowSchema.model_validate(r, from_attributes=True) for r in rows],
+        )
+
+
+@router.post("/tables/aggregate", tags=["rows"])
+async def aggregate_table_rows(
+    req: AggregateRequestSchema,
+    table_service: TableServiceDep,
+) -> AggregateResponseSchema:
+    """
+    Group rows and compute aggregates in the database.
+
+    Each row of the result holds the group values followed by the aggregates,
+    named in `columns`.
+    """
+    table = await table_service.get_table_by_id(req.table_id)
+    try:
+        result = await table_service.aggregate(
+            table,
+            req.aggregates,
+            grouping_params=req.group_by,
+            filtering_params=req.filter_params,
+            search=req.search,
+            limit=req.limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return AggregateResponseSchema(columns=result.columns, rows=result.rows)
+
+
+@router.post("/tables/facets", tags=["rows"])
+async def fetch_table_facets(
+    req: FacetsRequestSchema,
+    table_service: TableServiceDep,
+    request: Request,
+) -> list[FacetSchema]:
+    """
+    Most frequent values of fields with their row counts.
+
+    Counts respect the filters and search query, choice values come with
+    their labels. Results are cached until the table changes or for
+    `facets_cache_ttl_s` seconds, whichever comes first.
+    """
+    table = await table_service.get_table_by_id(req.table_id)
+    fields = []
+    for field_id in req.field_ids:
+        field = table.get_field_by_id(field_id)
+        if not field:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Field with ID '{field_id}' not found.",
+            )
+        fields.append(field)
+
+    cache = request.app.state.facets_cache
+    key = (
+        table.table_id,
+        await table_service.get_data_version(table),
+        tuple(req.field_ids),
+        req.limit,
+        tuple((p.field_id, p.value, p.operator) for p in req.filter_params or []),
+        req.search,
+        req.sample_percent,
     )
-    total_rows = await table_service.count_rows(table)
+    facets = cache.get(key)
+    if facets is None:
+        try:
+            facets = await table_service.fetch_facets(
+                table,
+                fields,
+                limit=req.limit,
+                filtering_params=req.filter_params,
+                search=req.search,
+                sample_percent=req.sample_percent,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        cache.set(key, facets)
+    return [FacetSchema.model_validate(f, from_attributes=True) for f in facets]
+
 
-    return FetchRowsResponseSchema(
-        total=total_rows,
-        rows=[RowSchema.model_validate(r, from_attributes=True) for r in rows],
+@router.post("/tables/fetchChanges", tags=["rows"])
+async def fetch_table_changes(
+    req: FetchChangesRequestSchema,
+    table_service: TableServiceDep,
+) -> FetchChangesResponseSchema:
+    """
+    Fetch rows changed after the `cursor` of a previous response.
+
+    Start without `since` and repeat with the returned cursor while `has_more`.
+    If `resync` is set, cached rows must be dropped and fetched without `since`.
+    """
+    table = await table_service.get_table_by_id(req.table_id)
+    try:
+        since = ChangeCursor.parse(req.since) if req.since is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    delta = await table_service.fetch_changes(table, since, req.limit)
+
+    return FetchChangesResponseSchema(
+        rows=[RowSchema.model_validate(r, from_attributes=True) for r in delta.rows],
+        deleted=delta.deleted_row_ids,
+        cursor=str(delta.cursor),
+        has_more=delta.has_more,
+        resync=delta.resync,
     )
 
 
@@ -116,18 +484,45 @@ async def delete_table_rows(
     req: DeleteRowsRequestSchema,
     table_service: TableServiceDep,
 ) -> InsertRowsResponseSchema:
-    """Delete rows from a table."""
+    """
+    Delete rows from a table.
+
+    Rows listed in `expected_versions` are only deleted if their version
+    matches, mismatches are reported in `conflicts`.
+    """
     is_success = True
     errors: list[str] = []
+    conflicts: list[RowConflictSchema] = []
 
     try:
         table = await table_service.get_table_by_id(req.table_id)
-        await table_service.delete_rows(table, req.row_ids)
+        deleted_ids = await table_service.delete_rows(
+            table,
+            req.row_ids,
+            req.expected_versions,
+        )
+        if req.expected_versions:
+            conflicts = [
+                RowConflictSchema.model_validate(c, from_attributes=True)
+                for c in await table_service.get_row_conflicts(
+                    table,
+                    {
+                        row_id: version
+                        for row_id, version in req.expected_versions.items()
+                        if row_id in req.row_ids
+                    },
+                    deleted_ids,
+                )
+            ]
     except Exception as e:
         errors.append(str(e))
         is_success = False
 
-    return InsertRowsResponseSchema(success=is_success, errors=errors)
+    return InsertRowsResponseSchema(
+        success=is_success and not conflicts,
+        errors=errors,
+        conflicts=conflicts,
+    )
 
 
 @router.post("/tables/updateRows", tags=["rows"])
@@ -135,40 +530,188 @@ async def update_table_row(
     req: UpdateRowsRequestSchema,
     table_service: TableServiceDep,
 ) -> InsertRowsResponseSchema:
-    """Update a row in a table."""
+    """
+    Update a row in a table.
+
+    Rows with `expected_version` are only updated if their version matches,
+    mismatches are reported in `conflicts`.
+    """
     table = await table_service.get_table_by_id(req.table_id)
     is_success = True
     errors: list[str] = []
+    conflicts: list[RowConflictSchema] = []
 
     try:
         table = await table_service.get_table_by_id(req.table_id)
         rows = [
-            UpdateRow(table, req_row.row_id, req_row.new_values)
+            UpdateRow(
+                table,
+                req_row.row_id,
+                req_row.new_values,
+                req_row.expected_version,
+            )
             for req_row in req.updated_rows
         ]
         inserted_rows = await table_service.update_rows(rows)
+        expected_versions = {
+            r.row_id: r.expected_version
+            for r in rows
+            if r.expected_version is not None
+        }
+        conflicts = [
+            RowConflictSchema.model_validate(c, from_attributes=True)
+            for c in await table_service.get_row_conflicts(
+                table,
+                expected_versions,
+                [r.row_id for r in inserted_rows],
+            )
+        ]
     except Exception as e:
         errors.append(str(e))
         is_success = False
 
-    return InsertRowsResponseSchema(success=is_success, errors=errors)
+    return InsertRowsResponseSchema(
+        success=is_success and not conflicts,
+        errors=errors,
+        conflicts=conflicts,
+    )
+
+
+@router.post("/tables/batch", tags=["rows"])
+async def execute_batch(
+    req: BatchRequestSchema,
+    table_service: TableServiceDep,
+) -> BatchResponseSchema:
+    """
+    Insert, update and delete rows of several tables at once.
+
+    Operations are executed in order within one transaction. If any of them
+    fails or has version conflicts, nothing is applied.
+    """
+    try:
+        table_ids = {op.table_id for op in req.operations}
+        tables = {
+            t.table_id: t for t in await table_service.get_tables_by_ids([*table_ids])
+        }
+        if missing_ids := table_ids - tables.keys():
+            raise ValueError(f"There are no tables with ids={sorted(missing_ids)}")
+
+        operations: list[BatchOperation] = []
+        for op in req.operations:
+            table = tables[op.table_id]
+            if isinstance(op, InsertRowsOperationSchema):
+                operations.append(
+                    InsertRowsOperation([InsertRow(table, r.values) for r in op.rows]),
+                )
+            elif isinstance(op, UpdateRowsOperationSchema):
+                operations.append(
+                    UpdateRowsOperation(
+                        [
+                            UpdateRow(
+                                table,
+                                r.row_id,
+                                r.new_values,
+                                r.expected_version,
+                            )
+                            for r in op.updated_rows
+                        ],
+                    ),
+                )
+            else:
+                operations.append(
+                    DeleteRowsOperation(table, op.row_ids, op.expected_versions),
+                )
+
+        is_committed, results = await table_service.execute_batch(operations)
+    except Exception as e:
+        return BatchResponseSchema(success=False, errors=[str(e)])
+
+    return BatchResponseSchema(
+        success=is_committed,
+        errors=[],
+        results=[
+            BatchOperationResultSchema.model_validate(r, from_attributes=True)
+            for r in results
+        ],
+    )
+
+
+async def _render_change_batch(
+    app: FastAPI,
+    table_id: int,
+    batch: ChangeBatch,
+) -> list[dict[str, Any]]:
+    if batch.resync:
+        return [RowChangesMessageSchema(resync=True).model_dump(mode="json")]
+
+    messages: list[RowChangesMessageSchema] = []
+    if batch.deleted:
+        messages.append(RowChangesMessageSchema(deleted=sorted(batch.deleted)))
+
+    changed_ids = sorted(batch.inserted | batch.updated)
+    chunk_size = settings.change_feed_max_rows_per_message
+    async with open_tables_service(app) as table_service:
+        # Fields may have changed since the previous batch, tables are cached.
+        table = await table_service.get_table_by_id(table_id)
+        for i in range(0, len(changed_ids), chunk_size):
+            rows = await table_service.fetch_rows_by_ids(
+                table,
+                changed_ids[i : i + chunk_size],
+            )
+            message = RowChangesMessageSchema()
+            for r in rows:
+                row_schema = RowSchema.model_validate(r, from_attributes=True)
+                if r.row_id in batch.inserted:
+                    message.inserted.append(row_schema)
+                else:
+                    message.updated.append(row_schema)
+            messages.append(message)
+
+    return [m.model_dump(mode="json", by_alias=True) for m in messages]
+
+
+async def _send_changes(websocket: WebSocket, subscription: Subscription) -> None:
+    window = settings.change_feed_batch_window_ms / 1000
+    while True:
+        batch = await subscription.next_batch(window)
+        for message in await _render_change_batch(websocket.app, subscription.table_id, batch):
+            await websocket.send_json(message)
+
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        return
+
+
+@router.websocket("/tables/{table_id}/changes")
+async def table_changes_feed(websocket: WebSocket, table_id: int) -> None:
+    """
+    Push rows inserted, updated and deleted in a table.
 
+    Changes are coalesced per connection, so a bulk update results in a few
+    messages of up to `change_feed_max_rows_per_message` rows each.
+    A message with `resync` set means changes were dropped and the table
+    has to be refetched.
+    """
+    # Unknown tables are rejected before the connection is accepted.
+    async with open_tables_service(websocket.app) as table_service:
+        await table_service.get_table_by_id(table_id)
 
-# @router.delete("/tables/deleteField", tags=["fields"])
-# async def delete_table_field(req: DeleteFieldSchema) -> TableSchema:
-#     """Delete a field from a table."""
-#     raise NotImplementedError
-#
-#
-# @router.patch("/tables/updateField", tags=["fields"])
-# async def update_table_field(req: UpdateFieldSchema) -> TableSchema:
-#     """
-#     Update a field in a table.
-#     """
-#     raise NotImplementedError
-#
-#
-# @router.post("/tables/addField", tags=["fields"])
-# async def add_table_field(req: AddFieldSchema) -> FieldSchema:
-#     """Add a field to a table."""
-#     raise NotImplementedError
+    await websocket.accept()
+    async with websocket.app.state.change_feed.subscribe(table_id) as subscription:
+        tasks = {
+            asyncio.create_task(_send_changes(websocket, subscription)),
+            asyncio.create_task(_wait_for_disconnect(websocket)),
+        }
+        done, pending = await asyncio.wait(
+            tasks,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if not isinstance(task.exception(), WebSocketDisconnect):
+                task.result()
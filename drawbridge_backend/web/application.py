@@ -4,8 +4,18 @@ from fastapi import FastAPI
 from fastapi.responses import UJSONResponse
 from starlette.middleware.cors import CORSMiddleware, ALL_METHODS
 
+from drawbridge_backend.log import configure_logging
 from drawbridge_backend.web.api.router import api_router
 from drawbridge_backend.web.lifespan import lifespan_setup
+from drawbridge_backend.web.middleware import (
+    MemoryMiddleware,
+    MetricsMiddleware,
+    ProfilingMiddleware,
+    RequestIdMiddleware,
+    RequestProfilerMiddleware,
+    TracingMiddleware,
+    instrument_endpoints,
+)
 
 
 def get_app() -> FastAPI:
@@ -16,6 +26,7 @@ def get_app() -> FastAPI:
 
     :return: application.
     """
+    configure_logging()
     app = FastAPI(
         title="drawbridge_backend",
         version=metadata.version("drawbridge_backend"),
@@ -36,8 +47,16 @@ def get_app() -> FastAPI:
         allow_methods=ALL_METHODS,
         allow_headers=["*"],
     )
+    app.add_middleware(MemoryMiddleware)
+    app.add_middleware(RequestProfilerMiddleware)
+    app.add_middleware(ProfilingMiddleware)
+    app.add_middleware(TracingMiddleware)
+    app.add_middleware(RequestIdMiddleware)
+    # Added last so it is the outermost one and times the others too.
+    app.add_middleware(MetricsMiddleware)
 
     # Main router for the API.
     app.include_router(router=api_router, prefix="/api")
+    instrument_endpoints(app)
 
     return app
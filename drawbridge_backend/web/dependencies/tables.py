@@ -1,26 +1,71 @@
-from typing import Annotated
+import contextlib
+from typing import Annotated, AsyncIterator
 
+from fastapi import FastAPI, Request
 from fastapi.params import Depends
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
+from drawbridge_backend.cache import TTLCache
+
 from drawbridge_backend.db.dependencies import (
     get_db_session,
+    get_shard_sessions,
     get_storage_db_engine,
     get_storage_db_session,
 )
+from drawbridge_backend.db.shards import ShardSessions
 from drawbridge_backend.domain.impl.tables import SqlAlchemyTablesService
+from drawbridge_backend.domain.tables.entities import Table
+
+
+def get_table_cache(request: Request) -> TTLCache[int, Table] | None:
+    return getattr(request.app.state, "table_cache", None)
 
 
 def get_tables_service(
     storage_db_engine: Annotated[AsyncEngine, Depends(get_storage_db_engine)],
     storage_db_session: Annotated[AsyncSession, Depends(get_storage_db_session)],
     db_session: Annotated[AsyncSession, Depends(get_db_session)],
+    table_cache: Annotated[TTLCache[int, Table] | None, Depends(get_table_cache)],
+    shard_sessions: Annotated[ShardSessions | None, Depends(get_shard_sessions)],
 ) -> SqlAlchemyTablesService:
     return SqlAlchemyTablesService(
         db_session,
         storage_db_session,
         storage_db_engine,
+        table_cache,
+        shard_sessions,
     )
 
 
 TableServiceDep = Annotated[SqlAlchemyTablesService, Depends(get_tables_service)]
+
+
+@contextlib.asynccontextmanager
+async def open_tables_service(app: FastAPI) -> AsyncIterator[SqlAlchemyTablesService]:
+    """
+    Short-lived tables service for code running outside of a request.
+
+    Long-lived connections such as websockets must not keep pooled
+    sessions checked out, so they open a service per unit of work.
+
+    :param app: fastAPI application.
+    :yield: tables service.
+    """
+    async with (
+        app.state.db_session_factory() as db_session,
+        app.state.storage_db_session_factory() as storage_db_session,
+    ):
+        shards = getattr(app.state, "storage_shards", None)
+        shard_sessions = ShardSessions(shards, storage_db_session) if shards else None
+        try:
+            yield SqlAlchemyTablesService(
+                db_session,
+                storage_db_session,
+                app.state.storage_db_engine,
+                getattr(app.state, "table_cache", None),
+                shard_sessions,
+            )
+        finally:
+            if shard_sessions is not None:
+                await shard_sessions.close()
@@ -1,12 +1,34 @@
+import asyncio
+import datetime
+import logging
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator
 
 from fastapi import FastAPI
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
-from drawbridge_backend.db.meta import meta
-from drawbridge_backend.db.models import load_all_models
-from drawbridge_backend.settings import settings
+from drawbridge_backend.cache import TTLCache
+from drawbridge_backend.db.metrics import instrument_engine
+from drawbridge_backend.db.shards import StorageShards
+from drawbridge_backend.db.utils import invalidate_prepared_statements
+from drawbridge_backend.db.models.users import (  # type: ignore
+    USER_CHANGES_CHANNEL,
+    user_cache,
+)
+from drawbridge_backend.domain.impl.tables import (
+    COLUMN_TYPES_CHANGED,
+    TABLE_CHANGES_CHANNEL,
+)
+from drawbridge_backend.domain.tables.entities import Table, TableStatistics
+from drawbridge_backend.metrics import watch_cache
+from drawbridge_backend.services.change_feed import ChangeFeed
+from drawbridge_backend.services.loop_monitor import LoopMonitor
+from drawbridge_backend.services.statistics import StatisticsCache
+from drawbridge_backend.settings import DEFAULT_SHARD, TracingExporter, settings
+from drawbridge_backend.tracing import FileSpanExporter, StreamSpanExporter, tracer
+from drawbridge_backend.web.dependencies.tables import open_tables_service
+
+logger = logging.getLogger(__name__)
 
 
 def _setup_db(app: FastAPI) -> None:  # pragma: no cover
@@ -24,6 +46,7 @@ def _setup_db(app: FastAPI) -> None:  # pragma: no cover
         engine,
         expire_on_commit=False,
     )
+    instrument_engine(engine, "metadata")
     app.state.db_engine = engine
     app.state.db_session_factory = session_factory
 
@@ -34,14 +57,220 @@ def _setup_db(app: FastAPI) -> None:  # pragma: no cover
         storage_engine,
         expire_on_commit=False,
     )
+    instrument_engine(storage_engine, "storage")
     app.state.storage_db_engine = storage_engine
     app.state.storage_db_session_factory = storage_session_factory
 
+    # The engine above is the default shard, every other one gets its own pool.
+    shard_engines = {DEFAULT_SHARD: storage_engine}
+    for shard, url in settings.storage_shards.items():
+        shard_engine = create_async_engine(url, echo=settings.storage_db_echo)
+        instrument_engine(shard_engine, f"storage_{shard}")
+        shard_engines[shard] = shard_engine
+    app.state.storage_shards = StorageShards(shard_engines)
+
+
+
+
+def _setup_change_feed(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Creates the feed of row changes made by any worker.
+
+    It starts listening on first use.
+
+    :param app: fastAPI application.
+    """
+    app.state.change_feed = ChangeFeed(
+        queue_size=settings.change_feed_queue_size,
+        reconnect_delay=settings.change_feed_reconnect_delay_s,
+        max_reconnect_delay=settings.change_feed_max_reconnect_delay_s,
+        engine=app.state.storage_db_engine,
+        shard_engines=[
+            app.state.storage_shards.engine(shard)
+            for shard in app.state.storage_shards.names
+            if shard != DEFAULT_SHARD
+        ],
+    )
+
+
+async def _setup_metadata_caches(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Creates caches of metadata, dropping entries changed by other workers.
+
+    :param app: fastAPI application.
+    """
+    table_cache: TTLCache[int, Table] = TTLCache(
+        maxsize=settings.table_cache_size,
+        ttl=settings.table_cache_ttl_s,
+    )
+
+    def on_table_change(connection: Any, pid: int, channel: str, payload: str) -> None:
+        table_id = payload.removesuffix(COLUMN_TYPES_CHANGED)
+        if table_id.isdigit():
+            table_cache.pop(int(table_id))
+        # Flushing prepared statements costs every connection a recompile,
+        # so it's only done when they may expect the previous column types.
+        if payload.endswith(COLUMN_TYPES_CHANGED):
+            for shard in app.state.storage_shards.names:
+                invalidate_prepared_statements(app.state.storage_shards.engine(shard))
+
+    connection = await app.state.db_engine.connect()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.add_listener(
+        USER_CHANGES_CHANNEL,
+        user_cache.on_notification,
+    )
+    await raw_connection.driver_connection.add_listener(
+        TABLE_CHANGES_CHANNEL,
+        on_table_change,
+    )
+    app.state.metadata_changes_connection = connection
+    app.state.table_cache = table_cache
+    watch_cache("tables", table_cache)
 
 
+async def _warm_up(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Prepares the worker for the first requests and marks it ready.
+
+    Pools get connections, and the most recently used tables are loaded
+    into the cache with their row statements compiled.
+
+    :param app: fastAPI application.
+    """
+    try:
+        engines = [
+            app.state.db_engine,
+            *(app.state.storage_shards.engine(s) for s in app.state.storage_shards.names),
+        ]
+        for engine in engines:
+            # Connections above the pool size would be closed on release.
+            count = min(settings.warmup_connections, engine.pool.size())
+            connections = await asyncio.gather(*(engine.connect() for _ in range(count)))
+            for connection in connections:
+                await connection.close()
+
+        async with open_tables_service(app) as table_service:
+            tables = await table_service.fetch_recent_tables(settings.warmup_tables)
+        for table in tables:
+            async with open_tables_service(app) as table_service:
+                await table_service.warm_up_statements(table)
+        logger.info("Warm-up done, %d tables loaded", len(tables))
+    except Exception:
+        logger.exception("Warm-up failed")
+    finally:
+        # A failed warm-up only makes first requests slower.
+        app.state.ready = True
+
+
+def _setup_statistics(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Creates the column statistics cache refreshed by row changes.
+
+    :param app: fastAPI application.
+    """
+
+    async def load(table_id: int, known_version: int | None) -> TableStatistics | None:
+        async with open_tables_service(app) as table_service:
+            table = await table_service.get_table_by_id(table_id)
+            return await table_service.compute_statistics(table, known_version)
+
+    statistics = StatisticsCache(
+        load,
+        refresh_delay=settings.statistics_refresh_delay_s,
+        maxsize=settings.statistics_cache_size,
+        ttl=settings.statistics_cache_ttl_s,
+    )
+    app.state.change_feed.add_listener(statistics.on_row_change)
+    app.state.statistics = statistics
+    app.state.facets_cache = TTLCache(
+        maxsize=settings.facets_cache_size,
+        ttl=settings.facets_cache_ttl_s,
+    )
+    watch_cache("facets", app.state.facets_cache)
+
+
+def _setup_tracing() -> None:  # pragma: no cover
+    """Starts exporting traces of sampled requests."""
+    if settings.tracing_exporter == TracingExporter.CONSOLE:
+        tracer.configure(StreamSpanExporter(), settings.tracing_sample_rate)
+    elif settings.tracing_exporter == TracingExporter.FILE:
+        tracer.configure(
+            FileSpanExporter(str(settings.tracing_file)),
+            settings.tracing_sample_rate,
+        )
+
+
+def _setup_loop_monitor(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Starts measuring event loop lag and logging code blocking the loop.
+
+    :param app: fastAPI application.
+    """
+    app.state.loop_monitor = None
+    if settings.loop_monitor_enabled:
+        app.state.loop_monitor = LoopMonitor(
+            interval=settings.loop_monitor_interval_ms / 1000,
+            threshold=settings.loop_lag_threshold_ms / 1000,
+        )
+        app.state.loop_monitor.start()
+
+
+async def _compact_row_tombstones(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Periodically removes old tombstones of deleted rows.
+
+    :param app: fastAPI application.
+    """
+    retention = datetime.timedelta(hours=settings.row_tombstones_retention_hours)
+    while True:
+        await asyncio.sleep(settings.row_tombstones_compaction_interval_s)
+        try:
+            async with open_tables_service(app) as table_service:
+                await table_service.compact_row_tombstones(retention)
+        except Exception:
+            logger.exception("Failed to compact row tombstones")
+
+
+async def _maintain_partitions(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Periodically creates partitions ahead of time and drops expired ones.
+
+    :param app: fastAPI application.
+    """
+    while True:
+        try:
+            async with open_tables_service(app) as table_service:
+                for table in await table_service.fetch_partitioned_tables():
+                    try:
+                        await table_service.maintain_partitions(table)
+                    except Exception:
+                        logger.exception(
+                            "Failed to maintain partitions of table %s",
+                            table.table_id,
+                        )
+        except Exception:
+            logger.exception("Failed to maintain partitions")
+        await asyncio.sleep(settings.partition_maintenance_interval_s)
+
+
+async def _upgrade_storage(app: FastAPI) -> None:  # pragma: no cover
+    """
+    Brings storage tables created by older versions up to date.
+
+    Requests rely on the columns added, so it runs before serving them.
+
+    :param app: fastAPI application.
+    """
+    async with open_tables_service(app) as table_service:
+        await table_service.upgrade_storage()
+
 
 async def _create_tables() -> None:  # pragma: no cover
     """Populates tables in the database."""
+    from drawbridge_backend.db.meta import meta
+    from drawbridge_backend.db.models import load_all_models
+
     load_all_models()
     engine = create_async_engine(str(settings.db_url))
     async with engine.begin() as connection:
@@ -64,10 +293,32 @@ async def lifespan_setup(
     """
 
     app.middleware_stack = None
+    _setup_tracing()
+    _setup_loop_monitor(app)
     _setup_db(app)
+    await _upgrade_storage(app)
+    _setup_change_feed(app)
+    await _setup_metadata_caches(app)
+    _setup_statistics(app)
     # Delegate migrations to Alembic.
     # await _create_tables()
     app.middleware_stack = app.build_middleware_stack()
+    compaction_task = asyncio.create_task(_compact_row_tombstones(app))
+    partitions_task = asyncio.create_task(_maintain_partitions(app))
+    app.state.ready = not settings.warmup_enabled
+    if settings.warmup_enabled:
+        warmup_task = asyncio.create_task(_warm_up(app))
 
     yield
+    if settings.warmup_enabled:
+        warmup_task.cancel()
+    compaction_task.cancel()
+    partitions_task.cancel()
+    await app.state.statistics.stop()
+    await app.state.change_feed.stop()
+    await app.state.metadata_changes_connection.close()
     await app.state.db_engine.dispose()
+    await app.state.storage_shards.dispose()
+    if app.state.loop_monitor is not None:
+        await app.state.loop_monitor.stop()
+    tracer.shutdown()
@@ -0,0 +1,415 @@
+import asyncio
+import contextvars
+import dataclasses
+import functools
+import logging
+import time
+import tracemalloc
+import uuid
+from typing import Any, Callable
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from drawbridge_backend.db.models.users import get_superuser_by_token  # type: ignore
+from drawbridge_backend.db.profiling import QueryProfile, current_profile
+from drawbridge_backend.log import request_id
+from drawbridge_backend.metrics import registry
+from drawbridge_backend.services.cpu_profiling import (
+    ProfileKind,
+    cpu_profiler,
+    new_profile_id,
+    profile_thread,
+)
+from drawbridge_backend.services.memory_profiling import (
+    RequestMemory,
+    current_request_memory,
+    memory_tracker,
+)
+from drawbridge_backend.settings import settings
+from drawbridge_backend.tracing import format_traceparent, to_unix_ns, tracer
+
+logger = logging.getLogger(__name__)
+
+request_duration = registry.histogram(
+    "drawbridge_http_request_duration_seconds",
+    "Time from receiving a request to sending the end of its response.",
+    ["method", "route", "status"],
+)
+requests_in_flight = registry.gauge(
+    "drawbridge_http_requests_in_flight",
+    "Requests being handled.",
+).labels()
+request_memory_peak = registry.histogram(
+    "drawbridge_http_request_memory_peak_bytes",
+    "Peak traced memory above the start of a request, while tracemalloc runs.",
+    ["route", "table"],
+    buckets=tuple(float(4**i * 2**20) for i in range(7)),
+)
+
+
+class MetricsMiddleware:
+    """
+    Records latency and count of HTTP requests.
+
+    Requests are labeled with the path template of their route, so that
+    e.g. every /api/tables/{table_id} request lands in the same histogram.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        requests_in_flight.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            requests_in_flight.dec()
+            # Routing sets the matched route in the scope.
+            route = scope.get("route")
+            request_duration.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            ).observe(time.perf_counter() - started_at)
+
+
+@dataclasses.dataclass
+class _EndpointTimings:
+    # perf_counter and QueryProfile.db_seconds when the endpoint started and ended
+    started_at: float | None = None
+    db_seconds_at_start: float = 0.0
+    finished_at: float | None = None
+    db_seconds_at_finish: float = 0.0
+
+
+_endpoint_timings: contextvars.ContextVar[_EndpointTimings | None] = contextvars.ContextVar(
+    "endpoint_timings",
+    default=None,
+)
+
+
+def _mark_endpoint(finished: bool) -> None:
+    timings = _endpoint_timings.get()
+    if timings is None:
+        return
+    profile = current_profile.get()
+    db_seconds = profile.db_seconds if profile is not None else 0.0
+    if finished:
+        timings.finished_at = time.perf_counter()
+        timings.db_seconds_at_finish = db_seconds
+    else:
+        timings.started_at = time.perf_counter()
+        timings.db_seconds_at_start = db_seconds
+
+
+def instrument_endpoints(app: FastAPI) -> None:
+    """
+    Mark start and end of endpoint functions and trace them.
+
+    Time before the endpoint is routing, dependencies and request validation,
+    time after it is response validation and serialization.
+    """
+
+    def wrap(call: Callable[..., Any]) -> Callable[..., Any]:
+        name = call.__name__
+        if asyncio.iscoroutinefunction(call):
+
+            @functools.wraps(call)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                _mark_endpoint(finished=False)
+                try:
+                    with tracer.start_span(name):
+                        return await call(*args, **kwargs)
+                finally:
+                    _mark_endpoint(finished=True)
+
+            return async_wrapper
+
+        @functools.wraps(call)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            # Runs in a thread pool, spans can't be parented across threads.
+            _mark_endpoint(finished=False)
+            try:
+                return call(*args, **kwargs)
+            finally:
+                _mark_endpoint(finished=True)
+
+        return wrapper
+
+    for route in app.routes:
+        # The request handler calls dependant.call, the route keeps a
+        # reference to the same dependant.
+        if isinstance(route, APIRoute) and route.dependant.call is not None:
+            route.dependant.call = wrap(route.dependant.call)
+
+
+def _server_timing(
+    started_at: float,
+    profile: QueryProfile,
+    endpoint: _EndpointTimings,
+) -> str:
+    now = time.perf_counter()
+    # Name, duration and optional description of every phase.
+    phases: list[tuple[str, float, str | None]] = [
+        ("db", profile.db_seconds, f"{profile.queries} queries"),
+    ]
+    if endpoint.started_at is not None and endpoint.finished_at is not None:
+        db_before = endpoint.db_seconds_at_start
+        db_during = endpoint.db_seconds_at_finish - db_before
+        db_after = profile.db_seconds - endpoint.db_seconds_at_finish
+        phases += [
+            ("validation", endpoint.started_at - started_at - db_before, None),
+            ("endpoint", endpoint.finished_at - endpoint.started_at - db_during, None),
+            ("serialization", now - endpoint.finished_at - db_after, None),
+        ]
+    phases.append(("total", now - started_at, None))
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.2f}" + (f';desc="{desc}"' if desc else "")
+        for name, seconds, desc in phases
+    )
+
+
+class ProfilingMiddleware:
+    """
+    Profiles queries of every request.
+
+    Responses get a Server-Timing header splitting the time spent until
+    the response started into db, validation, endpoint and serialization,
+    which browser dev tools show next to the request. Statements repeated
+    more than `repeated_query_threshold` times are logged.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.query_profiling_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        profile = QueryProfile()
+        # TracingMiddleware may have started recording endpoint timings.
+        endpoint = _endpoint_timings.get() or _EndpointTimings()
+        profile_token = current_profile.set(profile)
+        endpoint_token = _endpoint_timings.set(endpoint)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", _server_timing(started_at, profile, endpoint))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_profile.reset(profile_token)
+            _endpoint_timings.reset(endpoint_token)
+            route = getattr(scope.get("route"), "path", scope["path"])
+            for shape, count in profile.repeated(settings.repeated_query_threshold):
+                logger.warning(
+                    "%s %s ran the same statement %d times, likely N+1 queries: %s",
+                    scope["method"],
+                    route,
+                    count,
+                    shape,
+                )
+
+
+class TracingMiddleware:
+    """
+    Traces sampled requests.
+
+    Besides spans opened further down, the request span gets a validation
+    span until the endpoint starts and a serialize_response span from its
+    end until the response starts. Traced responses carry the trace in a
+    `traceresponse` header, so a slow request can be looked up.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = Headers(scope=scope).get("traceparent")
+        with tracer.start_trace(f"{scope['method']} {scope['path']}", traceparent) as span:
+            if span is None:
+                await self.app(scope, receive, send)
+                return
+
+            started_at = time.perf_counter()
+            endpoint = _EndpointTimings()
+            token = _endpoint_timings.set(endpoint)
+
+            async def send_with_trace(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.attributes["http.status_code"] = message["status"]
+                    MutableHeaders(scope=message).append(
+                        "traceresponse",
+                        format_traceparent(span),
+                    )
+                    if endpoint.started_at is not None:
+                        tracer.record_span(
+                            "validation",
+                            to_unix_ns(started_at),
+                            to_unix_ns(endpoint.started_at),
+                        )
+                    if endpoint.finished_at is not None:
+                        tracer.record_span(
+                            "serialize_response",
+                            to_unix_ns(endpoint.finished_at),
+                            to_unix_ns(time.perf_counter()),
+                        )
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                _endpoint_timings.reset(token)
+                route = getattr(scope.get("route"), "path", None)
+                span.attributes["http.method"] = scope["method"]
+                span.attributes["http.route"] = route
+                if route is not None:
+                    span.name = f"{scope['method']} {route}"
+
+
+_PROFILE_KINDS: dict[bytes, ProfileKind] = {b"sample": "sample", b"cprofile": "cprofile"}
+
+
+async def _is_superuser(scope: Scope) -> bool:
+    scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    async with scope["app"].state.db_session_factory() as session:
+        return await get_superuser_by_token(session, token) is not None
+
+
+class RequestProfilerMiddleware:
+    """
+    Profiles single requests of superusers on demand.
+
+    A request with an `X-Profile: sample` or `X-Profile: cprofile` header
+    runs under the sampling or the deterministic profiler, its response
+    gets an X-Profile-Id header to fetch the profile from
+    /api/admin/profiles. The header is ignored unless it comes with a
+    superuser's token and no other profile is running, other requests only
+    pay for looking for the header.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.profiling_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        kind = None
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                kind = _PROFILE_KINDS.get(value.strip().lower())
+                break
+        if kind is None or not await _is_superuser(scope):
+            await self.app(scope, receive, send)
+            return
+
+        with cpu_profiler.acquire() as acquired:
+            if not acquired:
+                await self.app(scope, receive, send)
+                return
+
+            profile_id = new_profile_id()
+
+            async def send_with_profile_id(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    MutableHeaders(scope=message).append("X-Profile-Id", profile_id)
+                await send(message)
+
+            target = f"{scope['method']} {scope['path']}"
+            interval = settings.profiling_sample_interval_ms / 1000
+            try:
+                with profile_thread(kind, target, interval) as profile:
+                    await self.app(scope, receive, send_with_profile_id)
+            finally:
+                cpu_profiler.store(profile_id, profile)
+
+
+class MemoryMiddleware:
+    """
+    Records peak memory of requests by route and table.
+
+    Only active while tracemalloc traces and `memory_request_peaks_enabled`
+    is set. The table is the one the tables service loaded for the
+    request, "multiple" if it loaded several.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not settings.memory_request_peaks_enabled
+            or not tracemalloc.is_tracing()
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        usage = RequestMemory()
+        token = current_request_memory.set(usage)
+        traced_at_start = memory_tracker.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            peak = memory_tracker.request_finished(traced_at_start)
+            current_request_memory.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_memory_peak.labels(route, usage.table).observe(peak)
+
+
+class RequestIdMiddleware:
+    """
+    Gives every request an id, added to its log records and response.
+
+    An X-Request-ID header set by a proxy is kept so logs of both match.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = Headers(scope=scope).get("x-request-id") or uuid.uuid4().hex
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Request-ID", value)
+            await send(message)
+
+        token = request_id.set(value)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,36 @@
+"""Add trigram index option to fields
+
+Revision ID: 3f1d2b7c9a40
+Revises: 6cb469f68b4c
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1d2b7c9a40'
+down_revision: Union[str, Sequence[str], None] = '6cb469f68b4c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'fields',
+        sa.Column(
+            'has_trigram_index',
+            sa.Boolean(),
+            server_default='false',
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('fields', 'has_trigram_index')
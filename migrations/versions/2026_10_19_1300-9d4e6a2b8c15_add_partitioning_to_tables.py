@@ -0,0 +1,50 @@
+"""Add partitioning to tables
+
+Revision ID: 9d4e6a2b8c15
+Revises: 3f1d2b7c9a40
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4e6a2b8c15'
+down_revision: Union[str, Sequence[str], None] = '3f1d2b7c9a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('tables', sa.Column('partition_field_id', sa.Integer(), nullable=True))
+    op.add_column('tables', sa.Column('partition_id_range', sa.BigInteger(), nullable=True))
+    op.add_column(
+        'tables',
+        sa.Column(
+            'partition_period',
+            sa.Enum(
+                'HOUR',
+                'DAY',
+                'WEEK',
+                'MONTH',
+                'QUARTER',
+                'YEAR',
+                name='datetruncenum',
+                native_enum=False,
+            ),
+            nullable=True,
+        ),
+    )
+    op.add_column('tables', sa.Column('partition_retention', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tables', 'partition_retention')
+    op.drop_column('tables', 'partition_period')
+    op.drop_column('tables', 'partition_id_range')
+    op.drop_column('tables', 'partition_field_id')
@@ -0,0 +1,36 @@
+"""Add shard to tables
+
+Revision ID: 5b7e1c3d9f02
+Revises: 9d4e6a2b8c15
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e1c3d9f02'
+down_revision: Union[str, Sequence[str], None] = '9d4e6a2b8c15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'tables',
+        sa.Column(
+            'shard',
+            sa.String(length=64),
+            server_default='default',
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tables', 'shard')
@@ -3,6 +3,7 @@ from typing import Any, AsyncGenerator
 import pytest
 from fastapi import FastAPI
 from httpx import AsyncClient
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -74,6 +75,32 @@ async def storage_engine() -> AsyncGenerator[AsyncEngine, None]:
         await drop_storage_database()
 
 
+@pytest.fixture(scope="session")
+async def shard_engine() -> AsyncGenerator[AsyncEngine, None]:
+    """
+    Create a second storage database to place tables on.
+
+    :yield: engine of the shard.
+    """
+    shard_base = f"{settings.storage_db_base}_shard"
+    admin_engine = create_async_engine(
+        str(settings.storage_db_url.with_path("/postgres")),
+        isolation_level="AUTOCOMMIT",
+    )
+    async with admin_engine.connect() as conn:
+        await conn.execute(text(f'DROP DATABASE IF EXISTS "{shard_base}"'))
+        await conn.execute(text(f'CREATE DATABASE "{shard_base}" TEMPLATE template1'))
+
+    engine = create_async_engine(str(settings.storage_db_url.with_path(f"/{shard_base}")))
+    try:
+        yield engine
+    finally:
+        await engine.dispose()
+        async with admin_engine.connect() as conn:
+            await conn.execute(text(f'DROP DATABASE "{shard_base}" WITH (FORCE)'))
+        await admin_engine.dispose()
+
+
 @pytest.fixture
 async def storage_dbsession(
     storage_engine: AsyncEngine,
@@ -81,9 +108,12 @@ async def storage_dbsession(
     connection = await storage_engine.connect()
     trans = await connection.begin()
 
+    # Commits and rollbacks of the session only touch a SAVEPOINT,
+    # so code under test can roll back without ending the test transaction.
     session_maker = async_sessionmaker(
         connection,
         expire_on_commit=False,
+        join_transaction_mode="create_savepoint",
     )
     session = session_maker()
 
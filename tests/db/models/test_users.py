@@ -0,0 +1,93 @@
+import pytest
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi_users import exceptions
+from fastapi_users.db import SQLAlchemyUserDatabase
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from drawbridge_backend.db.models.users import (  # type: ignore
+    User,
+    UserCreate,
+    UserManager,
+    UserUpdate,
+    get_jwt_strategy,
+    user_cache,
+)
+
+
+@pytest.mark.anyio
+async def test_authenticated_users_are_cached(dbsession: AsyncSession) -> None:
+    user_manager = UserManager(SQLAlchemyUserDatabase(dbsession, User))
+    user = await user_manager.create(
+        UserCreate(email="cached@example.com", password="password"),
+    )
+    strategy = get_jwt_strategy()
+    token = await strategy.write_token(user)
+
+    first = await strategy.read_token(token, user_manager)
+    second = await strategy.read_token(token, user_manager)
+    assert first is not None and second is not None
+    assert first.id == second.id == user.id
+    # Every request gets its own copy.
+    assert first is not second
+    assert user_cache.get(user.id) is not None
+
+    await user_manager.update(UserUpdate(is_active=False), user)
+    assert user_cache.get(user.id) is None
+    reloaded = await strategy.read_token(token, user_manager)
+    assert reloaded is not None and not reloaded.is_active
+
+    assert await strategy.read_token("not a token", user_manager) is None
+
+
+@pytest.mark.anyio
+async def test_users_loaded_before_an_update_are_not_cached(dbsession: AsyncSession) -> None:
+    user_manager = UserManager(SQLAlchemyUserDatabase(dbsession, User))
+    user = await user_manager.create(
+        UserCreate(email="racing@example.com", password="password"),
+    )
+    version = user_cache.version
+    loaded = await user_manager.get(user.id)
+    # Another request updates the user while this one loads it.
+    await user_manager.update(UserUpdate(is_superuser=True), user)
+    user_cache.set(loaded, version)
+    assert user_cache.get(user.id) is None
+
+
+@pytest.mark.anyio
+async def test_authenticate(dbsession: AsyncSession) -> None:
+    user_manager = UserManager(SQLAlchemyUserDatabase(dbsession, User))
+    user = await user_manager.create(
+        UserCreate(email="login@example.com", password="password"),
+    )
+
+    def form(username: str, password: str) -> OAuth2PasswordRequestForm:
+        return OAuth2PasswordRequestForm(username=username, password=password)
+
+    authenticated = await user_manager.authenticate(form("login@example.com", "password"))
+    assert authenticated is not None and authenticated.id == user.id
+    assert await user_manager.authenticate(form("login@example.com", "wrong")) is None
+    assert await user_manager.authenticate(form("nobody@example.com", "password")) is None
+
+
+@pytest.mark.anyio
+async def test_reset_password(dbsession: AsyncSession) -> None:
+    user_manager = UserManager(SQLAlchemyUserDatabase(dbsession, User))
+    user = await user_manager.create(
+        UserCreate(email="forgetful@example.com", password="password"),
+    )
+    tokens: list[str] = []
+
+    async def on_after_forgot_password(user: User, token: str, request: object) -> None:
+        tokens.append(token)
+
+    user_manager.on_after_forgot_password = on_after_forgot_password
+    await user_manager.forgot_password(user)
+    with pytest.raises(exceptions.InvalidResetPasswordToken):
+        await user_manager.reset_password("not a token", "new password")
+    await user_manager.reset_password(tokens[0], "new password")
+    # The token was issued for the previous password.
+    with pytest.raises(exceptions.InvalidResetPasswordToken):
+        await user_manager.reset_password(tokens[0], "another password")
+
+    form = OAuth2PasswordRequestForm(username="forgetful@example.com", password="new password")
+    assert await user_manager.authenticate(form) is not None
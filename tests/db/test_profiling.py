@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+
+from drawbridge_backend.db.profiling import (
+    QueryProfile,
+    current_profile,
+    get_statement_shape,
+    record_query,
+    redact_parameters,
+)
+from drawbridge_backend.settings import settings
+
+
+def test_statement_shape() -> None:
+    assert (
+        get_statement_shape("SELECT t.id FROM t\nWHERE t.id IN ($1, $2,\n $3) AND t.a = $4")
+        == get_statement_shape("SELECT t.id FROM t WHERE t.id IN ($1) AND t.a = $2")
+        == "SELECT t.id FROM t WHERE t.id IN (?) AND t.a = ?"
+    )
+
+
+def test_redact_parameters() -> None:
+    assert redact_parameters((1, "secret", None)) == "(int, str, NoneType)"
+    assert redact_parameters([(1, "a"), (2, "b")]) == "2 x (int, str)"
+    assert redact_parameters({"password": "secret"}) == "{password: str}"
+
+
+def test_record_query(
+    caplog: pytest.LogCaptureFixture,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "slow_query_threshold_ms", 100)
+    profile = QueryProfile()
+    token = current_profile.set(profile)
+    try:
+        for i in range(3):
+            record_query("storage", f"SELECT t.a FROM t WHERE t.id = ${i + 1}", (i,), 0.01)
+        with caplog.at_level(logging.WARNING):
+            record_query("storage", "UPDATE t SET a = $1", ("secret",), 0.2)
+    finally:
+        current_profile.reset(token)
+
+    assert profile.queries == 4
+    assert profile.db_seconds == pytest.approx(0.23)
+    assert profile.repeated(2) == [("SELECT t.a FROM t WHERE t.id = ?", 3)]
+    assert "UPDATE t SET a = ?" in caplog.text
+    assert "(str)" in caplog.text
+    assert "secret" not in caplog.text
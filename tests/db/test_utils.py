@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from drawbridge_backend.db.utils import invalidate_prepared_statements
+
+
+@pytest.mark.anyio
+async def test_invalidate_prepared_statements(storage_engine: AsyncEngine) -> None:
+    async with storage_engine.connect() as conn:
+        await conn.execute(text("CREATE TABLE prepared (value integer)"))
+        await conn.commit()
+        try:
+            await conn.execute(text("SELECT value FROM prepared"))
+            await conn.commit()
+            async with storage_engine.connect() as other:
+                await other.execute(text("ALTER TABLE prepared ALTER COLUMN value TYPE text"))
+                await other.commit()
+
+            # The statement prepared for an integer column would fail otherwise.
+            invalidate_prepared_statements(storage_engine)
+            await conn.execute(text("SELECT value FROM prepared"))
+            await conn.commit()
+        finally:
+            await conn.rollback()
+            await conn.execute(text("DROP TABLE prepared"))
+            await conn.commit()
@@ -0,0 +1,47 @@
+import datetime
+
+from drawbridge_backend.domain.enums import DateTruncEnum
+from drawbridge_backend.domain.impl.partitioning import (
+    add_periods,
+    get_partition_name,
+    get_partition_start,
+    parse_partition_name,
+    truncate,
+)
+from drawbridge_backend.domain.tables.entities import Partitioning, Table
+
+
+def test_period_arithmetic() -> None:
+    value = datetime.datetime(2026, 11, 19, 13, 45, 10)
+    assert truncate(value, DateTruncEnum.HOUR) == datetime.datetime(2026, 11, 19, 13)
+    # 2026-11-19 is a Thursday.
+    assert truncate(value, DateTruncEnum.WEEK) == datetime.datetime(2026, 11, 16)
+    assert truncate(value, DateTruncEnum.QUARTER) == datetime.datetime(2026, 10, 1)
+    assert truncate(value, DateTruncEnum.YEAR) == datetime.datetime(2026, 1, 1)
+
+    october = datetime.datetime(2026, 10, 1)
+    assert add_periods(october, DateTruncEnum.QUARTER, 1) == datetime.datetime(2027, 1, 1)
+    assert add_periods(october, DateTruncEnum.MONTH, -10) == datetime.datetime(2025, 12, 1)
+    assert add_periods(october, DateTruncEnum.DAY, 31) == datetime.datetime(2026, 11, 1)
+
+
+def test_partition_start() -> None:
+    by_id = Partitioning(id_range=1000)
+    assert get_partition_start(by_id, 999) == 0
+    assert get_partition_start(by_id, 1000) == 1000
+
+    by_day = Partitioning(field_id=1, period=DateTruncEnum.DAY)
+    # Aware values are stored in UTC.
+    moscow = datetime.timezone(datetime.timedelta(hours=3))
+    value = datetime.datetime(2026, 10, 19, 1, tzinfo=moscow)
+    assert get_partition_start(by_day, value) == datetime.datetime(2026, 10, 18)
+    assert get_partition_start(by_day, "2026-10-19T23:59") == datetime.datetime(2026, 10, 19)
+
+
+def test_partition_names() -> None:
+    by_day = Partitioning(field_id=1, period=DateTruncEnum.DAY)
+    table = Table(table_id=7, name="events", fields=[], partitioning=by_day)
+    for start in (datetime.datetime(2026, 10, 19), datetime.datetime(999, 1, 2)):
+        name = get_partition_name(table, start)
+        assert parse_partition_name(by_day, name) == start
+    assert get_partition_name(table, datetime.datetime(999, 1, 2)) == "storage_7_p0999010200"
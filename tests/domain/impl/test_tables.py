@@ -1,16 +1,51 @@
+import asyncio
+import dataclasses
+import datetime
+from typing import Any
+
 import pytest
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
-from drawbridge_backend.domain.enums import DataTypeEnum
-from drawbridge_backend.domain.impl.tables import SqlAlchemyTablesService
+from drawbridge_backend.cache import TTLCache
+from drawbridge_backend.db.shards import ShardSessions, StorageShards
+from drawbridge_backend.domain.enums import (
+    AggregateFunctionEnum,
+    DataTypeEnum,
+    DateTruncEnum,
+    OperatorEnum,
+)
+from drawbridge_backend.domain.impl import tables as tables_module
+from drawbridge_backend.domain.impl.tables import (
+    SqlAlchemyTablesService,
+    _partitions_in_maintenance,
+    get_shared_sa_table,
+)
 from drawbridge_backend.domain.tables.entities import (
+    AggregateParam,
+    BaseValue,
+    ChoiceValue,
+    DateTimeValue,
+    DeleteRowsOperation,
+    FacetValue,
+    FilteringParam,
+    GroupingParam,
     InsertRow,
+    InsertRowsOperation,
     IntValue,
+    OrderingParam,
+    RowConflict,
     RowData,
     StringValue,
+    Table,
+    UnSavedChoice,
     UnSavedField,
+    UnSavedPartitioning,
     UnSavedTable,
+    UpdateRow,
+    UpdateRowsOperation,
 )
+from drawbridge_backend.settings import DEFAULT_SHARD, settings
 
 
 @pytest.mark.anyio
@@ -172,8 +207,1187 @@ async def test_update_and_delete_rows(
         ],
     )
     assert updated[0].values[1].value.value == 20
+    with pytest.raises(ValueError, match="updated more than once"):
+        await service.update_rows(
+            [
+                UpdateRow(table, row_id, [RowData(quantity_field_id, IntValue(30))]),
+                UpdateRow(table, row_id, [RowData(title_field_id, StringValue("Item2"))]),
+            ],
+        )
 
     # Удаляем строку
+    assert await service.delete_rows(table, []) == []
     await service.delete_rows(table, [row_id])
     count = await service.count_rows(table)
     assert count == 0
+
+
+@pytest.mark.anyio
+async def test_fetch_changes(
+    _engine: AsyncEngine,
+    storage_engine: AsyncEngine,
+) -> None:
+    # Changes are read once every transaction that might precede them on
+    # the cluster finishes, so nothing is left uncommitted.
+    async with (
+        AsyncSession(_engine, expire_on_commit=False) as dbsession,
+        AsyncSession(storage_engine, expire_on_commit=False) as storage_dbsession,
+    ):
+        service = SqlAlchemyTablesService(
+            db_session=dbsession,
+            storage_db_session=storage_dbsession,
+            storage_engine=storage_engine,
+        )
+        table = await service.create_table(
+            UnSavedTable(
+                name="delta_sync",
+                fields=[
+                    UnSavedField(
+                        name="quantity",
+                        verbose_name="Quantity",
+                        data_type=DataTypeEnum.INT,
+                        is_nullable=True,
+                    ),
+                ],
+            ),
+        )
+        await dbsession.commit()
+        field_id = table.get_field_by_name("quantity").field_id
+
+        inserted = await service.insert_rows(
+            [InsertRow(table, [RowData(field_id, IntValue(i))]) for i in range(3)],
+        )
+        initial = await service.fetch_changes(table)
+        assert [r.row_id for r in initial.rows] == [r.row_id for r in inserted]
+        assert not initial.has_more
+
+        await service.update_rows(
+            [UpdateRow(table, inserted[2].row_id, [RowData(field_id, IntValue(30))])],
+        )
+        await service.delete_rows(table, [inserted[0].row_id])
+
+        delta = await service.fetch_changes(table, since=initial.cursor)
+        assert [r.row_id for r in delta.rows] == [inserted[2].row_id]
+        assert delta.rows[0].values[0].value.value == 30
+        assert delta.deleted_row_ids == [inserted[0].row_id]
+
+        paged = await service.fetch_changes(table, since=initial.cursor, limit=1)
+        assert paged.has_more
+        assert [r.row_id for r in paged.rows] == [inserted[2].row_id]
+        assert paged.deleted_row_ids == []
+
+        empty = await service.fetch_changes(table, since=delta.cursor)
+        # Caught up cursors follow the oldest running transaction.
+        assert (empty.cursor.xid, empty.cursor.seq) >= (delta.cursor.xid, delta.cursor.seq)
+        assert not empty.rows
+        assert not empty.deleted_row_ids
+
+        await service.compact_row_tombstones(datetime.timedelta(0))
+        assert (await service.fetch_changes(table, since=initial.cursor)).resync
+
+
+@pytest.mark.anyio
+async def test_fetch_changes_of_concurrent_transactions(
+    _engine: AsyncEngine,
+    storage_engine: AsyncEngine,
+) -> None:
+    async with (
+        AsyncSession(_engine, expire_on_commit=False) as dbsession,
+        AsyncSession(storage_engine, expire_on_commit=False) as first_session,
+        AsyncSession(storage_engine, expire_on_commit=False) as second_session,
+    ):
+        first = SqlAlchemyTablesService(
+            db_session=dbsession,
+            storage_db_session=first_session,
+            storage_engine=storage_engine,
+        )
+        second = SqlAlchemyTablesService(
+            db_session=dbsession,
+            storage_db_session=second_session,
+            storage_engine=storage_engine,
+        )
+        table = await first.create_table(
+            UnSavedTable(
+                name="concurrent_changes",
+                fields=[UnSavedField("value", "Value", DataTypeEnum.INT, True)],
+            ),
+        )
+        await dbsession.commit()
+        value = table.get_field_by_name("value").field_id
+        cursor = (await second.fetch_changes(table)).cursor
+
+        # The first write takes a lower change number but commits last.
+        early = await first._insert_rows([InsertRow(table, [RowData(value, IntValue(1))])])
+        late = await second.insert_rows([InsertRow(table, [RowData(value, IntValue(2))])])
+        delta = await second.fetch_changes(table, since=cursor)
+        # The committed row waits for the running transaction.
+        assert not delta.rows
+        cursor = delta.cursor
+        await first_session.commit()
+
+        delta = await second.fetch_changes(table, since=cursor)
+        assert [r.row_id for r in delta.rows] == [early[0].row_id, late[0].row_id]
+        assert not (await second.fetch_changes(table, since=delta.cursor)).rows
+
+
+@pytest.mark.anyio
+async def test_conditional_update_and_delete(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    storage_dbsession: AsyncSession,
+) -> None:
+    service = SqlAlchemyTablesService(
+        db_session=dbsession,
+        storage_db_session=storage_dbsession,
+        storage_engine=storage_engine,
+    )
+    table = await service.create_table(
+        UnSavedTable(
+            name="versioned",
+            fields=[
+                UnSavedField(
+                    name="quantity",
+                    verbose_name="Quantity",
+                    data_type=DataTypeEnum.INT,
+                    is_nullable=True,
+                ),
+            ],
+        ),
+    )
+    field_id = table.get_field_by_name("quantity").field_id
+    first, second = await service.insert_rows(
+        [InsertRow(table, [RowData(field_id, IntValue(i))]) for i in range(2)],
+    )
+    assert first.version == 1
+
+    updated = await service.update_rows(
+        [
+            UpdateRow(table, first.row_id, [RowData(field_id, IntValue(10))], 1),
+            UpdateRow(table, second.row_id, [RowData(field_id, IntValue(20))], 5),
+        ],
+    )
+    assert [(r.row_id, r.version) for r in updated] == [(first.row_id, 2)]
+    assert await service.get_row_conflicts(
+        table,
+        {first.row_id: 1, second.row_id: 5},
+        [r.row_id for r in updated],
+    ) == [RowConflict(row_id=second.row_id, expected_version=5, current_version=1)]
+
+    # Setting a value to NULL goes through the same batched statement.
+    updated = await service.update_rows(
+        [UpdateRow(table, second.row_id, [RowData(field_id, BaseValue(None))])],
+    )
+    assert updated[0].values[0].value.value is None
+
+    deleted = await service.delete_rows(
+        table,
+        [first.row_id, second.row_id],
+        {first.row_id: 1, second.row_id: 2},
+    )
+    assert deleted == [second.row_id]
+    assert await service.count_rows(table) == 1
+
+
+@pytest.mark.anyio
+async def test_execute_batch(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    storage_dbsession: AsyncSession,
+) -> None:
+    service = SqlAlchemyTablesService(
+        db_session=dbsession,
+        storage_db_session=storage_dbsession,
+        storage_engine=storage_engine,
+    )
+    fields = [
+        UnSavedField(
+            name="quantity",
+            verbose_name="Quantity",
+            data_type=DataTypeEnum.INT,
+            is_nullable=True,
+        ),
+    ]
+    orders = await service.create_table(UnSavedTable("batch_orders", fields))
+    items = await service.create_table(UnSavedTable("batch_items", fields))
+    orders_field = orders.get_field_by_name("quantity").field_id
+    items_field = items.get_field_by_name("quantity").field_id
+    existing = await service.insert_row(
+        InsertRow(orders, [RowData(orders_field, IntValue(1))]),
+    )
+
+    is_committed, results = await service.execute_batch(
+        [
+            InsertRowsOperation(
+                [InsertRow(items, [RowData(items_field, IntValue(i))]) for i in (5, 6)],
+            ),
+            UpdateRowsOperation(
+                [
+                    UpdateRow(
+                        orders,
+                        existing.row_id,
+                        [RowData(orders_field, IntValue(2))],
+                        expected_version=1,
+                    ),
+                ],
+            ),
+            DeleteRowsOperation(items, [999]),
+        ],
+    )
+    assert is_committed
+    assert [r.values[0].value.value for r in results[0].rows] == [5, 6]
+    assert results[1].rows[0].version == 2
+    assert results[2].deleted_row_ids == []
+    assert await service.count_rows(items) == 2
+
+    is_committed, results = await service.execute_batch(
+        [
+            DeleteRowsOperation(items, [r.row_id for r in results[0].rows]),
+            DeleteRowsOperation(orders, [existing.row_id], {existing.row_id: 1}),
+        ],
+    )
+    assert not is_committed
+    assert results[1].conflicts[0].current_version == 2
+
+
+@pytest.mark.anyio
+async def test_full_text_search(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    storage_dbsession: AsyncSession,
+) -> None:
+    service = SqlAlchemyTablesService(
+        db_session=dbsession,
+        storage_db_session=storage_dbsession,
+        storage_engine=storage_engine,
+    )
+    table = await service.create_table(
+        UnSavedTable(
+            name="searchable",
+            fields=[
+                UnSavedField(
+                    name="title",
+                    verbose_name="Title",
+                    data_type=DataTypeEnum.STRING,
+                    is_nullable=True,
+                ),
+                UnSavedField(
+                    name="notes",
+                    verbose_name="Notes",
+                    data_type=DataTypeEnum.STRING,
+                    is_nullable=True,
+                ),
+            ],
+        ),
+    )
+    title_id = table.get_field_by_name("title").field_id
+    notes_id = table.get_field_by_name("notes").field_id
+    rows = await service.insert_rows(
+        [
+            InsertRow(
+                table,
+                [
+                    RowData(title_id, StringValue(title)),
+                    RowData(notes_id, StringValue(notes)),
+                ],
+            )
+            for title, notes in [
+                ("red apple", "fruit"),
+                ("green apple", "apple pie apple"),
+                ("carrot", "vegetable"),
+            ]
+        ],
+    )
+
+    found = await service.fetch_rows(table, search="apple")
+    assert [r.row_id for r in found] == [rows[1].row_id, rows[0].row_id]
+    assert await service.count_rows(table, search="apple -green") == 1
+
+    # Equally good matches are ordered by ordering params.
+    pears = await service.insert_rows(
+        [
+            InsertRow(
+                table,
+                [RowData(title_id, StringValue(title)), RowData(notes_id, StringValue(notes))],
+            )
+            for title, notes in [("yellow pear", "a"), ("green pear", "b")]
+        ],
+    )
+    found = await service.fetch_rows(
+        table,
+        search="pear",
+        ordering_params=[OrderingParam(field_id=notes_id, ascending=False)],
+    )
+    assert [r.row_id for r in found] == [pears[1].row_id, pears[0].row_id]
+
+    await service.update_rows(
+        [UpdateRow(table, rows[2].row_id, [RowData(notes_id, StringValue("apple"))])],
+    )
+    assert await service.count_rows(table, search="apple") == 3
+
+
+@pytest.mark.anyio
+async def test_string_filters_and_autocomplete(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    storage_dbsession: AsyncSession,
+) -> None:
+    service = SqlAlchemyTablesService(
+        db_session=dbsession,
+        storage_db_session=storage_dbsession,
+        storage_engine=storage_engine,
+    )
+    table = await service.create_table(
+        UnSavedTable(
+            name="cities",
+            fields=[
+                UnSavedField(
+                    name="city",
+                    verbose_name="City",
+                    data_type=DataTypeEnum.STRING,
+                    is_nullable=False,
+                ),
+                UnSavedField(
+                    name="population",
+                    verbose_name="Population",
+                    data_type=DataTypeEnum.INT,
+                    is_nullable=True,
+                ),
+            ],
+        ),
+    )
+    city = table.get_field_by_name("city")
+    population_id = table.get_field_by_name("population").field_id
+    await service.insert_rows(
+        [
+            InsertRow(
+                table,
+                [
+                    RowData(city.field_id, StringValue(name)),
+                    RowData(population_id, IntValue(population)),
+                ],
+            )
+            for name, population in [
+                ("Moscow", 13),
+                ("Moscow", 13),
+                ("Mostar", 1),
+                ("Omsk", 1),
+                ("100%_real", 0),
+            ]
+        ],
+    )
+
+    async def fetch(*params: FilteringParam) -> list[str]:
+        rows = await service.fetch_rows(table, filtering_params=list(params))
+        return sorted(r.values[0].value.value for r in rows)
+
+    assert await fetch(FilteringParam(city.field_id, "SCO", OperatorEnum.CONTAINS)) == [
+        "Moscow",
+        "Moscow",
+    ]
+    assert await fetch(
+        FilteringParam(city.field_id, "MO", OperatorEnum.STARTS_WITH),
+    ) == ["Moscow", "Moscow", "Mostar"]
+    assert await fetch(FilteringParam(city.field_id, "%_", OperatorEnum.CONTAINS)) == [
+        "100%_real",
+    ]
+    assert await fetch(
+        FilteringParam(population_id, "10", OperatorEnum.GT),
+        FilteringParam(city.field_id, "Omsk"),
+    ) == ["Moscow", "Moscow", "Omsk"]
+    assert (
+        await service.count_rows(
+            table,
+            filtering_params=[FilteringParam(population_id, "1")],
+        )
+        == 2
+    )
+
+    assert await service.autocomplete(table, city, "mo") == ["Moscow", "Mostar"]
+    # `similar` is served by pg_trgm, which fields without a trigram index lack.
+    with pytest.raises(ValueError, match="trigram index"):
+        await fetch(FilteringParam(city.field_id, "Moskow", OperatorEnum.SIMILAR))
+
+
+@pytest.mark.anyio
+async def test_aggregate(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    storage_dbsession: AsyncSession,
+) -> None:
+    service = SqlAlchemyTablesService(
+        db_session=dbsession,
+        storage_db_session=storage_dbsession,
+        storage_engine=storage_engine,
+    )
+    table = await service.create_table(
+        UnSavedTable(
+            name="orders",
+            fields=[
+                UnSavedField(
+                    name="status",
+                    verbose_name="Status",
+                    data_type=DataTypeEnum.CHOICE,
+                    is_nullable=True,
+                    choices=[UnSavedChoice("new"), UnSavedChoice("paid")],
+                ),
+                UnSavedField(
+                    name="amount",
+                    verbose_name="Amount",
+                    data_type=DataTypeEnum.INT,
+                    is_nullable=True,
+                ),
+                UnSavedField(
+                    name="created",
+                    verbose_name="Created",
+                    data_type=DataTypeEnum.DATETIME,
+                    is_nullable=True,
+                ),
+            ],
+        ),
+    )
+    status = table.get_field_by_name("status")
+    amount = table.get_field_by_name("amount")
+    created = table.get_field_by_name("created")
+    new, paid = (c.choice_id for c in status.choices)
+    jan = datetime.datetime(2024, 1, 5)
+    feb = datetime.datetime(2024, 2, 7)
+    await service.insert_rows(
+        [
+            InsertRow(
+                table,
+                [
+                    RowData(status.field_id, ChoiceValue(choice)),
+                    RowData(amount.field_id, IntValue(value)),
+                    RowData(created.field_id, DateTimeValue(when)),
+                ],
+            )
+            for choice, value, when in [
+                (new, 10, jan),
+                (new, 20, feb),
+                (paid, 5, jan),
+                (paid, 7, jan),
+            ]
+        ],
+    )
+
+    result = await service.aggregate(
+        table,
+        [
+            AggregateParam(AggregateFunctionEnum.COUNT),
+            AggregateParam(AggregateFunctionEnum.SUM, amount.field_id),
+            AggregateParam(AggregateFunctionEnum.AVG, amount.field_id),
+        ],
+        grouping_params=[GroupingParam(status.field_id)],
+    )
+    assert result.columns == ["status", "count", "sum_amount", "avg_amount"]
+    assert result.rows == [["new", 2, 30, 15.0], ["paid", 2, 12, 6.0]]
+
+    result = await service.aggregate(
+        table,
+        [AggregateParam(AggregateFunctionEnum.MAX, amount.field_id)],
+        grouping_params=[GroupingParam(created.field_id, DateTruncEnum.MONTH)],
+        filtering_params=[FilteringParam(amount.field_id, "6", OperatorEnum.GT)],
+    )
+    assert result.columns == ["created__month", "max_amount"]
+    assert [(r[0].month, r[1]) for r in result.rows] == [(1, 10), (2, 20)]
+
+    with pytest.raises(ValueError):
+        await service.aggregate(
+            table,
+            [AggregateParam(AggregateFunctionEnum.SUM, created.field_id)],
+        )
+
+
+@pytest.mark.anyio
+async def test_compute_statistics(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    storage_dbsession: AsyncSession,
+) -> None:
+    service = SqlAlchemyTablesService(
+        db_session=dbsession,
+        storage_db_session=storage_dbsession,
+        storage_engine=storage_engine,
+    )
+    table = await service.create_table(
+        UnSavedTable(
+            name="measurements",
+            fields=[
+                UnSavedField(
+                    name="value",
+                    verbose_name="Value",
+                    data_type=DataTypeEnum.INT,
+                    is_nullable=True,
+                ),
+            ],
+        ),
+    )
+    field_id = table.get_field_by_name("value").field_id
+    rows = await service.insert_rows(
+        [
+            InsertRow(table, [RowData(field_id, IntValue(i % 50))])
+            for i in range(100)
+        ],
+    )
+    await service.insert_rows([InsertRow(table, [])])
+
+    statistics = await service.compute_statistics(table, histogram_buckets=2)
+    assert statistics is not None
+    assert statistics.is_exact
+    assert statistics.row_count == 101
+    assert statistics.data_version == await service.get_data_version(table)
+    [value] = statistics.fields
+    assert value.null_ratio == pytest.approx(1 / 101)
+    assert value.distinct_estimate == 50
+    assert (value.min_value, value.max_value) == (0, 49)
+    assert value.histogram == [0, 24, 49]
+
+    sampled = await service.compute_statistics(table, exact_row_limit=0)
+    assert sampled is not None
+    assert not sampled.is_exact
+    assert sampled.row_count == 101
+    [value] = sampled.fields
+    assert value.distinct_estimate == 50
+    assert (value.min_value, value.max_value) == (0, 49)
+
+    assert await service.compute_statistics(table, statistics.data_version) is None
+    await service.delete_rows(table, [rows[0].row_id])
+    assert await service.get_data_version(table) > statistics.data_version
+
+
+@pytest.mark.anyio
+async def test_fetch_facets(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    storage_dbsession: AsyncSession,
+) -> None:
+    service = SqlAlchemyTablesService(
+        db_session=dbsession,
+        storage_db_session=storage_dbsession,
+        storage_engine=storage_engine,
+    )
+    table = await service.create_table(
+        UnSavedTable(
+            name="tickets",
+            fields=[
+                UnSavedField(
+                    name="priority",
+                    verbose_name="Priority",
+                    data_type=DataTypeEnum.CHOICE,
+                    is_nullable=True,
+                    choices=[UnSavedChoice("low"), UnSavedChoice("high")],
+                ),
+                UnSavedField(
+                    name="assignee",
+                    verbose_name="Assignee",
+                    data_type=DataTypeEnum.STRING,
+                    is_nullable=True,
+                ),
+            ],
+        ),
+    )
+    priority = table.get_field_by_name("priority")
+    assignee = table.get_field_by_name("assignee")
+    low, high = (c.choice_id for c in priority.choices)
+    await service.insert_rows(
+        [
+            InsertRow(
+                table,
+                [
+                    RowData(priority.field_id, ChoiceValue(choice)),
+                    RowData(assignee.field_id, StringValue(name)),
+                ],
+            )
+            for choice, name in [
+                (low, "ann"),
+                (low, "bob"),
+                (low, "ann"),
+                (high, "ann"),
+                (high, "eve"),
+            ]
+        ],
+    )
+
+    priority_facet, assignee_facet = await service.fetch_facets(
+        table,
+        [priority, assignee],
+        limit=2,
+    )
+    assert priority_facet.values == [
+        FacetValue(low, 3, "low"),
+        FacetValue(high, 2, "high"),
+    ]
+    assert assignee_facet.values == [FacetValue("ann", 3), FacetValue("bob", 1)]
+    assert not assignee_facet.is_approximate
+
+    [assignee_facet] = await service.fetch_facets(
+        table,
+        [assignee],
+        filtering_params=[FilteringParam(priority.field_id, str(high))],
+    )
+    assert assignee_facet.values == [FacetValue("ann", 1), FacetValue("eve", 1)]
+
+    [sampled] = await service.fetch_facets(table, [assignee], sample_percent=100)
+    assert sum(v.count for v in sampled.values) == 5
+
+
+@pytest.mark.anyio
+async def test_table_cache_and_warm_up(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    storage_dbsession: AsyncSession,
+) -> None:
+    table_cache: TTLCache[int, Table] = TTLCache(maxsize=10, ttl=60)
+    service = SqlAlchemyTablesService(
+        db_session=dbsession,
+        storage_db_session=storage_dbsession,
+        storage_engine=storage_engine,
+        table_cache=table_cache,
+    )
+    table = await service.create_table(
+        UnSavedTable(
+            name="warm",
+            fields=[
+                UnSavedField("title", "Title", DataTypeEnum.STRING, False),
+                UnSavedField("size", "Size", DataTypeEnum.INT, False),
+                UnSavedField(
+                    "kind",
+                    "Kind",
+                    DataTypeEnum.CHOICE,
+                    True,
+                    choices=[UnSavedChoice("a")],
+                ),
+            ],
+        ),
+    )
+    # It isn't committed yet.
+    assert table_cache.get(table.table_id) is None
+
+    cached = await service.get_table_by_id(table.table_id)
+    assert cached == table
+    # Callers may modify what they get without touching the cache.
+    cached.verbose_name = "Renamed"
+    assert (await service.get_table_by_id(table.table_id)).verbose_name == "warm"
+    assert get_shared_sa_table(cached) is get_shared_sa_table(table)
+
+    await service.update_table(cached)
+    assert (await service.get_table_by_id(table.table_id)).verbose_name == "Renamed"
+
+    assert [t.table_id for t in await service.fetch_recent_tables(1)] == [table.table_id]
+
+    await service.warm_up_statements(table)
+    assert await service.count_rows(table) == 0
+
+
+@pytest.mark.anyio
+async def test_fetch_ordered_rows(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    storage_dbsession: AsyncSession,
+) -> None:
+    service = SqlAlchemyTablesService(
+        db_session=dbsession,
+        storage_db_session=storage_dbsession,
+        storage_engine=storage_engine,
+    )
+    table = await service.create_table(
+        UnSavedTable(
+            name="scores",
+            fields=[
+                UnSavedField("player", "Player", DataTypeEnum.STRING, False),
+                UnSavedField("score", "Score", DataTypeEnum.INT, False),
+            ],
+        ),
+    )
+    player = table.get_field_by_name("player").field_id
+    score = table.get_field_by_name("score").field_id
+    await service.insert_rows(
+        [
+            InsertRow(table, [RowData(player, StringValue(p)), RowData(score, IntValue(s))])
+            for p, s in [("ann", 3), ("bob", 5), ("eve", 3)]
+        ],
+    )
+
+    async def players(*params: OrderingParam) -> list[str]:
+        rows = await service.fetch_rows(table, ordering_params=list(params))
+        return [r.values[0].value.value for r in rows]
+
+    assert await players(OrderingParam(score, ascending=False)) == ["bob", "ann", "eve"]
+    assert await players(
+        OrderingParam(score),
+        OrderingParam(player, ascending=False),
+    ) == ["eve", "ann", "bob"]
+
+
+async def _partitions(storage_engine: AsyncEngine, table_name: str) -> list[str]:
+    async with storage_engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:name) ORDER BY c.relname",
+            ),
+            {"name": table_name},
+        )
+        return list(result.scalars().all())
+
+
+@pytest.mark.anyio
+async def test_partition_by_datetime(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+) -> None:
+    # Partitions are maintained on their own connection, which can't see
+    # uncommitted rows of the test transaction, so writes are committed.
+    async with AsyncSession(storage_engine, expire_on_commit=False) as storage_session:
+        service = SqlAlchemyTablesService(
+            db_session=dbsession,
+            storage_db_session=storage_session,
+            storage_engine=storage_engine,
+        )
+        with pytest.raises(ValueError, match="must not be nullable"):
+            await service.create_table(
+                UnSavedTable(
+                    name="events_nullable",
+                    fields=[UnSavedField("at", "At", DataTypeEnum.DATETIME, True)],
+                    partitioning=UnSavedPartitioning(field_name="at"),
+                ),
+            )
+        table = await service.create_table(
+            UnSavedTable(
+                name="events",
+                fields=[
+                    UnSavedField("at", "At", DataTypeEnum.DATETIME, False),
+                    UnSavedField("kind", "Kind", DataTypeEnum.STRING, False),
+                ],
+                partitioning=UnSavedPartitioning(
+                    field_name="at",
+                    period=DateTruncEnum.MONTH,
+                    retention=2,
+                ),
+            ),
+        )
+        at = table.get_field_by_name("at").field_id
+        kind = table.get_field_by_name("kind").field_id
+        assert table.partitioning is not None
+        assert table.partitioning.field_id == at
+        # The current month and two ahead.
+        assert len(await _partitions(storage_engine, "events")) == 3
+
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        backfilled = datetime.datetime(2020, 1, 15, 12, 30)
+        await service.insert_rows(
+            [
+                InsertRow(table, [RowData(at, DateTimeValue(d)), RowData(kind, StringValue(k))])
+                for d, k in [(now, "new"), (backfilled, "old")]
+            ],
+        )
+        assert f"storage_{table.table_id}_p2020010100" in await _partitions(
+            storage_engine,
+            "events",
+        )
+
+        # Filters on the partition key only scan matching partitions.
+        plan = "\n".join(
+            (
+                await storage_session.execute(
+                    text("EXPLAIN SELECT * FROM events WHERE at < '2020-02-01'"),
+                )
+            ).scalars(),
+        )
+        assert f"storage_{table.table_id}_p2020010100" in plan
+        assert plan.count(f"storage_{table.table_id}_p") == 1
+        rows = await service.fetch_rows(
+            table,
+            filtering_params=[FilteringParam(at, "2020-02-01", OperatorEnum.LT)],
+        )
+        assert [r.values[1].value.value for r in rows] == ["old"]
+
+        cursor = (await service.fetch_changes(table)).cursor
+        await storage_session.commit()
+        await service.maintain_partitions(table)
+
+        assert f"storage_{table.table_id}_p2020010100" not in await _partitions(
+            storage_engine,
+            "events",
+        )
+        assert [r.values[1].value.value for r in await service.fetch_rows(table)] == ["new"]
+        # Rows of dropped partitions leave no tombstones.
+        assert (await service.fetch_changes(table, since=cursor)).resync
+
+
+@pytest.mark.anyio
+async def test_partition_by_id(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+) -> None:
+    async with AsyncSession(storage_engine, expire_on_commit=False) as storage_session:
+        service = SqlAlchemyTablesService(
+            db_session=dbsession,
+            storage_db_session=storage_session,
+            storage_engine=storage_engine,
+        )
+        table = await service.create_table(
+            UnSavedTable(
+                name="readings",
+                fields=[UnSavedField("value", "Value", DataTypeEnum.INT, False)],
+                partitioning=UnSavedPartitioning(id_range=10, retention=1),
+            ),
+        )
+        value = table.get_field_by_name("value").field_id
+        partitions = [f"storage_{table.table_id}_p{start}" for start in (0, 10, 20)]
+        assert await _partitions(storage_engine, "readings") == partitions
+
+        await service.insert_rows(
+            [InsertRow(table, [RowData(value, IntValue(i))]) for i in range(15)],
+        )
+        # Row 15 moved on to the partition starting at 10, so the next one
+        # is created in the background and the one at 0 is expired.
+        while table.table_id in _partitions_in_maintenance:
+            await asyncio.sleep(0.01)
+
+        assert await _partitions(storage_engine, "readings") == sorted(
+            f"storage_{table.table_id}_p{start}" for start in (10, 20, 30)
+        )
+        assert await service.count_rows(table) == 6
+
+
+@pytest.mark.anyio
+async def test_place_and_move_table(
+    _engine: AsyncEngine,
+    storage_engine: AsyncEngine,
+    shard_engine: AsyncEngine,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "table_move_batch_size", 2)
+    monkeypatch.setattr(settings, "table_move_final_changes", 2)
+    shards = StorageShards({DEFAULT_SHARD: storage_engine, "second": shard_engine})
+    # Tables are moved over their own connections and changes are copied
+    # once no older transaction is running, so everything is committed.
+    async with (
+        AsyncSession(_engine, expire_on_commit=False) as dbsession,
+        AsyncSession(storage_engine, expire_on_commit=False) as storage_session,
+    ):
+        shard_sessions = ShardSessions(shards, storage_session)
+        service = SqlAlchemyTablesService(
+            db_session=dbsession,
+            storage_db_session=storage_session,
+            storage_engine=storage_engine,
+            shard_sessions=shard_sessions,
+        )
+        least_loaded = await shards.get_least_loaded()
+        table = await service.create_table(
+            UnSavedTable(
+                name="moving",
+                fields=[UnSavedField("value", "Value", DataTypeEnum.INT, False)],
+            ),
+        )
+        await dbsession.commit()
+        assert table.shard == least_loaded
+        assert (await service.count_tables_by_shard())[least_loaded] >= 1
+        value = table.get_field_by_name("value").field_id
+        rows = await service.insert_rows(
+            [InsertRow(table, [RowData(value, IntValue(i))]) for i in range(7)],
+        )
+        await service.delete_rows(table, [rows[0].row_id])
+        cursor = (await service.fetch_changes(table)).cursor
+
+        # Rows written while the table is being copied are moved too.
+        copy_changes = service._copy_changes
+        writes = [
+            service.update_rows([UpdateRow(table, rows[1].row_id, [RowData(value, IntValue(10))])]),
+            service.delete_rows(table, [rows[2].row_id]),
+            service.insert_rows([InsertRow(table, [RowData(value, IntValue(20))])]),
+        ]
+
+        async def copy_changes_and_write(*args: object, **kwargs: object) -> object:
+            result = await copy_changes(*args, **kwargs)  # type: ignore[arg-type]
+            if writes:
+                await writes.pop(0)
+            return result
+
+        monkeypatch.setattr(service, "_copy_changes", copy_changes_and_write)
+        other = "second" if table.shard == DEFAULT_SHARD else DEFAULT_SHARD
+        with pytest.raises(ValueError, match="Unknown storage shard"):
+            await service.move_table(table, "missing")
+        moved = await service.move_table(table, other)
+        assert not writes
+
+        assert moved.shard == other
+        assert await service.get_table_by_id(table.table_id) == moved
+        values = [r.values[0].value.value for r in await service.fetch_rows(moved)]
+        assert sorted(values) == [3, 4, 5, 6, 10, 20]
+        # The old storage table is gone.
+        async with shards.engine(table.shard).connect() as conn:
+            assert await conn.scalar(text("SELECT to_regclass('moving')")) is None
+
+        # Ids and change numbers continue after those of the old shard.
+        inserted = await service.insert_rows([InsertRow(moved, [RowData(value, IntValue(30))])])
+        assert inserted[0].row_id == rows[-1].row_id + 2
+        assert (await service.fetch_changes(moved, since=cursor)).resync
+        delta = await service.fetch_changes(moved)
+        assert len(delta.rows) == 7
+        assert not (await service.fetch_changes(moved, since=delta.cursor)).resync
+        await shard_sessions.close()
+
+
+@pytest.mark.anyio
+async def test_alter_fields(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "schema_change_batch_size", 2)
+    # Storage tables are altered over their own connections, so writes are committed.
+    async with AsyncSession(storage_engine, expire_on_commit=False) as storage_session:
+        service = SqlAlchemyTablesService(
+            db_session=dbsession,
+            storage_db_session=storage_session,
+            storage_engine=storage_engine,
+        )
+        table = await service.create_table(
+            UnSavedTable(
+                name="altered",
+                fields=[
+                    UnSavedField("title", "Title", DataTypeEnum.STRING, False),
+                    UnSavedField("amount", "Amount", DataTypeEnum.STRING, True),
+                    UnSavedField("note", "Note", DataTypeEnum.STRING, True),
+                ],
+            ),
+        )
+        title = table.get_field_by_name("title").field_id
+        amount = table.get_field_by_name("amount").field_id
+        await service.insert_rows(
+            [
+                InsertRow(table, [RowData(title, StringValue(f"apple {i}")), RowData(amount, StringValue(str(i)))])
+                for i in range(5)
+            ],
+        )
+
+        async def get_relfilenode() -> int:
+            async with storage_engine.connect() as conn:
+                return await conn.scalar(
+                    text("SELECT relfilenode FROM pg_class WHERE relname = 'altered'"),
+                )
+
+        relfilenode = await get_relfilenode()
+        fields = [f for f in table.fields if f.name != "note"]
+        fields[0] = dataclasses.replace(fields[0], name="name")
+        with pytest.raises(ValueError, match="needs a default value"):
+            await service.alter_fields(
+                table,
+                [*fields, UnSavedField("count", "Count", DataTypeEnum.INT, False)],
+            )
+        with pytest.raises(ValueError, match="reserved"):
+            await service.alter_fields(
+                table,
+                [*fields, UnSavedField("_seq", "Seq", DataTypeEnum.INT, True)],
+            )
+
+        # Adding, renaming and dropping fields doesn't rewrite the table.
+        change = await service.alter_fields(
+            table,
+            [*fields, UnSavedField("count", "Count", DataTypeEnum.INT, False, "3")],
+        )
+        assert not change.conversions
+        # Search vectors of rows still have words of the dropped field.
+        assert change.reindex_search
+        table = await service.finish_schema_change(change)
+        assert [f.name for f in table.fields] == ["name", "amount", "count"]
+        assert await get_relfilenode() == relfilenode
+        assert await service.get_table_by_id(table.table_id) == table
+        rows = await service.fetch_rows(table, search="apple")
+        assert len(rows) == 5
+        assert {r.values[2].value.value for r in rows} == {3}
+        inserted = await service.insert_rows(
+            [InsertRow(table, [RowData(title, StringValue("pear"))])],
+        )
+        assert (await service.fetch_row_by_id(table, inserted[0].row_id)).values[2].value.value == 3
+
+        # Existing rows are checked before a field is made required.
+        fields = [dataclasses.replace(f) for f in table.fields]
+        fields[1].is_nullable = False
+        with pytest.raises(ValueError, match="'amount' is empty"):
+            await service.alter_fields(table, fields)
+        assert await service.get_table_by_id(table.table_id) == table
+
+        # Values are converted in the background, the field keeps its type until then.
+        fields[1].is_nullable = True
+        fields[1].data_type = DataTypeEnum.INT
+        change = await service.alter_fields(table, fields)
+        assert not change.is_finished
+        assert change.table.get_field_by_id(amount).data_type is DataTypeEnum.STRING
+        with pytest.raises(ValueError, match="being converted"):
+            await service.alter_fields(change.table, change.table.fields[:1])
+        await service.insert_rows(
+            [InsertRow(change.table, [RowData(title, StringValue("plum")), RowData(amount, StringValue("42"))])],
+        )
+        cursor = (await service.fetch_changes(change.table)).cursor
+        table = await service.finish_schema_change(change)
+        assert table.get_field_by_id(amount).data_type is DataTypeEnum.INT
+        assert await service.get_table_by_id(table.table_id) == table
+        values = {r.values[1].value.value for r in await service.fetch_rows(table)}
+        assert values == {0, 1, 2, 3, 4, 42, None}
+        assert (await service.fetch_changes(table, since=cursor)).resync
+        # "amount" isn't part of search vectors anymore.
+        assert len(await service.fetch_rows(table, search="42")) == 0
+
+        # Values that can't be converted abort the conversion.
+        await service.update_rows(
+            [UpdateRow(table, inserted[0].row_id, [RowData(title, StringValue("not a date"))])],
+        )
+        fields = [dataclasses.replace(f) for f in table.fields]
+        fields[0].data_type = DataTypeEnum.DATETIME
+        change = await service.alter_fields(table, fields)
+        with pytest.raises(ValueError, match="can't be converted"):
+            await service.finish_schema_change(change)
+        assert await service.get_table_by_id(table.table_id) == table
+        # The field can be changed again.
+        fields[0].data_type = DataTypeEnum.STRING
+        fields[0].verbose_name = "Name"
+        assert (await service.alter_fields(table, fields)).is_finished
+
+
+@pytest.mark.anyio
+async def test_alter_fields_with_concurrent_writes(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async with AsyncSession(storage_engine, expire_on_commit=False) as storage_session:
+        service = SqlAlchemyTablesService(
+            db_session=dbsession,
+            storage_db_session=storage_session,
+            storage_engine=storage_engine,
+        )
+        table = await service.create_table(
+            UnSavedTable(
+                name="converted_while_written",
+                fields=[UnSavedField("amount", "Amount", DataTypeEnum.STRING, True)],
+            ),
+        )
+        amount = table.get_field_by_name("amount").field_id
+        await service.insert_rows([InsertRow(table, [RowData(amount, StringValue("1"))])])
+
+        check_conversions = tables_module._check_conversions
+        checks = 0
+
+        async def write_after_first_check(*args: Any) -> None:
+            nonlocal checks
+            await check_conversions(*args)
+            checks += 1
+            if checks == 1:
+                async with storage_engine.begin() as conn:
+                    await conn.execute(
+                        text("INSERT INTO converted_while_written (amount) VALUES ('many')"),
+                    )
+
+        # Values written after the first check are checked again before the swap.
+        monkeypatch.setattr(tables_module, "_check_conversions", write_after_first_check)
+        fields = [dataclasses.replace(f, data_type=DataTypeEnum.INT) for f in table.fields]
+        change = await service.alter_fields(table, fields)
+        with pytest.raises(ValueError, match="can't be converted"):
+            await service.finish_schema_change(change)
+        assert await service.get_table_by_id(table.table_id) == table
+        values = {r.values[0].value.value for r in await service.fetch_rows(table)}
+        assert values == {"1", "many"}
+
+
+@pytest.mark.anyio
+async def test_alter_fields_failing_to_commit(
+    _engine: AsyncEngine,
+    storage_engine: AsyncEngine,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async with (
+        AsyncSession(_engine, expire_on_commit=False) as dbsession,
+        AsyncSession(storage_engine, expire_on_commit=False) as storage_session,
+    ):
+        service = SqlAlchemyTablesService(
+            db_session=dbsession,
+            storage_db_session=storage_session,
+            storage_engine=storage_engine,
+        )
+        table = await service.create_table(
+            UnSavedTable(
+                name="not_altered",
+                fields=[UnSavedField("title", "Title", DataTypeEnum.STRING, True)],
+            ),
+        )
+        await dbsession.commit()
+
+        async def fail_to_commit() -> None:
+            raise ConnectionError("Metadata database is gone")
+
+        monkeypatch.setattr(dbsession, "commit", fail_to_commit)
+        with pytest.raises(ConnectionError):
+            await service.alter_fields(
+                table,
+                [*table.fields, UnSavedField("extra", "Extra", DataTypeEnum.INT, True)],
+            )
+        monkeypatch.undo()
+
+        # Storage is left as metadata describes it.
+        assert await service.get_table_by_id(table.table_id) == table
+        async with storage_engine.connect() as conn:
+            columns = await conn.scalars(
+                text(
+                    "SELECT column_name FROM information_schema.columns "
+                    "WHERE table_name = 'not_altered'",
+                ),
+            )
+            assert "extra" not in set(columns)
+
+
+@pytest.mark.anyio
+async def test_upgrade_storage(_engine: AsyncEngine, storage_engine: AsyncEngine) -> None:
+    async with (
+        AsyncSession(_engine, expire_on_commit=False) as dbsession,
+        AsyncSession(storage_engine, expire_on_commit=False) as storage_session,
+    ):
+        service = SqlAlchemyTablesService(
+            db_session=dbsession,
+            storage_db_session=storage_session,
+            storage_engine=storage_engine,
+        )
+        table = await service.create_table(
+            UnSavedTable(
+                name="upgraded",
+                fields=[UnSavedField("name", "Name", DataTypeEnum.STRING, False)],
+            ),
+        )
+        await dbsession.commit()
+        name = table.get_field_by_name("name").field_id
+        await service.insert_rows([InsertRow(table, [RowData(name, StringValue("old"))])])
+        # Storage as created by a version without commit ordered changes.
+        async with storage_engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "ALTER TABLE upgraded DROP COLUMN _seq, DROP COLUMN _xid, "
+                    "DROP COLUMN _version, DROP COLUMN _search",
+                ),
+            )
+            await conn.execute(text("DROP TRIGGER search_vector ON upgraded"))
+            await conn.execute(text("ALTER TABLE row_tombstones DROP COLUMN xid"))
+            await conn.execute(text("ALTER TABLE row_tombstone_watermarks DROP COLUMN xid"))
+
+        await service.upgrade_storage()
+        # Nothing is left to do the second time.
+        await service.upgrade_storage()
+
+        new = await service.insert_rows([InsertRow(table, [RowData(name, StringValue("new"))])])
+        await service.delete_rows(table, [new[0].row_id])
+        delta = await service.fetch_changes(table)
+        assert [r.values[0].value.value for r in delta.rows] == ["old"]
+        assert delta.rows[0].version == 1
+        assert [r.row_id for r in await service.fetch_rows(table, search="old")] == [
+            delta.rows[0].row_id,
+        ]
+        assert delta.deleted_row_ids == [new[0].row_id]
+        async with storage_engine.connect() as conn:
+            indexes = await conn.scalars(
+                text("SELECT indexname FROM pg_indexes WHERE tablename = 'upgraded'"),
+            )
+            assert {
+                f"ix_storage_{table.table_id}__xid_seq",
+                f"ix_storage_{table.table_id}__search",
+            } <= set(indexes)
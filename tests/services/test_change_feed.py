@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from drawbridge_backend.domain.enums import ChangeTypeEnum, DataTypeEnum
+from drawbridge_backend.domain.impl.tables import (
+    ROW_CHANGES_CHANNEL,
+    SqlAlchemyTablesService,
+    dump_row_change,
+)
+from drawbridge_backend.domain.tables.entities import (
+    InsertRow,
+    IntValue,
+    RowChange,
+    RowData,
+    UnSavedField,
+    UnSavedTable,
+    UpdateRow,
+)
+from drawbridge_backend.services.change_feed import ChangeBatch, ChangeFeed, Subscription
+
+
+def test_change_batch_coalescing() -> None:
+    batch = ChangeBatch()
+    batch.add(RowChange(1, ChangeTypeEnum.INSERT, [1, 2]))
+    batch.add(RowChange(1, ChangeTypeEnum.UPDATE, [2, 3, 4]))
+    batch.add(RowChange(1, ChangeTypeEnum.DELETE, [1, 4, 5]))
+
+    assert batch.inserted == {2}
+    assert batch.updated == {3}
+    assert batch.deleted == {4, 5}
+
+
+@pytest.mark.anyio
+async def test_subscription_overflow_requests_resync() -> None:
+    subscription = Subscription(table_id=1, queue_size=1)
+    subscription.push(RowChange(1, ChangeTypeEnum.INSERT, [1]))
+    subscription.push(RowChange(1, ChangeTypeEnum.INSERT, [2]))
+
+    batch = await subscription.next_batch(window=0)
+    assert batch.resync
+    assert not batch.inserted
+
+
+@pytest.mark.anyio
+async def test_row_changes_are_fanned_out(
+    dbsession: AsyncSession,
+    storage_engine: AsyncEngine,
+) -> None:
+    change_feed = ChangeFeed(queue_size=100)
+    await change_feed.start(storage_engine)
+    # Notifications are delivered on commit, so this test needs a session
+    # that really commits instead of the rolled back `storage_dbsession`.
+    storage_session = async_sessionmaker(storage_engine, expire_on_commit=False)()
+    service = SqlAlchemyTablesService(
+        db_session=dbsession,
+        storage_db_session=storage_session,
+        storage_engine=storage_engine,
+    )
+    table = await service.create_table(
+        UnSavedTable(
+            name="change_feed_test",
+            fields=[
+                UnSavedField(
+                    name="value",
+                    verbose_name="Value",
+                    data_type=DataTypeEnum.INT,
+                    is_nullable=True,
+                ),
+            ],
+        ),
+    )
+    field_id = table.get_field_by_name("value").field_id
+
+    try:
+        async with change_feed.subscribe(table.table_id) as subscription:
+            inserted = await service.insert_rows(
+                [
+                    InsertRow(table, [RowData(field_id, IntValue(i))])
+                    for i in range(3)
+                ],
+            )
+            ids = [r.row_id for r in inserted]
+            await service.update_rows(
+                [UpdateRow(table, ids[0], [RowData(field_id, IntValue(10))])],
+            )
+            await service.delete_rows(table, [ids[1]])
+
+            batch = await subscription.next_batch(window=0.5)
+    finally:
+        await storage_session.close()
+        await change_feed.stop()
+
+    assert batch.inserted == {ids[0], ids[2]}
+    assert not batch.updated
+    assert not batch.deleted
+
+
+@pytest.mark.anyio
+async def test_change_feed_starts_on_first_subscription(storage_engine: AsyncEngine) -> None:
+    change_feed = ChangeFeed(queue_size=100, engine=storage_engine)
+    assert not change_feed.is_started
+    async with change_feed.subscribe(table_id=1):
+        assert change_feed.is_started
+    await change_feed.stop()
+
+
+@pytest.mark.anyio
+async def test_change_feed_reconnects(storage_engine: AsyncEngine) -> None:
+    change_feed = ChangeFeed(queue_size=100, engine=storage_engine, reconnect_delay=0.01)
+
+    async def notify(payload: str) -> None:
+        async with storage_engine.begin() as conn:
+            await conn.execute(
+                select(func.pg_notify(ROW_CHANGES_CHANNEL, payload)),
+            )
+
+    try:
+        async with change_feed.subscribe(table_id=1) as subscription:
+            connection = change_feed._connections[storage_engine]  # noqa: SLF001
+            raw_connection = await connection.get_raw_connection()
+            pid = raw_connection.driver_connection.get_server_pid()  # type: ignore
+            async with storage_engine.begin() as conn:
+                await conn.execute(select(func.pg_terminate_backend(pid)))
+
+            # Changes made while reconnecting are missed.
+            batch = await asyncio.wait_for(subscription.next_batch(window=0), 5)
+            assert batch.resync
+            await notify(dump_row_change(RowChange(1, ChangeTypeEnum.INSERT, [7])))
+            batch = await asyncio.wait_for(subscription.next_batch(window=0), 5)
+            assert batch.inserted == {7}
+    finally:
+        await change_feed.stop()
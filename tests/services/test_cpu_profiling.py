@@ -0,0 +1,52 @@
+import marshal
+import threading
+import time
+
+from drawbridge_backend.services.cpu_profiling import (
+    CPUProfiler,
+    SamplingProfiler,
+    profile_thread,
+)
+
+
+def _spin(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampling_profiler_collapses_stacks() -> None:
+    sampler = SamplingProfiler(threading.get_ident(), 0.001)
+    sampler.start()
+    _spin(0.1)
+    collapsed = sampler.stop()
+
+    assert collapsed
+    stack, count = collapsed.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0
+    # outermost frame first
+    frames = stack.split(";")
+    assert "_spin" in frames[-1]
+    assert any("test_sampling_profiler_collapses_stacks" in f for f in frames[:-1])
+
+
+def test_profile_thread_cprofile() -> None:
+    with profile_thread("cprofile", "test", 0.001) as profile:
+        _spin(0.01)
+
+    assert "_spin" in profile.report
+    assert profile.pstats is not None
+    stats = marshal.loads(profile.pstats)  # noqa: S302
+    assert any(name == "_spin" for _, _, name in stats)
+
+
+def test_one_profile_at_a_time() -> None:
+    profiler = CPUProfiler(stored_profiles=1)
+    with profiler.acquire() as acquired:
+        assert acquired
+        assert profiler.is_busy
+        with profiler.acquire() as acquired_again:
+            assert not acquired_again
+        # refused attempts don't release the running profile
+        assert profiler.is_busy
+    assert not profiler.is_busy
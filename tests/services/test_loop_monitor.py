@@ -0,0 +1,29 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from drawbridge_backend.services.loop_monitor import LoopMonitor, loop_blocks
+
+
+def _block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+@pytest.mark.anyio
+async def test_blocking_code_is_logged(caplog: pytest.LogCaptureFixture) -> None:
+    monitor = LoopMonitor(interval=0.01, threshold=0.05)
+    blocks = loop_blocks.value
+    monitor.start()
+    with caplog.at_level(logging.WARNING):
+        await asyncio.sleep(0.05)
+        _block_the_loop(0.2)
+        await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    assert loop_blocks.value == blocks + 1
+    reports = [r.getMessage() for r in caplog.records if "Event loop blocked" in r.getMessage()]
+    assert len(reports) == 1
+    assert "_block_the_loop" in reports[0]
+    assert "test_blocking_code_is_logged" in reports[0]
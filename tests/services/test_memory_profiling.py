@@ -0,0 +1,62 @@
+import tracemalloc
+
+from drawbridge_backend.services.memory_profiling import (
+    MemoryTracker,
+    RequestMemory,
+    current_request_memory,
+    format_statistics,
+    note_table,
+)
+
+
+def _allocate() -> list[bytes]:
+    return [bytes(1024) for _ in range(1000)]
+
+
+def test_snapshot_diff() -> None:
+    tracker = MemoryTracker(stored_snapshots=2)
+    tracker.start(frames=5)
+    try:
+        base = tracker.take_snapshot()
+        allocated = _allocate()
+        snapshot = tracker.take_snapshot()
+    finally:
+        tracker.stop()
+
+    diff = tracker.get(snapshot).compare_to(tracker.get(base), "lineno")  # type: ignore[union-attr]
+    assert diff[0].size_diff >= 1000 * 1024
+    assert diff[0].traceback[0].filename == __file__
+    report = format_statistics(diff, limit=1)
+    assert f"{diff[0].count_diff:+,}" in report.splitlines()[0]
+    assert __file__ in report.splitlines()[1]
+    assert len(allocated) == 1000
+
+
+def test_request_peak() -> None:
+    tracker = MemoryTracker(stored_snapshots=1)
+    tracker.start(frames=1)
+    try:
+        traced_at_start = tracker.request_started()
+        del _allocate()[:]
+        peak = tracker.request_finished(traced_at_start)
+    finally:
+        tracker.stop()
+
+    assert peak >= 1000 * 1024
+    assert not tracemalloc.is_tracing()
+
+
+def test_note_table() -> None:
+    note_table(1)
+
+    usage = RequestMemory()
+    token = current_request_memory.set(usage)
+    try:
+        note_table(1)
+        assert usage.table == "1"
+        note_table(1)
+        assert usage.table == "1"
+        note_table(2)
+        assert usage.table == "multiple"
+    finally:
+        current_request_memory.reset(token)
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi_users.password import PasswordHelper
+
+from drawbridge_backend.services.password_hashing import PasswordHasher
+
+
+class RecordingPasswordHelper(PasswordHelper):
+    def __init__(self) -> None:
+        super().__init__()
+        self.threads: set[str] = set()
+
+    def hash(self, password: str) -> str:
+        self.threads.add(threading.current_thread().name)
+        return super().hash(password)
+
+
+@pytest.mark.anyio
+async def test_hashing_runs_off_the_event_loop() -> None:
+    password_helper = RecordingPasswordHelper()
+    threads = password_helper.threads
+    hasher = PasswordHasher(password_helper, workers=1)
+
+    hashes = await asyncio.gather(*(hasher.hash(f"password{i}") for i in range(3)))
+    assert threading.current_thread().name not in threads
+    assert hasher.stats.completed == 3
+    assert hasher.stats.queued == hasher.stats.running == 0
+    assert hasher.stats.wait_seconds > 0
+
+    verified, _ = await hasher.verify_and_update("password1", hashes[1])
+    assert verified
+
+
+@pytest.mark.anyio
+async def test_prepared_password_helper() -> None:
+    password_helper = RecordingPasswordHelper()
+    helper = PasswordHasher(password_helper, workers=1).prepared_helper()
+
+    await helper.prepare_hash("password")
+    hashed = helper.hash("password")
+    assert threading.current_thread().name not in password_helper.threads
+    await helper.prepare_verify_and_update("password", hashed)
+    assert helper.verify_and_update("password", hashed) == (True, None)
+
+    # Calls that weren't prepared, or already used, run inline.
+    assert helper.verify_and_update("wrong", hashed) == (False, None)
+    helper.hash("password")
+    assert threading.current_thread().name in password_helper.threads
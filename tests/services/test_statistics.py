@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from drawbridge_backend.domain.enums import ChangeTypeEnum
+from drawbridge_backend.domain.tables.entities import RowChange, TableStatistics
+from drawbridge_backend.services.statistics import StatisticsCache
+
+
+@pytest.mark.anyio
+async def test_statistics_refresh_is_coalesced() -> None:
+    calls: list[int | None] = []
+
+    async def load(table_id: int, known_version: int | None) -> TableStatistics | None:
+        calls.append(known_version)
+        return TableStatistics(table_id, len(calls), 0, True, [])
+
+    cache = StatisticsCache(load, refresh_delay=0.01, maxsize=10, ttl=60)
+    cache.on_row_change(RowChange(1, ChangeTypeEnum.INSERT, [1]))
+    assert cache.get(1) == (None, False)
+
+    await cache.load(1)
+    for row_id in range(10):
+        cache.on_row_change(RowChange(1, ChangeTypeEnum.UPDATE, [row_id]))
+    statistics, is_stale = cache.get(1)
+    assert statistics is not None and statistics.data_version == 1
+    assert is_stale
+
+    await asyncio.sleep(0.05)
+    statistics, is_stale = cache.get(1)
+    assert statistics is not None and statistics.data_version == 2
+    assert not is_stale
+    assert calls == [None, 1]
+
+
+@pytest.mark.anyio
+async def test_statistics_cache_is_bounded() -> None:
+    async def load(table_id: int, known_version: int | None) -> TableStatistics | None:
+        return TableStatistics(table_id, 1, 0, True, [])
+
+    cache = StatisticsCache(load, refresh_delay=0.01, maxsize=1, ttl=60)
+    await cache.load(1)
+    await cache.load(2)
+    assert cache.get(1) == (None, False)
+    assert cache.get(2)[0] is not None
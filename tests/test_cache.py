@@ -0,0 +1,19 @@
+from drawbridge_backend.cache import TTLCache
+
+
+def test_ttl_cache_expiry_and_eviction() -> None:
+    now = 0.0
+    cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=10, timer=lambda: now)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    # "b" is the least recently used one now.
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    now = 10.0
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+    assert (cache.hits, cache.misses) == (1, 3)
@@ -1,8 +1,11 @@
 import pytest
 from fastapi import FastAPI
 from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from starlette import status
 
+from drawbridge_backend.db.dependencies import get_storage_db_engine, get_storage_db_session
+
 
 @pytest.mark.anyio
 async def test_health(client: AsyncClient, fastapi_app: FastAPI) -> None:
@@ -15,3 +18,111 @@ async def test_health(client: AsyncClient, fastapi_app: FastAPI) -> None:
     url = fastapi_app.url_path_for("health_check")
     response = await client.get(url)
     assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.anyio
+async def test_health_during_warm_up(client: AsyncClient, fastapi_app: FastAPI) -> None:
+    """
+    Checks that the worker isn't reported healthy before warm-up is done.
+
+    :param client: client for the app.
+    :param fastapi_app: current FastAPI application.
+    """
+    fastapi_app.state.ready = False
+    url = fastapi_app.url_path_for("health_check")
+    response = await client.get(url)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+@pytest.mark.anyio
+async def test_metrics(client: AsyncClient, fastapi_app: FastAPI) -> None:
+    """
+    Checks that requests are reported by the metrics endpoint.
+
+    :param client: client for the app.
+    :param fastapi_app: current FastAPI application.
+    """
+    await client.get(fastapi_app.url_path_for("health_check"))
+    response = await client.get(fastapi_app.url_path_for("metrics"))
+    assert response.status_code == status.HTTP_200_OK
+    assert (
+        'drawbridge_http_request_duration_seconds_count{method="GET",route="/api/health",status="200"}'
+        in response.text
+    )
+
+
+@pytest.mark.anyio
+async def test_server_timing(client: AsyncClient, fastapi_app: FastAPI) -> None:
+    """
+    Checks that responses tell where request time went.
+
+    :param client: client for the app.
+    :param fastapi_app: current FastAPI application.
+    """
+    response = await client.get(fastapi_app.url_path_for("health_check"))
+    phases = [p.split(";")[0] for p in response.headers["Server-Timing"].split(", ")]
+    assert phases == ["db", "validation", "endpoint", "serialization", "total"]
+
+
+@pytest.mark.anyio
+async def test_profiling_requires_superuser(client: AsyncClient, fastapi_app: FastAPI) -> None:
+    """
+    Checks that anonymous requests can neither profile nor read profiles.
+
+    :param client: client for the app.
+    :param fastapi_app: current FastAPI application.
+    """
+    response = await client.post(fastapi_app.url_path_for("profile_worker"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    # The header is ignored without a superuser's token.
+    response = await client.get(
+        fastapi_app.url_path_for("health_check"),
+        headers={"X-Profile": "sample"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert "X-Profile-Id" not in response.headers
+
+
+@pytest.mark.anyio
+async def test_request_id(client: AsyncClient, fastapi_app: FastAPI) -> None:
+    """
+    Checks that responses carry the request id given by a proxy or a new one.
+
+    :param client: client for the app.
+    :param fastapi_app: current FastAPI application.
+    """
+    url = fastapi_app.url_path_for("health_check")
+    response = await client.get(url, headers={"X-Request-ID": "abc"})
+    assert response.headers["X-Request-ID"] == "abc"
+    response = await client.get(url)
+    assert len(response.headers["X-Request-ID"]) == 32
+
+
+@pytest.mark.anyio
+async def test_create_table_with_invalid_partitioning(
+    client: AsyncClient,
+    fastapi_app: FastAPI,
+    storage_engine: AsyncEngine,
+    storage_dbsession: AsyncSession,
+) -> None:
+    """
+    Checks that tables which can't be partitioned as requested are rejected.
+
+    :param client: client for the app.
+    :param fastapi_app: current FastAPI application.
+    :param storage_engine: engine of the storage database.
+    :param storage_dbsession: session of the storage database.
+    """
+    fastapi_app.dependency_overrides[get_storage_db_engine] = lambda: storage_engine
+    fastapi_app.dependency_overrides[get_storage_db_session] = lambda: storage_dbsession
+    response = await client.post(
+        fastapi_app.url_path_for("create_table"),
+        json={
+            "name": "events",
+            "fields": [],
+            "partitioning": {"field_name": "created_at"},
+        },
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "created_at" in response.json()["detail"]
@@ -0,0 +1,80 @@
+import io
+import json
+import logging
+import threading
+from typing import Any
+
+from drawbridge_backend.log import (
+    AccessLogSampler,
+    InterceptHandler,
+    LogWriter,
+    QueueLogWriter,
+    dropped_records,
+    format_json,
+    request_id,
+)
+
+
+def _access_record(status: int) -> logging.LogRecord:
+    return logging.LogRecord(
+        "uvicorn.access",
+        logging.INFO,
+        __file__,
+        1,
+        '%s - "%s %s HTTP/%s" %d',
+        ("127.0.0.1:1", "GET", "/api/health", "1.1", status),
+        None,
+    )
+
+
+def test_access_log_sampling() -> None:
+    sampler = AccessLogSampler(rate=0)
+    assert not sampler.filter(_access_record(200))
+    assert sampler.filter(_access_record(500))
+    assert AccessLogSampler(rate=1).filter(_access_record(200))
+
+
+def test_json_logs_carry_request_id_and_caller() -> None:
+    stream = io.StringIO()
+    stdlib_logger = logging.getLogger("test_log")
+    stdlib_logger.addHandler(InterceptHandler(LogWriter(stream, format_json)))
+    stdlib_logger.propagate = False
+    token = request_id.set("abc")
+    try:
+        stdlib_logger.warning("hello %s", "world")
+    finally:
+        request_id.reset(token)
+        stdlib_logger.handlers.clear()
+
+    entry = json.loads(stream.getvalue())
+    assert entry["message"] == "hello world"
+    assert entry["level"] == "WARNING"
+    assert entry["logger"] == "test_log"
+    assert entry["request_id"] == "abc"
+    assert entry["function"] == "test_json_logs_carry_request_id_and_caller"
+
+
+class BlockingStream(io.StringIO):
+    def __init__(self) -> None:
+        super().__init__()
+        self.unblocked = threading.Event()
+
+    def write(self, s: Any) -> int:
+        self.unblocked.wait()
+        return super().write(s)
+
+
+def test_queue_writer_drops_when_full() -> None:
+    stream = BlockingStream()
+    writer = QueueLogWriter(stream, lambda record: f"{record.msg}\n", maxsize=1)
+    dropped = dropped_records.value
+    for i in range(10):
+        writer.write(logging.makeLogRecord({"msg": f"record {i}"}))
+    stream.unblocked.set()
+    writer.stop()
+
+    written = stream.getvalue().splitlines()
+    # The writer holds one record, the queue another, the rest is dropped.
+    assert 1 <= len(written) <= 2
+    assert written[0] == "record 0"
+    assert dropped_records.value == dropped + 10 - len(written)
@@ -0,0 +1,33 @@
+from drawbridge_backend.db.metrics import get_operation
+from drawbridge_backend.metrics import Registry
+
+
+def test_render() -> None:
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ["path"])
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    requests.labels('/a"b').inc()
+    requests.labels('/a"b').inc(2)
+    for value in (0.05, 0.5, 0.5, 5):
+        latency.labels().observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{path="/a\\"b"} 3',
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 6.05",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_get_operation() -> None:
+    assert get_operation("SELECT t.id FROM t") == "fetch"
+    assert get_operation("SELECT count(*) AS count_1 FROM t") == "count"
+    assert get_operation("\nINSERT INTO t (a) VALUES ($1)") == "insert"
+    assert get_operation('ALTER TABLE "t" ADD COLUMN a INTEGER') == "ddl"
+    assert get_operation("SAVEPOINT sa_savepoint_1") == "other"
@@ -0,0 +1,74 @@
+import pytest
+
+from drawbridge_backend.tracing import (
+    Span,
+    Tracer,
+    format_traceparent,
+    parse_traceparent,
+    traced,
+    tracer,
+)
+
+TRACEPARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+class ListExporter:
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+
+    def export(self, spans: list[Span]) -> None:
+        self.spans.extend(spans)
+
+    def shutdown(self) -> None:
+        pass
+
+
+def test_parse_traceparent() -> None:
+    assert parse_traceparent(TRACEPARENT) == (
+        "0af7651916cd43dd8448eb211c80319c",
+        "b7ad6b7169203331",
+        True,
+    )
+    assert parse_traceparent(TRACEPARENT[:-1] + "0")[2] is False  # type: ignore[index]
+    assert parse_traceparent("00-" + "0" * 32 + "-b7ad6b7169203331-01") is None
+    assert parse_traceparent("garbage") is None
+
+
+def test_sampling() -> None:
+    exporter = ListExporter()
+    local_tracer = Tracer()
+    local_tracer.configure(exporter, sample_rate=0)
+    with local_tracer.start_trace("not sampled") as span:
+        assert span is None
+        assert not local_tracer.is_recording
+    with local_tracer.start_trace("sampled by parent", TRACEPARENT) as span:
+        assert span is not None
+    local_tracer.shutdown()
+
+    assert [s.name for s in exporter.spans] == ["sampled by parent"]
+
+
+@pytest.mark.anyio
+async def test_spans_are_nested() -> None:
+    exporter = ListExporter()
+    tracer.configure(exporter, sample_rate=1)
+
+    @traced
+    async def load() -> None:
+        with tracer.start_span("inner", rows=3):
+            pass
+
+    try:
+        with tracer.start_trace("request", TRACEPARENT) as root:
+            assert root is not None
+            await load()
+    finally:
+        tracer.shutdown()
+
+    spans = {s.name: s for s in exporter.spans}
+    assert spans["request"].parent_id == "b7ad6b7169203331"
+    assert spans["test_spans_are_nested.<locals>.load"].parent_id == root.span_id
+    assert spans["inner"].parent_id == spans["test_spans_are_nested.<locals>.load"].span_id
+    assert spans["inner"].attributes == {"rows": 3}
+    assert {s.trace_id for s in exporter.spans} == {"0af7651916cd43dd8448eb211c80319c"}
+    assert format_traceparent(root).startswith("00-0af7651916cd43dd8448eb211c80319c-")